@@ -0,0 +1,90 @@
+from Crypto.Cipher import AES
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # pragma: no cover - cryptography is optional
+    AESGCM = None
+
+TAG_SIZE = 16
+
+
+class EAXBackend:
+    """PyCryptodome AES-EAX, the original (and always available) cipher."""
+    id = 0
+    name = 'eax'
+
+    @staticmethod
+    def available():
+        return True
+
+    def encrypt(self, key, nonce, data, aad):
+        cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
+        cipher.update(aad)
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        return ciphertext + tag
+
+    def decrypt(self, key, nonce, record, aad):
+        cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
+        cipher.update(aad)
+        return cipher.decrypt_and_verify(record[:-TAG_SIZE], record[-TAG_SIZE:])
+
+
+class AESGCMBackend:
+    """OpenSSL AES-GCM through ``cryptography``; uses AES-NI/CLMUL where the CPU has them."""
+    id = 1
+    name = 'aesgcm'
+
+    @staticmethod
+    def available():
+        return AESGCM is not None
+
+    def encrypt(self, key, nonce, data, aad):
+        return AESGCM(key).encrypt(nonce, data, aad)
+
+    def decrypt(self, key, nonce, record, aad):
+        try:
+            return AESGCM(key).decrypt(nonce, record, aad)
+        except InvalidTag:
+            # Same failure type as PyCryptodome so callers need not care which backend ran
+            raise ValueError("MAC check failed")
+
+
+BACKENDS = {backend.id: backend() for backend in (EAXBackend, AESGCMBackend)}
+# Fastest first
+PREFERENCE = (AESGCMBackend.id, EAXBackend.id)
+
+_default = 'auto'
+
+
+def available_backends():
+    return [backend for backend in BACKENDS.values() if backend.available()]
+
+
+def get_backend(backend):
+    """Looks a backend up by id or name; 'auto' (or None) picks the configured default."""
+    if backend is None or backend == 'auto':
+        return default_backend()
+    if isinstance(backend, int):
+        found = BACKENDS.get(backend)
+    else:
+        found = next((candidate for candidate in BACKENDS.values() if candidate.name == backend), None)
+    if found is None:
+        raise ValueError(f"Unknown cipher backend {backend!r}")
+    if not found.available():
+        raise ValueError(f"Cipher backend {found.name!r} is not available on this host")
+    return found
+
+
+def default_backend():
+    if _default != 'auto':
+        return get_backend(_default)
+    return next(BACKENDS[backend_id] for backend_id in PREFERENCE if BACKENDS[backend_id].available())
+
+
+def configure(backend):
+    """Sets the backend new files are written with, e.g. from the CRYPTO_BACKEND setting."""
+    global _default
+    if backend != 'auto':
+        get_backend(backend)
+    _default = backend
@@ -0,0 +1,171 @@
+import datetime
+import itertools
+import os
+import platform
+import re
+import resource
+import shutil
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from Crypto.PublicKey import RSA
+
+from Cryptography import Backends, Container
+from Cryptography.Encryption import AsyncDecrypt, AsyncEncrypt, SyncDecrypt, SyncEncrypt
+
+SIZE_PATTERN = re.compile(r"^(\d+)\s*([KMG]i?B?)?$", re.IGNORECASE)
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+DEFAULT_SIZES = ("4KiB", "1MiB", "64MiB", "1GiB")
+DEFAULT_SEGMENT_SIZES = ("64KiB", "256KiB", "1MiB")
+FORMATS = ("segmented", "legacy")
+
+
+def parse_size(text):
+    match = SIZE_PATTERN.match(str(text).strip())
+    if match is None:
+        raise ValueError(f"Invalid size {text!r}")
+    number, unit = match.groups()
+    return int(number) * UNITS[(unit or '')[:1].upper()]
+
+
+def peak_rss():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if platform.system() == 'Darwin' else rss * 1024
+
+
+def write_sample(path, size, compressible=False):
+    # Random data so that nothing downstream can take shortcuts on repeated bytes,
+    # or CSV-like text when measuring compression
+    if compressible:
+        rows = b"".join(b"%d,MSKU%07d,Chennai,Singapore,Fragile,%d\n" % (i, i * 7919 % 10 ** 7, i % 97)
+                        for i in range(20000))
+        block = (rows * (1024 * 1024 // len(rows) + 1))[:min(size, 1024 * 1024)]
+    else:
+        block = os.urandom(min(size, 1024 * 1024))
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+def _file_case(fmt, size, segment_size, workers, backend, codec):
+    # Runs in a fresh process so that peak RSS belongs to this case only
+    workdir = tempfile.mkdtemp(prefix='cryptobench')
+    try:
+        source = os.path.join(workdir, 'sample.bin')
+        write_sample(source, size, compressible=codec != 'none')
+        key = SyncEncrypt().generateKey()
+
+        started = time.perf_counter()
+        if fmt == 'legacy':
+            encrypted = SyncEncrypt().encrypt_legacy(source, key)
+        else:
+            encrypted = SyncEncrypt().encrypt(source, key, segment_size=segment_size, workers=workers,
+                                              backend=backend, codec=codec)
+        encrypt_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with open(os.devnull, 'wb') as sink:
+            SyncDecrypt().decrypt_to(encrypted, key, sink, chunk_size=segment_size, workers=workers)
+        decrypt_seconds = time.perf_counter() - started
+
+        return {
+            'encrypt_seconds': encrypt_seconds,
+            'decrypt_seconds': decrypt_seconds,
+            'ciphertext_bytes': os.path.getsize(encrypted),
+            'peak_rss_bytes': peak_rss(),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_file(fmt, size, segment_size, workers=1, backend='eax', codec='none'):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        measured = pool.submit(_file_case, fmt, size, segment_size, workers, backend, codec).result()
+
+    mib = size / 1024 ** 2
+    return {
+        'kind': 'file',
+        'format': fmt,
+        'backend': 'eax' if fmt == 'legacy' else backend,
+        'codec': 'none' if fmt == 'legacy' else codec,
+        'size_bytes': size,
+        'segment_size_bytes': segment_size,
+        'workers': workers,
+        'encrypt_mb_s': mib / measured['encrypt_seconds'] if measured['encrypt_seconds'] else None,
+        'decrypt_mb_s': mib / measured['decrypt_seconds'] if measured['decrypt_seconds'] else None,
+        **measured,
+    }
+
+
+def bench_rsa(bits=2048, operations=50):
+    private_key = RSA.generate(bits)
+    user = _KeyHolder(private_key.publickey().export_key().decode())
+    aes_key = SyncEncrypt().generateKey()
+
+    started = time.perf_counter()
+    wrapped = [AsyncEncrypt().encrypt_key(user, aes_key) for _ in range(operations)]
+    wrap_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for blob in wrapped:
+        AsyncDecrypt().decrypt_key(private_key, blob)
+    unwrap_seconds = time.perf_counter() - started
+
+    return {
+        'kind': 'rsa',
+        'bits': bits,
+        'operations': operations,
+        'wrap_ops_s': operations / wrap_seconds,
+        'unwrap_ops_s': operations / unwrap_seconds,
+    }
+
+
+class _KeyHolder:
+    pk = 'benchmark'
+
+    def __init__(self, pubKey):
+        self.pubKey = pubKey
+
+
+def run(sizes=DEFAULT_SIZES, segment_sizes=DEFAULT_SEGMENT_SIZES, formats=FORMATS, workers=(1,), backends=None,
+        codecs=('none',), rsa_bits=2048, rsa_operations=50, progress=None):
+    """Runs the whole matrix and returns a JSON-serialisable report."""
+    backends = backends or [backend.name for backend in Backends.available_backends()]
+    results = []
+    for fmt, backend, codec, size, segment_size, worker_count in itertools.product(
+            formats, backends, codecs, sizes, segment_sizes, workers):
+        if fmt == 'legacy' and (backend, codec, segment_size, worker_count) != (
+                backends[0], codecs[0], segment_sizes[0], workers[0]):
+            # The legacy stream has a fixed cipher, no compression, no segments and no parallelism
+            continue
+        result = bench_file(fmt, parse_size(size), parse_size(segment_size), worker_count, backend, codec)
+        results.append(result)
+        if progress:
+            progress(result)
+
+    if rsa_operations:
+        result = bench_rsa(rsa_bits, rsa_operations)
+        results.append(result)
+        if progress:
+            progress(result)
+
+    return {'meta': environment(), 'results': results}
+
+
+def environment():
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'container_version': Container.VERSION,
+    }
@@ -0,0 +1,137 @@
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+# Segments of a compressed container carry one marker byte in front of the
+# (encrypted) payload telling whether that segment was actually compressed
+RAW = b"\x00"
+COMPRESSED = b"\x01"
+
+SAMPLE_SIZE = 4096
+# Compress only when the sample shrinks below this fraction of its size
+SAMPLE_RATIO = 0.9
+
+
+class NoCodec:
+    id = 0
+    name = 'none'
+
+    @staticmethod
+    def available():
+        return True
+
+
+class ZlibCodec:
+    id = 1
+    name = 'zlib'
+    level = 6
+
+    @staticmethod
+    def available():
+        return True
+
+    def compress(self, data, level=None):
+        return zlib.compress(data, self.level if level is None else level)
+
+    def decompress(self, data, limit):
+        decompressor = zlib.decompressobj()
+        plaintext = decompressor.decompress(data, limit)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError("Compressed segment is larger than its segment size")
+        return plaintext
+
+
+class LzmaCodec:
+    id = 2
+    name = 'lzma'
+    level = 6
+
+    @staticmethod
+    def available():
+        return True
+
+    def compress(self, data, level=None):
+        return lzma.compress(data, preset=self.level if level is None else level)
+
+    def decompress(self, data, limit):
+        decompressor = lzma.LZMADecompressor()
+        plaintext = decompressor.decompress(data, limit)
+        if not decompressor.eof:
+            raise ValueError("Compressed segment is larger than its segment size")
+        return plaintext
+
+
+class ZstdCodec:
+    id = 3
+    name = 'zstd'
+    level = 3
+
+    @staticmethod
+    def available():
+        return zstandard is not None
+
+    def compress(self, data, level=None):
+        return zstandard.ZstdCompressor(level=self.level if level is None else level).compress(data)
+
+    def decompress(self, data, limit):
+        try:
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=limit)
+        except zstandard.ZstdError as e:
+            raise ValueError(str(e))
+
+
+CODECS = {codec.id: codec() for codec in (NoCodec, ZlibCodec, LzmaCodec, ZstdCodec)}
+
+_default = 'none'
+
+
+def get_codec(codec):
+    if codec is None:
+        codec = _default
+    if isinstance(codec, int):
+        found = CODECS.get(codec)
+    else:
+        found = next((candidate for candidate in CODECS.values() if candidate.name == codec), None)
+    if found is None:
+        raise ValueError(f"Unknown compression codec {codec!r}")
+    if not found.available():
+        raise ValueError(f"Compression codec {found.name!r} is not available on this host")
+    return found
+
+
+def configure(codec):
+    """Sets the codec new files are written with, e.g. from the DOCUMENT_COMPRESSION setting."""
+    global _default
+    get_codec(codec)
+    _default = codec
+
+
+def worth_compressing(codec, data):
+    # Compressing a small sample at the fastest level is cheap and tells
+    # already-compressed content (JPEG scans, zipped archives) apart
+    sample = data[:SAMPLE_SIZE]
+    if not sample:
+        return False
+    return len(codec.compress(sample, level=1)) < len(sample) * SAMPLE_RATIO
+
+
+def pack(codec_id, data):
+    codec = CODECS[codec_id]
+    if worth_compressing(codec, data):
+        compressed = codec.compress(data)
+        if len(compressed) < len(data):
+            return COMPRESSED + compressed
+    return RAW + data
+
+
+def unpack(codec_id, payload, limit):
+    marker, data = payload[:1], payload[1:]
+    if marker == RAW:
+        return data
+    if marker == COMPRESSED:
+        return get_codec(codec_id).decompress(data, limit)
+    raise ValueError("Invalid segment marker")
@@ -0,0 +1,390 @@
+import os
+import struct
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from Cryptography import Backends, Codecs
+
+# Segmented container layout (version 1):
+#
+#   header  | segment 0 | segment 1 | ... | segment n-1
+#
+# Every segment is ``segment_size`` bytes of plaintext (the last one may be
+# shorter) encrypted on its own and followed by its 16-byte tag. The nonce of
+# segment i is ``base_nonce || i`` and the associated data binds the segment to
+# the header, its index and whether it is the final segment, so segments
+# cannot be swapped, reordered or dropped from the end without detection.
+# ``segment_count`` and ``plaintext_size`` are patched in once the writer is
+# closed and are not authenticated: readers cross-check the count against the
+# final flag and the size against the length of every decrypted segment (which
+# the record size alone does not pin down once segments are compressed).
+# ``backend`` records which cipher (see Backends.py) sealed the segments.
+#
+# With a compression ``codec`` (see Codecs.py) each segment is compressed before
+# encryption, so records vary in size. Such containers set FLAG_INDEXED and end
+# with an index of every record's offset (one big-endian u64 per segment),
+# which keeps reading segment i a constant-time seek.
+
+MAGIC = b"RSFC"
+VERSION = 1
+
+HEADER_FORMAT = ">4sBBBBI8sQQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# magic, version, backend, codec, flags, segment size and base nonce
+HEADER_AAD_SIZE = 20
+COUNTS_FORMAT = ">QQ"
+
+BASE_NONCE_SIZE = 8
+TAG_SIZE = 16
+DEFAULT_SEGMENT_SIZE = 256 * 1024
+
+BACKEND_EAX = Backends.EAXBackend.id
+CODEC_NONE = Codecs.NoCodec.id
+
+FLAG_INDEXED = 0x01
+INDEX_ENTRY_SIZE = 8
+
+
+def is_container(prefix):
+    return prefix[:len(MAGIC)] == MAGIC
+
+
+def segment_nonce(base_nonce, index):
+    return base_nonce + struct.pack(">I", index)
+
+
+def segment_aad(header_aad, index, final):
+    return header_aad + struct.pack(">IB", index, int(final))
+
+
+def encrypt_segment(header, key, index, final, data):
+    if header.codec != CODEC_NONE:
+        data = Codecs.pack(header.codec, data)
+    return Backends.get_backend(header.backend).encrypt(key, segment_nonce(header.base_nonce, index), data,
+                                                        segment_aad(header.aad, index, final))
+
+
+def _open_segment(header, key, index, final, record):
+    if len(record) < TAG_SIZE:
+        raise ValueError("Encrypted file is truncated")
+    return Backends.get_backend(header.backend).decrypt(key, segment_nonce(header.base_nonce, index), record,
+                                                        segment_aad(header.aad, index, final))
+
+
+def _unpack_segment(header, index, final, data):
+    if header.codec != CODEC_NONE:
+        data = Codecs.unpack(header.codec, data, header.segment_size)
+    expected = header.plaintext_size - index * header.segment_size if final else header.segment_size
+    if len(data) != expected:
+        raise ValueError("Segment length does not match the header")
+    return data
+
+
+def decrypt_segment(header, key, index, final, record):
+    return _unpack_segment(header, index, final, _open_segment(header, key, index, final, record))
+
+
+def reseal_segment(header, new_header, key, index, final, record):
+    """
+    Moves a record sealed under ``header`` to ``new_header`` (the same
+    container but for its base nonce) without compressing it again; returns
+    the plaintext and the new record.
+    """
+    data = _open_segment(header, key, index, final, record)
+    new_record = Backends.get_backend(new_header.backend).encrypt(
+        key, segment_nonce(new_header.base_nonce, index), data, segment_aad(new_header.aad, index, final))
+    return _unpack_segment(header, index, final, data), new_record
+
+
+class Header:
+
+    def __init__(self, segment_size=DEFAULT_SEGMENT_SIZE, base_nonce=None, backend=BACKEND_EAX, codec=CODEC_NONE,
+                 flags=0, segment_count=0, plaintext_size=0, version=VERSION):
+        self.version = version
+        self.backend = backend
+        self.codec = codec
+        self.flags = flags
+        self.segment_size = segment_size
+        self.base_nonce = base_nonce if base_nonce is not None else os.urandom(BASE_NONCE_SIZE)
+        self.segment_count = segment_count
+        self.plaintext_size = plaintext_size
+
+    def pack(self):
+        return struct.pack(HEADER_FORMAT, MAGIC, self.version, self.backend, self.codec, self.flags,
+                           self.segment_size, self.base_nonce, self.segment_count, self.plaintext_size)
+
+    @property
+    def aad(self):
+        return self.pack()[:HEADER_AAD_SIZE]
+
+    @classmethod
+    def read(cls, infile):
+        data = infile.read(HEADER_SIZE)
+        if len(data) != HEADER_SIZE:
+            raise ValueError("Encrypted file is truncated")
+        magic, version, backend, codec, flags, segment_size, base_nonce, count, size = struct.unpack(
+            HEADER_FORMAT, data)
+        if magic != MAGIC:
+            raise ValueError("Not a segmented container")
+        if version != VERSION:
+            raise ValueError(f"Unsupported container version {version}")
+        if segment_size == 0:
+            raise ValueError("Invalid segment size")
+        return cls(segment_size, base_nonce, backend, codec, flags, count, size, version)
+
+    def with_nonce(self, base_nonce=None):
+        """A copy of the header with a new (random by default) base nonce."""
+        return Header(self.segment_size, base_nonce, self.backend, self.codec, self.flags, self.segment_count,
+                      self.plaintext_size, self.version)
+
+    @property
+    def indexed(self):
+        return bool(self.flags & FLAG_INDEXED)
+
+    def record_size(self, index):
+        if index == self.segment_count - 1:
+            return self.plaintext_size - index * self.segment_size + TAG_SIZE
+        return self.segment_size + TAG_SIZE
+
+    def record_offset(self, index):
+        return HEADER_SIZE + index * (self.segment_size + TAG_SIZE)
+
+
+class _Pipeline:
+    """Runs segment jobs on an executor while keeping results in submission order."""
+
+    def __init__(self, workers, executor=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self.owns_executor = False
+        self.pending = deque()
+
+    def submit(self, fn, *args):
+        if self.workers == 1 and self.executor is None:
+            self.pending.append(_Done(fn(*args)))
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+            self.owns_executor = True
+        self.pending.append(self.executor.submit(fn, *args))
+
+    def full(self):
+        return len(self.pending) >= 2 * self.workers
+
+    def pop(self):
+        return self.pending.popleft().result()
+
+    def drain(self):
+        while self.pending:
+            yield self.pop()
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        if self.owns_executor:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class _Done:
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+    def cancel(self):
+        pass
+
+
+class SegmentWriter:
+    """
+    File-like writer producing a segmented container on a seekable ``outfile``.
+
+    Segments are encrypted on ``workers`` threads (or the given executor, which
+    may also be a process pool) with at most two segments per worker in flight.
+    """
+
+    def __init__(self, outfile, key, segment_size=DEFAULT_SEGMENT_SIZE, workers=None, executor=None, backend=None,
+                 codec=None):
+        self.outfile = outfile
+        self.key = key
+        codec = Codecs.get_codec(codec).id
+        self.header = Header(segment_size=segment_size, backend=Backends.get_backend(backend).id, codec=codec,
+                             flags=FLAG_INDEXED if codec != CODEC_NONE else 0)
+        self.pipeline = _Pipeline(workers, executor)
+        self.offsets = []
+        self.buffer = bytearray()
+        self.index = 0
+        self.size = 0
+        self.closed = False
+
+        self.start = outfile.tell()
+        outfile.write(self.header.pack())
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        segment_size = self.header.segment_size
+        # A full segment is only known not to be the last one once more data arrives
+        while len(self.buffer) > segment_size:
+            self._submit(bytes(self.buffer[:segment_size]), final=False)
+            del self.buffer[:segment_size]
+        return len(data)
+
+    def _submit(self, data, final):
+        self.pipeline.submit(encrypt_segment, self.header, self.key, self.index, final, data)
+        self.index += 1
+        while self.pipeline.full():
+            self._write_record(self.pipeline.pop())
+
+    def _write_record(self, record):
+        if self.header.indexed:
+            self.offsets.append(self.outfile.tell() - self.start)
+        self.outfile.write(record)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._submit(bytes(self.buffer), final=True)
+            self.buffer = bytearray()
+            for record in self.pipeline.drain():
+                self._write_record(record)
+        finally:
+            self.pipeline.close()
+
+        if self.header.indexed:
+            self.outfile.write(struct.pack(f">{len(self.offsets)}Q", *self.offsets))
+
+        self.header.segment_count = self.index
+        self.header.plaintext_size = self.size
+        end = self.outfile.tell()
+        self.outfile.seek(self.start + HEADER_AAD_SIZE)
+        self.outfile.write(struct.pack(COUNTS_FORMAT, self.header.segment_count, self.header.plaintext_size))
+        self.outfile.seek(end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pipeline.close()
+
+
+class SegmentReader:
+
+    def __init__(self, infile, key, workers=1, executor=None):
+        self.infile = infile
+        self.key = key
+        self.workers = workers
+        self.executor = executor
+        self.start = infile.tell()
+        self.header = Header.read(infile)
+
+        header = self.header
+        Backends.get_backend(header.backend)
+        if header.segment_count == 0:
+            raise ValueError("Encrypted file was not closed properly")
+        last = header.plaintext_size - (header.segment_count - 1) * header.segment_size
+        if not 0 <= last <= header.segment_size:
+            raise ValueError("Inconsistent segment count")
+        Codecs.get_codec(header.codec)
+
+        if header.indexed:
+            end = infile.seek(0, os.SEEK_END) - self.start
+            self.index_start = end - header.segment_count * INDEX_ENTRY_SIZE
+            if self.index_start < HEADER_SIZE:
+                raise ValueError("Encrypted file is truncated")
+
+    @property
+    def plaintext_size(self):
+        return self.header.plaintext_size
+
+    def record_bounds(self, index):
+        header = self.header
+        if not header.indexed:
+            offset = header.record_offset(index)
+            return offset, offset + header.record_size(index)
+
+        self.infile.seek(self.start + self.index_start + index * INDEX_ENTRY_SIZE)
+        if index == header.segment_count - 1:
+            (offset,) = struct.unpack(">Q", self.infile.read(INDEX_ENTRY_SIZE))
+            end = self.index_start
+        else:
+            offset, end = struct.unpack(">QQ", self.infile.read(2 * INDEX_ENTRY_SIZE))
+        # The index is not authenticated, but a wrong offset can only make decryption fail
+        if not HEADER_SIZE <= offset <= end - TAG_SIZE or end > self.index_start:
+            raise ValueError("Corrupt segment index")
+        return offset, end
+
+    def read_record(self, index, buffer=None):
+        """
+        The encrypted record of segment ``index``; read into ``buffer`` (and
+        returned as a view of it) when it fits, so that no bytes object is
+        allocated per record.
+        """
+        offset, end = self.record_bounds(index)
+        size = end - offset
+        self.infile.seek(self.start + offset)
+        if buffer is None or size > len(buffer):
+            record = self.infile.read(size)
+        else:
+            record = memoryview(buffer)[:size]
+            filled = 0
+            while filled < size:
+                read = self.infile.readinto(record[filled:])
+                if not read:
+                    break
+                filled += read
+            record = record[:filled]
+        if len(record) != size:
+            raise ValueError("Encrypted file is truncated")
+        return record
+
+    def segment(self, index, buffer=None):
+        header = self.header
+        final = index == header.segment_count - 1
+        return decrypt_segment(header, self.key, index, final, self.read_record(index, buffer))
+
+    def segments(self, first=0, last=None, buffer=None):
+        header = self.header
+        last = header.segment_count - 1 if last is None else last
+        pipeline = _Pipeline(self.workers, self.executor)
+        # A record read into ``buffer`` has to be decrypted before the next read overwrites it
+        if pipeline.workers != 1 or self.executor is not None:
+            buffer = None
+        try:
+            for index in range(first, last + 1):
+                final = index == header.segment_count - 1
+                pipeline.submit(decrypt_segment, header, self.key, index, final, self.read_record(index, buffer))
+                while pipeline.full():
+                    yield pipeline.pop()
+            yield from pipeline.drain()
+        finally:
+            pipeline.close()
+
+    def read_range(self, start, end, buffer=None):
+        """
+        Yields the plaintext bytes ``[start, end)``, decrypting only the
+        segments covering them; records are read into ``buffer`` when given.
+        """
+        end = min(end, self.plaintext_size)
+        if start >= end:
+            return
+
+        segment_size = self.header.segment_size
+        first, last = start // segment_size, (end - 1) // segment_size
+        offset = start - first * segment_size
+        remaining = end - start
+        for plaintext in self.segments(first, last, buffer):
+            chunk = plaintext[offset:offset + remaining]
+            offset = 0
+            remaining -= len(chunk)
+            yield chunk
@@ -1,25 +1,54 @@
 import os
+import threading
 
+from collections import OrderedDict
 from random import Random
 
-from Crypto.Cipher import AES
+from Crypto.Cipher import AES, PKCS1_OAEP
 from Crypto.PublicKey import RSA
 from Crypto.Random import get_random_bytes
 from cryptography.hazmat.primitives.asymmetric import padding,utils
 from cryptography.hazmat.primitives.ciphers import algorithms
 
+from Cryptography import Container
+
+CHUNK_SIZE = 64 * 1024
+SIZE_FIELD = 16
+NONCE_SIZE = 16
+TAG_SIZE = 16
+HEADER_SIZE = SIZE_FIELD + NONCE_SIZE
+
 
 class SyncEncrypt:
     AES_BlockSize = 128
+    AES_KeySize = 32
 
     def generateKey(self):
-        return os.urandom(self.AES_BlockSize)
+        return os.urandom(self.AES_KeySize)
+
+    def encrypt(self,filename,key,segment_size=Container.DEFAULT_SEGMENT_SIZE,workers=None,backend=None,codec=None):
+        output_filename = filename + ".encrypted"
+
+        with open(filename, 'rb') as infile:
+            with open(output_filename, 'wb') as outfile:
+                with Container.SegmentWriter(outfile, key, segment_size, workers, backend=backend,
+                                             codec=codec) as writer:
+                    while True:
+                        chunk = infile.read(segment_size)
 
-    def encrypt(self,filename,key):
-        chunk_size = 64 * 1024
+                        if len(chunk) == 0:
+                            break
+
+                        writer.write(chunk)
+
+        return output_filename
+
+    def encrypt_legacy(self,filename,key):
+        # Single EAX stream: "<16 digit size><nonce><ciphertext><tag>"
+        chunk_size = CHUNK_SIZE
         output_filename = filename + ".encrypted"
-        filesize = str(os.path.getsize(filename)).zfill(16)
-        nonce = get_random_bytes(16)
+        filesize = str(os.path.getsize(filename)).zfill(SIZE_FIELD)
+        nonce = get_random_bytes(NONCE_SIZE)
 
         cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
 
@@ -34,43 +63,160 @@ class SyncEncrypt:
                     if len(chunk) == 0:
                         break
 
-                    ciphertext, tag = cipher.encrypt_and_digest(chunk, AES.block_size)
-                    outfile.write(ciphertext)
+                    outfile.write(cipher.encrypt(chunk))
+
+                # The tag authenticates the whole stream, so it trails the ciphertext
+                outfile.write(cipher.digest())
 
         return output_filename
 
 
+class PublicKeyCache:
+    """
+    Bounded LRU of parsed RSA public keys, keyed by user.
+
+    An entry is only reused while the user's PEM is unchanged, so a new key
+    is picked up on the next lookup without explicit invalidation.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user):
+        pem = user.pubKey
+        if not pem:
+            raise ValueError(f"User {user.pk} has no public key")
+
+        with self.lock:
+            entry = self.entries.get(user.pk)
+            if entry is not None and entry[0] == pem:
+                self.entries.move_to_end(user.pk)
+                return entry[1]
+
+        public_key = RSA.importKey(pem)
+        with self.lock:
+            self.entries[user.pk] = (pem, public_key)
+            self.entries.move_to_end(user.pk)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return public_key
+
+    def invalidate(self, user_pk=None):
+        with self.lock:
+            if user_pk is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(user_pk, None)
+
+
+public_keys = PublicKeyCache()
+
+
 class AsyncEncrypt:
 
     def encrypt_key(self,user,aes_key):
 
-        public_key = RSA.importKey(user.pubKey)
+        public_key = public_keys.get(user)
 
-        encrypted_aes_key = public_key.encrypt(aes_key,None )
+        encrypted_aes_key = PKCS1_OAEP.new(public_key).encrypt(aes_key)
 
         return encrypted_aes_key
 
+    def encrypt_key_for(self,users,aes_key):
+        # One data key wrapped for every recipient, e.g. all viewers of a shipment
+        return {user.pk: self.encrypt_key(user, aes_key) for user in users}
+
 
 class SyncDecrypt:
+    chunk_size = CHUNK_SIZE
+
+    def read_header(self, infile):
+        header = infile.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE:
+            raise ValueError("Encrypted file is truncated")
+        filesize = int(header[:SIZE_FIELD].decode('utf-8'))
+        nonce = header[SIZE_FIELD:]
+        return filesize, nonce
+
+    def decrypt_chunks(self, filename, key, chunk_size=None, workers=1):
+        """
+        Yields the plaintext of ``filename`` in chunks, holding only a bounded
+        number of chunks in memory.
+
+        Segmented containers are verified segment by segment and may be
+        decrypted on ``workers`` threads. Legacy single-stream files are read in
+        ``chunk_size`` pieces and their tag is only checked after the last
+        chunk, so a ValueError at the end of iteration means everything yielded
+        so far must be discarded by the caller.
+        """
+        with open(filename, 'rb') as infile:
+            if Container.is_container(infile.read(len(Container.MAGIC))):
+                infile.seek(0)
+                yield from Container.SegmentReader(infile, key, workers).segments()
+            else:
+                infile.seek(0)
+                yield from self.legacy_chunks(infile, key, chunk_size or self.chunk_size)
+
+    def legacy_chunks(self, infile, key, chunk_size):
+        filesize, nonce = self.read_header(infile)
+        cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
 
-    def decrypt(self, filename, key, nonce):
-        # Load the ciphertext and tag from the encrypted file
-        with open(filename, 'rb') as f:
-            ciphertext = f.read()
-            tag = f.read(16)  # 16-byte (128-bit) tag
+        remaining = filesize
+        while remaining > 0:
+            chunk = infile.read(min(chunk_size, remaining))
+            if len(chunk) == 0:
+                raise ValueError("Encrypted file is truncated")
+            remaining -= len(chunk)
+            yield cipher.decrypt(chunk)
 
-        # Decrypt the ciphertext using AES in EAX mode
-        cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
-        plaintext = cipher.decrypt_and_verify(ciphertext, tag)
+        tag = infile.read(TAG_SIZE)
+        cipher.verify(tag)
 
-        # Save the decrypted file to disk
-        with open('decrypted_file.pdf', 'wb') as f:
-            f.write(plaintext)
+    def decrypt_range(self, filename, key, start, end, workers=1):
+        """Yields the plaintext bytes ``[start, end)`` of ``filename``."""
+        with open(filename, 'rb') as infile:
+            if Container.is_container(infile.read(len(Container.MAGIC))):
+                infile.seek(0)
+                yield from Container.SegmentReader(infile, key, workers).read_range(start, end)
+                return
+
+            # Legacy files have no segment boundaries, so the prefix has to be decrypted too
+            infile.seek(0)
+            position = 0
+            for chunk in self.legacy_chunks(infile, key, self.chunk_size):
+                chunk_start, position = position, position + len(chunk)
+                if position > start and chunk_start < end:
+                    yield chunk[max(start - chunk_start, 0):end - chunk_start]
+
+    def decrypt_to(self, filename, key, sink, chunk_size=None, workers=1):
+        written = 0
+        for chunk in self.decrypt_chunks(filename, key, chunk_size, workers):
+            sink.write(chunk)
+            written += len(chunk)
+        return written
+
+    def decrypt(self, filename, key, nonce=None, output_filename='decrypted_file.pdf', workers=1):
+        # The nonce is read from the file header, the argument is kept for old callers
+        partial_filename = output_filename + ".partial"
+        try:
+            with open(partial_filename, 'wb') as f:
+                self.decrypt_to(filename, key, f, workers=workers)
+        except ValueError:
+            os.remove(partial_filename)
+            raise
+
+        # Only expose the plaintext once the tag has been verified
+        os.replace(partial_filename, output_filename)
+        return output_filename
 
 
 class AsyncDecrypt:
 
-    def decrypt_key(self, user, encrypted):
-        private_key = RSA.importKey(user.pubKey)
-        aes_key = private_key.decrypt(encrypted)
+    def decrypt_key(self, private_key, encrypted):
+        # Runs wherever the recipient's private key lives, the server only holds public keys
+        if not isinstance(private_key, RSA.RsaKey):
+            private_key = RSA.importKey(private_key)
+        aes_key = PKCS1_OAEP.new(private_key).decrypt(encrypted)
         return aes_key
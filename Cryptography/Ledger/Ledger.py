@@ -0,0 +1,180 @@
+import hashlib
+import json
+
+# Hash-chained, Merkle-sealed event log.
+#
+# Every entry hashes its predecessor's hash together with its own payload,
+# so rewriting any entry changes every hash after it. The entry hashes are
+# also the leaves of an RFC 6962/9162 Merkle tree, which gives O(log n)
+# inclusion proofs for single entries and consistency proofs showing that a
+# later tree head extends an earlier one.
+
+GENESIS = bytes(32)
+EMPTY_ROOT = hashlib.sha256(b"").digest()
+
+# Ranges up to this size are hashed from their leaves in one go
+LEAF_FETCH_SIZE = 1024
+
+
+def entry_hash(prev_hash, payload):
+    return hashlib.sha256(prev_hash + payload).digest()
+
+
+def canonical_payload(**fields):
+    return json.dumps(fields, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def leaf_hash(data):
+    return hashlib.sha256(b"\x00" + data).digest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def split_point(n):
+    # Largest power of two strictly smaller than n
+    k = 1
+    while k << 1 < n:
+        k <<= 1
+    return k
+
+
+def root_of(leaves):
+    """Merkle tree hash of a list of leaf hashes."""
+    if not leaves:
+        return EMPTY_ROOT
+    if len(leaves) == 1:
+        return leaves[0]
+    k = split_point(len(leaves))
+    return node_hash(root_of(leaves[:k]), root_of(leaves[k:]))
+
+
+def path_of(leaves, index):
+    """Inclusion proof for leaves[index] within a list of leaf hashes, leaf side first."""
+    if len(leaves) <= 1:
+        return []
+    k = split_point(len(leaves))
+    if index < k:
+        return path_of(leaves[:k], index) + [root_of(leaves[k:])]
+    return path_of(leaves[k:], index - k) + [root_of(leaves[:k])]
+
+
+class MerkleTree:
+    """
+    Merkle tree over ``size`` leaves that are fetched lazily.
+
+    ``leaves(start, end)`` returns the leaf hashes of a range. ``cached(start,
+    end)`` may return a stored hash for a subtree (e.g. a sealed batch) or
+    None; stored subtrees are never re-hashed from their leaves.
+    """
+
+    def __init__(self, size, leaves, cached=None):
+        self.size = size
+        self.leaves = leaves
+        self.cached = cached
+
+    def subtree(self, start, end):
+        n = end - start
+        if n <= 0:
+            return EMPTY_ROOT
+        if self.cached is not None:
+            stored = self.cached(start, end)
+            if stored is not None:
+                return stored
+        if n <= LEAF_FETCH_SIZE:
+            return root_of(self.leaves(start, end))
+        k = split_point(n)
+        return node_hash(self.subtree(start, start + k), self.subtree(start + k, end))
+
+    def root(self):
+        return self.subtree(0, self.size)
+
+    def inclusion_proof(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        proof = []
+        start, end = 0, self.size
+        # Walk down from the root collecting the sibling of every subtree on the path
+        while end - start > LEAF_FETCH_SIZE:
+            k = split_point(end - start)
+            if index < start + k:
+                proof.append(self.subtree(start + k, end))
+                end = start + k
+            else:
+                proof.append(self.subtree(start, start + k))
+                start = start + k
+        # The rest of the path comes from a single fetch instead of one per level
+        return path_of(self.leaves(start, end), index - start) + list(reversed(proof))
+
+    def consistency_proof(self, old_size):
+        if not 0 < old_size <= self.size:
+            raise ValueError("Old tree size must be between 1 and the current size")
+        return list(reversed(self._subproof(old_size, 0, self.size, True)))
+
+    def _subproof(self, m, start, end, complete):
+        # RFC 6962 section 2.1.2 SUBPROOF, returned leaf-side last
+        n = end - start
+        if m == n:
+            return [] if complete else [self.subtree(start, end)]
+        k = split_point(n)
+        if m <= k:
+            return [self.subtree(start + k, end)] + self._subproof(m, start, start + k, complete)
+        return [self.subtree(start, start + k)] + self._subproof(m - k, start + k, end, False)
+
+
+def verify_inclusion(leaf, index, size, proof, root):
+    """RFC 9162 section 2.1.3.2."""
+    if not 0 <= index < size:
+        return False
+    fn, sn = index, size - 1
+    r = leaf
+    for p in proof:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            r = node_hash(p, r)
+            if not fn & 1:
+                while fn & 1 == 0 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            r = node_hash(r, p)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and r == root
+
+
+def verify_consistency(old_size, new_size, old_root, new_root, proof):
+    """RFC 9162 section 2.1.4.2."""
+    if old_size == new_size:
+        return old_root == new_root and not proof
+    if not 0 < old_size < new_size:
+        return False
+    proof = list(proof)
+    if old_size & (old_size - 1) == 0:
+        # A power of two: the old root is itself a node of the new tree
+        proof = [old_root] + proof
+    if not proof:
+        return False
+
+    fn, sn = old_size - 1, new_size - 1
+    while fn & 1:
+        fn >>= 1
+        sn >>= 1
+    fr = sr = proof[0]
+    for c in proof[1:]:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            fr = node_hash(c, fr)
+            sr = node_hash(c, sr)
+            if not fn & 1:
+                while fn & 1 == 0 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            sr = node_hash(sr, c)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and fr == old_root and sr == new_root
@@ -0,0 +1,75 @@
+# pytest-benchmark suite, run explicitly with
+#   pytest Cryptography/benchmarks.py --benchmark-json=crypto.json
+# (the Django test runner only collects test*.py, so this is never part of a normal test run)
+import os
+
+import pytest
+
+from Crypto.PublicKey import RSA
+
+from Cryptography import Backends, Benchmark
+from Cryptography.Encryption import AsyncDecrypt, AsyncEncrypt, SyncDecrypt, SyncEncrypt
+
+pytest.importorskip('pytest_benchmark')
+
+SIZES = [Benchmark.parse_size(size) for size in os.environ.get('CRYPTO_BENCH_SIZES', '4KiB,1MiB,64MiB').split(',')]
+SEGMENT_SIZES = [Benchmark.parse_size(size) for size in Benchmark.DEFAULT_SEGMENT_SIZES]
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda size: f'{size}B')
+def sample(request, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('crypto') / 'sample.bin')
+    Benchmark.write_sample(path, request.param)
+    return path, request.param
+
+
+@pytest.fixture(scope='module')
+def key():
+    return SyncEncrypt().generateKey()
+
+
+def throughput(benchmark, size):
+    benchmark.extra_info['size_bytes'] = size
+    benchmark.extra_info['mb_s'] = size / 1024 ** 2 / benchmark.stats.stats.mean
+
+
+BACKENDS = [backend.name for backend in Backends.available_backends()]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('segment_size', SEGMENT_SIZES)
+def test_encrypt(benchmark, sample, key, segment_size, backend):
+    path, size = sample
+    benchmark(SyncEncrypt().encrypt, path, key, segment_size=segment_size, backend=backend)
+    throughput(benchmark, size)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('segment_size', SEGMENT_SIZES)
+def test_decrypt(benchmark, sample, key, segment_size, backend):
+    path, size = sample
+    encrypted = SyncEncrypt().encrypt(path, key, segment_size=segment_size, backend=backend)
+
+    def decrypt():
+        with open(os.devnull, 'wb') as sink:
+            SyncDecrypt().decrypt_to(encrypted, key, sink)
+
+    benchmark(decrypt)
+    throughput(benchmark, size)
+
+
+def test_encrypt_legacy(benchmark, sample, key):
+    path, size = sample
+    benchmark(SyncEncrypt().encrypt_legacy, path, key)
+    throughput(benchmark, size)
+
+
+def test_rsa_wrap_unwrap(benchmark):
+    private_key = RSA.generate(2048)
+    user = Benchmark._KeyHolder(private_key.publickey().export_key().decode())
+    aes_key = SyncEncrypt().generateKey()
+
+    def round_trip():
+        AsyncDecrypt().decrypt_key(private_key, AsyncEncrypt().encrypt_key(user, aes_key))
+
+    benchmark(round_trip)
@@ -0,0 +1,309 @@
+import io
+import os
+import struct
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+from unittest import mock
+
+from Crypto.PublicKey import RSA
+from django.test import SimpleTestCase
+
+from Cryptography import Backends, Codecs, Container, Encryption
+from Cryptography.Ledger import Ledger
+
+
+class SyncDecryptTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.key = Encryption.SyncEncrypt().generateKey()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_round_trip(self):
+        plaintext = os.urandom(3 * Encryption.CHUNK_SIZE + 123)
+        with open(self.path('doc.pdf'), 'wb') as f:
+            f.write(plaintext)
+
+        encrypted = Encryption.SyncEncrypt().encrypt(self.path('doc.pdf'), self.key)
+        output = Encryption.SyncDecrypt().decrypt(encrypted, self.key, output_filename=self.path('out.pdf'))
+
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), plaintext)
+
+    def test_legacy_single_stream_file_is_still_readable(self):
+        plaintext = os.urandom(2 * Encryption.CHUNK_SIZE + 7)
+        with open(self.path('doc.pdf'), 'wb') as f:
+            f.write(plaintext)
+
+        encrypted = Encryption.SyncEncrypt().encrypt_legacy(self.path('doc.pdf'), self.key)
+        chunks = list(Encryption.SyncDecrypt().decrypt_chunks(encrypted, self.key))
+
+        self.assertEqual(b''.join(chunks), plaintext)
+
+    def test_tampered_file_is_rejected(self):
+        with open(self.path('doc.pdf'), 'wb') as f:
+            f.write(b'manifest' * 1000)
+        encrypted = Encryption.SyncEncrypt().encrypt(self.path('doc.pdf'), self.key)
+        with open(encrypted, 'r+b') as f:
+            f.seek(Encryption.HEADER_SIZE + 10)
+            f.write(b'X')
+
+        with self.assertRaises(ValueError):
+            Encryption.SyncDecrypt().decrypt(encrypted, self.key, output_filename=self.path('out.pdf'))
+        self.assertFalse(os.path.exists(self.path('out.pdf')))
+
+    def test_peak_memory_is_bounded_by_chunk_size(self):
+        # A sparse 2 GiB ciphertext: every byte still has to be decrypted, but the
+        # tag cannot match, so decryption fails only after the whole file was read
+        filesize = 2 * 1024 ** 3
+        encrypted = self.path('large.encrypted')
+        with open(encrypted, 'wb') as f:
+            f.write(str(filesize).zfill(Encryption.SIZE_FIELD).encode('utf-8'))
+            f.write(os.urandom(Encryption.NONCE_SIZE))
+            f.truncate(Encryption.HEADER_SIZE + filesize + Encryption.TAG_SIZE)
+
+        decrypted = 0
+        tracemalloc.start()
+        try:
+            with self.assertRaises(ValueError):
+                for chunk in Encryption.SyncDecrypt().decrypt_chunks(encrypted, self.key):
+                    decrypted += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(decrypted, filesize)
+        self.assertLess(peak, 16 * Encryption.CHUNK_SIZE)
+
+
+class ContainerTests(SimpleTestCase):
+    segment_size = 4096
+
+    def setUp(self):
+        self.key = Encryption.SyncEncrypt().generateKey()
+
+    def encrypt(self, plaintext, workers=1, backend='eax', codec='none'):
+        out = io.BytesIO()
+        with Container.SegmentWriter(out, self.key, self.segment_size, workers, backend=backend,
+                                     codec=codec) as writer:
+            for i in range(0, len(plaintext), 1000):
+                writer.write(plaintext[i:i + 1000])
+        return out.getvalue()
+
+    def decrypt(self, data, workers=1):
+        return b''.join(Container.SegmentReader(io.BytesIO(data), self.key, workers).segments())
+
+    def test_parallel_round_trip(self):
+        for size in (0, 1, self.segment_size, 10 * self.segment_size + 5):
+            plaintext = os.urandom(size)
+            data = self.encrypt(plaintext, workers=4)
+
+            header = Container.Header.read(io.BytesIO(data))
+            self.assertEqual(header.plaintext_size, size)
+            self.assertEqual(header.segment_count, max(1, -(-size // self.segment_size)))
+            self.assertEqual(self.decrypt(data, workers=4), plaintext)
+            self.assertEqual(self.decrypt(data, workers=1), plaintext)
+
+    def test_every_backend_round_trips_and_is_recorded_in_the_header(self):
+        plaintext = os.urandom(3 * self.segment_size + 1)
+        for backend in Backends.available_backends():
+            data = self.encrypt(plaintext, backend=backend.name)
+            self.assertEqual(Container.Header.read(io.BytesIO(data)).backend, backend.id)
+            # Decryption follows the header, not the configured default
+            with mock.patch.object(Backends, '_default', 'eax'):
+                self.assertEqual(self.decrypt(data), plaintext)
+
+            tampered = bytearray(data)
+            tampered[-1] ^= 1
+            with self.assertRaises(ValueError):
+                self.decrypt(bytes(tampered))
+
+    def test_compressed_round_trip_and_range_reads(self):
+        text = b''.join(b'%d,MSKU%07d,Chennai,Singapore\n' % (i, i) for i in range(2000))
+        # Text compresses, the random part is stored raw
+        plaintext = text[:5 * self.segment_size] + os.urandom(3 * self.segment_size) + text[:100]
+        for codec in (codec for codec in Codecs.CODECS.values() if codec.available() and codec.id):
+            data = self.encrypt(plaintext, workers=2, codec=codec.name)
+            header = Container.Header.read(io.BytesIO(data))
+            self.assertEqual(header.codec, codec.id)
+            self.assertTrue(header.indexed)
+            self.assertLess(len(data), len(plaintext) * 0.6)
+
+            self.assertEqual(self.decrypt(data, workers=2), plaintext)
+            reader = Container.SegmentReader(io.BytesIO(data), self.key)
+            start, end = 4 * self.segment_size + 10, 7 * self.segment_size + 20
+            self.assertEqual(b''.join(reader.read_range(start, end)), plaintext[start:end])
+
+    def test_corrupt_segment_index_is_rejected(self):
+        text = b'manifest line\n' * 2000
+        data = bytearray(self.encrypt(text, codec='zlib'))
+        count = Container.Header.read(io.BytesIO(bytes(data))).segment_count
+        index_start = len(data) - count * Container.INDEX_ENTRY_SIZE
+        data[index_start:index_start + 8] = struct.pack('>Q', Container.HEADER_SIZE + 1)
+
+        with self.assertRaises(ValueError):
+            self.decrypt(bytes(data))
+
+    def test_tampered_plaintext_size_is_rejected(self):
+        text = b'manifest line\n' * 1000
+        data = self.encrypt(text, codec='zlib')
+        for size in (len(text) - 5, len(text) + 5):
+            tampered = bytearray(data)
+            tampered[Container.HEADER_AAD_SIZE:Container.HEADER_SIZE] = struct.pack(
+                Container.COUNTS_FORMAT, Container.Header.read(io.BytesIO(data)).segment_count, size)
+
+            with self.assertRaises(ValueError):
+                self.decrypt(bytes(tampered))
+            reader = Container.SegmentReader(io.BytesIO(bytes(tampered)), self.key)
+            with self.assertRaises(ValueError):
+                list(reader.read_range(len(text) - 10, len(text)))
+
+    def test_unknown_backend_is_rejected(self):
+        data = bytearray(self.encrypt(b'manifest'))
+        data[5] = 200
+        with self.assertRaises(ValueError):
+            self.decrypt(bytes(data))
+
+    def test_reordered_segments_are_rejected(self):
+        data = bytearray(self.encrypt(os.urandom(3 * self.segment_size)))
+        record = self.segment_size + Container.TAG_SIZE
+        first = slice(Container.HEADER_SIZE, Container.HEADER_SIZE + record)
+        second = slice(Container.HEADER_SIZE + record, Container.HEADER_SIZE + 2 * record)
+        data[first], data[second] = data[second], data[first]
+
+        with self.assertRaises(ValueError):
+            self.decrypt(bytes(data))
+
+    def test_truncated_container_is_rejected(self):
+        data = bytearray(self.encrypt(os.urandom(3 * self.segment_size)))
+        # Drop the last segment and fix up the header counts to match
+        del data[Container.HEADER_SIZE + 2 * (self.segment_size + Container.TAG_SIZE):]
+        data[Container.HEADER_AAD_SIZE:Container.HEADER_SIZE] = struct.pack(
+            Container.COUNTS_FORMAT, 2, 2 * self.segment_size)
+
+        with self.assertRaises(ValueError):
+            self.decrypt(bytes(data))
+
+    def test_range_read_only_touches_covering_segments(self):
+        plaintext = os.urandom(10 * self.segment_size)
+        data = bytearray(self.encrypt(plaintext))
+        # Corrupt segment 0; ranges inside segments 3-5 must not notice
+        data[Container.HEADER_SIZE] ^= 1
+        reader = Container.SegmentReader(io.BytesIO(bytes(data)), self.key)
+
+        start, end = 3 * self.segment_size + 100, 5 * self.segment_size + 50
+        self.assertEqual(b''.join(reader.read_range(start, end)), plaintext[start:end])
+        with self.assertRaises(ValueError):
+            b''.join(reader.read_range(0, 10))
+
+    def test_records_are_read_into_the_given_buffer(self):
+        plaintext = os.urandom(4 * self.segment_size + 7)
+        for backend in Backends.available_backends():
+            data = self.encrypt(plaintext, backend=backend.name, codec='zlib')
+            reader = Container.SegmentReader(io.BytesIO(data), self.key)
+            buffer = bytearray(self.segment_size + 1 + Container.TAG_SIZE)
+            record = reader.read_record(1, buffer)
+            self.assertIsInstance(record, memoryview)
+            self.assertIs(record.obj, buffer)
+
+            start, end = self.segment_size - 3, 4 * self.segment_size + 5
+            self.assertEqual(b''.join(reader.read_range(start, end, buffer)), plaintext[start:end])
+            # Records that do not fit are read as usual
+            self.assertEqual(b''.join(reader.read_range(0, len(plaintext), bytearray(10))), plaintext)
+
+
+class KeyWrapTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_keys = [RSA.generate(1024) for _ in range(3)]
+
+    def users(self):
+        return [SimpleNamespace(pk=i, pubKey=key.publickey().export_key().decode())
+                for i, key in enumerate(self.private_keys)]
+
+    def test_wraps_one_key_for_all_recipients(self):
+        aes_key = Encryption.SyncEncrypt().generateKey()
+        wrapped = Encryption.AsyncEncrypt().encrypt_key_for(self.users(), aes_key)
+
+        self.assertEqual(len(wrapped), len(self.private_keys))
+        for pk, private_key in enumerate(self.private_keys):
+            self.assertEqual(Encryption.AsyncDecrypt().decrypt_key(private_key, wrapped[pk]), aes_key)
+
+    def test_parsed_keys_are_cached_until_the_key_changes(self):
+        cache = Encryption.PublicKeyCache(maxsize=2)
+        users = self.users()
+        with mock.patch.object(Encryption.RSA, 'importKey', wraps=RSA.importKey) as import_key:
+            for _ in range(5):
+                cache.get(users[0])
+            self.assertEqual(import_key.call_count, 1)
+
+            users[0].pubKey = self.private_keys[1].publickey().export_key().decode()
+            self.assertEqual(cache.get(users[0]), self.private_keys[1].publickey())
+            self.assertEqual(import_key.call_count, 2)
+
+            # Bounded: the least recently used entry is evicted
+            cache.get(users[1])
+            cache.get(users[2])
+            cache.get(users[0])
+            self.assertEqual(import_key.call_count, 5)
+
+
+class MerkleTreeTests(SimpleTestCase):
+
+    def tree(self, leaves, cached=None):
+        return Ledger.MerkleTree(len(leaves), lambda start, end: leaves[start:end], cached)
+
+    def leaves(self, count):
+        return [Ledger.leaf_hash(str(i).encode()) for i in range(count)]
+
+    def test_inclusion_proofs_verify_for_every_leaf(self):
+        for size in range(1, 40):
+            leaves = self.leaves(size)
+            tree = self.tree(leaves)
+            root = tree.root()
+            self.assertEqual(root, Ledger.root_of(leaves))
+            for index in range(size):
+                proof = tree.inclusion_proof(index)
+                self.assertLessEqual(len(proof), size.bit_length())
+                self.assertTrue(Ledger.verify_inclusion(leaves[index], index, size, proof, root))
+                self.assertFalse(Ledger.verify_inclusion(leaves[index - 1] if size > 1 else b"x" * 32,
+                                                         index, size, proof, root))
+
+    def test_consistency_proofs_verify_between_every_pair_of_sizes(self):
+        leaves = self.leaves(33)
+        for new_size in range(1, 34):
+            tree = self.tree(leaves[:new_size])
+            new_root = tree.root()
+            for old_size in range(1, new_size + 1):
+                old_root = Ledger.root_of(leaves[:old_size])
+                proof = tree.consistency_proof(old_size)
+                self.assertTrue(Ledger.verify_consistency(old_size, new_size, old_root, new_root, proof))
+                if old_size < new_size:
+                    self.assertFalse(Ledger.verify_consistency(old_size, new_size, Ledger.leaf_hash(b"forged"),
+                                                               new_root, proof))
+
+    def test_cached_subtrees_are_not_rehashed(self):
+        leaves = self.leaves(5000)
+        fetched = []
+
+        def fetch(start, end):
+            fetched.append((start, end))
+            return leaves[start:end]
+
+        stored = {(start, start + 1024): Ledger.root_of(leaves[start:start + 1024]) for start in range(0, 4096, 1024)}
+        tree = Ledger.MerkleTree(len(leaves), fetch, lambda start, end: stored.get((start, end)))
+        proof = tree.inclusion_proof(4500)
+        self.assertTrue(Ledger.verify_inclusion(leaves[4500], 4500, 5000, proof, Ledger.root_of(leaves)))
+        self.assertEqual(fetched, [(4096, 5000)])
+
+    def test_chain_hash_depends_on_predecessor(self):
+        payload = Ledger.canonical_payload(seq=1, event="CREATE")
+        self.assertNotEqual(Ledger.entry_hash(Ledger.GENESIS, payload), Ledger.entry_hash(b"\x01" * 32, payload))
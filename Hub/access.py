@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.dispatch import Signal
+
+from UserManagement.models import UserGroups
+
+VIEW = 'view'
+DOWNLOAD = 'download'
+SHARE = 'share'
+EDIT = 'edit'
+APPROVE = 'approve'
+
+# What each ShipmentAccess level allows
+ACTIONS = {
+    'Owner': frozenset((VIEW, DOWNLOAD, SHARE, EDIT)),
+    'Viewer': frozenset((VIEW, DOWNLOAD)),
+}
+# Authorities see every shipment without ShipmentAccess rows
+AUTHORITY_ACTIONS = frozenset((VIEW, DOWNLOAD, APPROVE))
+
+# Above this many shipments a visibility filter joins ShipmentAccess instead of listing primary keys
+MAX_IN_FILTER = 500
+
+# Cache backends that every process keeps to itself: invalidations made in one never reach the others
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+# Sent with ``user_ids`` by code that changes ShipmentAccess rows without model signals (bulk_create/update)
+access_changed = Signal()
+
+
+class AccessResolver:
+    """
+    Answers permission questions from each user's ``{shipment pk: access
+    level}`` map, loaded with one query and cached in-process (bounded LRU)
+    and in the Django cache.
+
+    Every user has a version number in the Django cache; changing their
+    ShipmentAccess rows bumps it, which retires both cached copies in every
+    process at once. That only holds when the cache is shared between
+    processes: with a process-local backend (see PROCESS_LOCAL_CACHES)
+    nothing is cached and every call reads the database.
+    """
+
+    def __init__(self, maxsize=None, cache=None):
+        self.maxsize = maxsize or getattr(settings, 'ACCESS_CACHE_LOCAL_SIZE', 1024)
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self._cache = cache
+
+    @property
+    def cache(self):
+        return self._cache or caches[getattr(settings, 'ACCESS_CACHE_ALIAS', 'default')]
+
+    @property
+    def shared(self):
+        """Whether the cache reaches every process, and so whether access may be cached between requests."""
+        return not isinstance(self.cache, PROCESS_LOCAL_CACHES)
+
+    @staticmethod
+    def version_key(user_id):
+        return f'hub:access-version:{user_id}'
+
+    def version(self, user_id):
+        key = self.version_key(user_id)
+        version = self.cache.get(key)
+        if version is None:
+            # Start from the clock so that a lost version key never resurrects entries cached under an old one
+            self.cache.add(key, time.time_ns(), None)
+            version = self.cache.get(key)
+        return version
+
+    def levels(self, user):
+        """``{shipment pk: access level}`` for ``user``."""
+        from Hub.models import ShipmentAccess
+
+        if not self.shared:
+            return dict(ShipmentAccess.objects.filter(userid_id=user.pk).values_list('shipment_id', 'access'))
+        version = self.version(user.pk)
+        with self.lock:
+            entry = self.local.get(user.pk)
+            if entry is not None and entry[0] == version:
+                self.local.move_to_end(user.pk)
+                return entry[1]
+
+        key = f'hub:access:{user.pk}:{version}'
+        levels = self.cache.get(key)
+        if levels is None:
+            levels = dict(ShipmentAccess.objects.filter(userid_id=user.pk).values_list('shipment_id', 'access'))
+            self.cache.set(key, levels, getattr(settings, 'ACCESS_CACHE_TIMEOUT', 300))
+
+        with self.lock:
+            self.local[user.pk] = (version, levels)
+            self.local.move_to_end(user.pk)
+            while len(self.local) > self.maxsize:
+                self.local.popitem(last=False)
+        return levels
+
+    def actions(self, user, shipment, levels=None):
+        if not user.is_authenticated:
+            return frozenset()
+        if user.role == UserGroups.authority:
+            return AUTHORITY_ACTIONS
+        if levels is None:
+            levels = self.levels(user)
+        return ACTIONS.get(levels.get(getattr(shipment, 'pk', shipment)), frozenset())
+
+    def can(self, user, action, shipment):
+        """Whether ``user`` may perform ``action`` on ``shipment`` (an instance or a primary key)."""
+        return action in self.actions(user, shipment)
+
+    def resolve(self, user, shipments):
+        """
+        Sets ``permissions`` (the allowed actions) on every shipment of a page
+        and returns them; at most one query however many rows there are.
+        """
+        levels = self.levels(user) if user.is_authenticated and user.role != UserGroups.authority else None
+        for shipment in shipments:
+            shipment.permissions = self.actions(user, shipment, levels)
+        return shipments
+
+    def visible_ids(self, user):
+        """Primary keys of the shipments ``user`` can see, or None when they can see every shipment."""
+        if user.is_authenticated and user.role == UserGroups.authority:
+            return None
+        if not user.is_authenticated:
+            return frozenset()
+        return frozenset(self.levels(user))
+
+    def visible(self, user, queryset):
+        """Narrows a Shipment queryset to what ``user`` can see."""
+        ids = self.visible_ids(user)
+        if ids is None:
+            return queryset
+        if len(ids) > MAX_IN_FILTER:
+            return queryset.filter(shipmentaccess__userid=user)
+        return queryset.filter(pk__in=ids)
+
+    def invalidate(self, user_ids):
+        if not self.shared:
+            return
+        for user_id in set(user_ids):
+            key = self.version_key(user_id)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, time.time_ns(), None)
+            with self.lock:
+                self.local.pop(user_id, None)
+
+    def clear(self):
+        """Forgets what this process cached; the shared cache still serves current versions."""
+        with self.lock:
+            self.local.clear()
+
+
+resolver = AccessResolver()
+
+
+def invalidate(user_ids):
+    """
+    Retires cached access for ``user_ids`` now, so that this transaction sees
+    its own changes, and again once it commits, so that nothing another
+    process cached in between survives.
+    """
+    user_ids = list(user_ids)
+    resolver.invalidate(user_ids)
+    transaction.on_commit(lambda: resolver.invalidate(user_ids))
+
+
+class ShipmentPermissionsMixin:
+    """Resolves the viewer's permissions on every shipment of a ListView page, see AccessResolver.resolve."""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        resolver.resolve(self.request.user, context['object_list'])
+        return context
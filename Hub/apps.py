@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class HubConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Hub'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from Cryptography import Backends, Codecs
+        # checks registers its system checks, uploads its job tasks
+        from Hub import checks, database, search, signals, uploads  # noqa: F401
+
+        connection_created.connect(database.configure_connection)
+        post_migrate.connect(search.install_index, sender=self)
+
+        Backends.configure(getattr(settings, 'CRYPTO_BACKEND', 'auto'))
+        Codecs.configure(getattr(settings, 'DOCUMENT_COMPRESSION', 'none'))
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIHandler
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.views import View
+
+from Hub import downloads, uploadhandlers, views
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def crypto_executor():
+    """
+    Shared pool for CPU-bound decryption and blocking file reads of the async views.
+
+    Bounded by ASYNC_CRYPTO_WORKERS so that hundreds of in-flight downloads
+    queue for CPU instead of each getting a thread.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_CRYPTO_WORKERS', None) or
+                                           os.cpu_count(), thread_name_prefix='crypto')
+        return _executor
+
+
+_DONE = object()
+
+
+async def aiter_in_executor(iterator):
+    """Drives a blocking iterator from the event loop, one step at a time on the crypto executor."""
+    loop = asyncio.get_running_loop()
+    executor = crypto_executor()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, iterator, _DONE)
+            if chunk is _DONE:
+                break
+            yield chunk
+    finally:
+        await loop.run_in_executor(executor, iterator.close)
+
+
+class AsyncDocumentDownload(View):
+    """DocumentDownload for ASGI workers: no thread is held while the client reads slowly."""
+
+    async def get(self, request, pk):
+        def open_document():
+            if not request.user.is_authenticated:
+                return None
+            return downloads.DocumentReader(downloads.get_readable_document(request.user, pk))
+
+        reader = await sync_to_async(open_document)()
+        if reader is None:
+            return redirect_to_login(request.get_full_path())
+
+        return downloads.range_response(reader, request.headers.get('Range'),
+                                        lambda start, end: aiter_in_executor(reader.iter_range(start, end)))
+
+
+def read_body(request):
+    # Parsing the body is what runs the upload handlers
+    request.POST, request.FILES
+
+
+class AsyncNewShipment(views.NewShipment):
+    """
+    NewShipment for ASGI workers. Parsing the upload (which encrypts it) runs
+    on the crypto executor, so uploads are encrypted side by side instead of
+    queueing for the one thread sync_to_async shares; the database writes
+    follow on that thread.
+
+    The body has to fit in memory, see BodyInMemoryASGIHandler: larger
+    documents go through the resumable upload API.
+    """
+    body_in_memory = True
+
+    async def get(self, request, *args, **kwargs):
+        return await sync_to_async(super().get)(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            await asyncio.get_running_loop().run_in_executor(crypto_executor(), read_body, request)
+        except BaseException:
+            await sync_to_async(uploadhandlers.discard_unconsumed)(request)
+            raise
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+    async def put(self, request, *args, **kwargs):
+        return await self.post(request, *args, **kwargs)
+
+
+class BodyInMemoryASGIHandler(ASGIHandler):
+    """
+    Django's ASGI handler reads the whole request body before the view runs,
+    spooling whatever exceeds FILE_UPLOAD_MAX_MEMORY_SIZE to a temporary
+    file. For views with ``body_in_memory`` (plaintext uploads) a body that
+    would spill, or whose size is not announced, is refused with 413 before
+    any of it is read.
+    """
+
+    async def handle(self, scope, receive, send):
+        if self.body_must_stay_in_memory(scope) and not self.fits_in_memory(scope):
+            response = HttpResponse("Request body too large, send large documents as a resumable upload",
+                                    status=413, content_type='text/plain')
+            await self.send_response(response, send)
+            return
+        await super().handle(scope, receive, send)
+
+    @staticmethod
+    def body_must_stay_in_memory(scope):
+        path = scope['path']
+        root_path = scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        try:
+            view = resolve(path).func
+        except Resolver404:
+            return False
+        return getattr(getattr(view, 'view_class', None), 'body_in_memory', False)
+
+    @staticmethod
+    def fits_in_memory(scope):
+        headers = dict(scope.get('headers', ()))
+        try:
+            length = int(headers[b'content-length'])
+        except (KeyError, ValueError):
+            # Chunked, or a body without a size: only an empty one is safe
+            return scope.get('method') in ('GET', 'HEAD')
+        return length <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE
@@ -0,0 +1,133 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from Cryptography import Container
+from Hub import database, keys, storage as storages
+
+CHUNK_SIZE = Container.DEFAULT_SEGMENT_SIZE
+
+
+class ManifestBuilder:
+    """Hashes a stream in fixed CHUNK_SIZE pieces, whatever sizes it is fed in."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.current = hashlib.sha256()
+        self.filled = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(self.chunk_size - self.filled, len(view))
+            self.current.update(view[:take])
+            self.filled += take
+            view = view[take:]
+            if self.filled == self.chunk_size:
+                self.chunks.append(self.current.hexdigest())
+                self.current = hashlib.sha256()
+                self.filled = 0
+
+    @property
+    def manifest(self):
+        chunks = self.chunks + ([self.current.hexdigest()] if self.filled or not self.chunks else [])
+        return ''.join(chunks)
+
+
+def blob_name(digest):
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.encrypted"
+
+
+def store(upload):
+    """
+    Returns the Blob for an EncryptedUploadedFile and takes a reference on it.
+
+    If the same content is already stored the fresh ciphertext is discarded,
+    otherwise it is moved (renamed where the storage allows) to its content
+    address, and deleted from there if the transaction is rolled back.
+    """
+    from Hub.models import Blob
+
+    blob = _reference(upload.digest)
+    if blob is not None:
+        upload.discard()
+        return blob
+
+    storage = Blob._meta.get_field('blobFile').storage
+    name = blob_name(upload.digest)
+    try:
+        with transaction.atomic():
+            blob = Blob.objects.create(digest=upload.digest, manifest=upload.manifest, size=upload.size,
+                                       blobFile=name, dataKey=keys.wrap_data_key(upload.key), refCount=1)
+            storages.move(storage, upload.stored_name, name)
+            upload.consumed = True
+            database.on_rollback(lambda: storage.delete(name))
+        return blob
+    except IntegrityError:
+        # The same content was stored meanwhile, keep theirs
+        blob = _reference(upload.digest)
+        if blob is None:
+            raise
+        upload.discard()
+        return blob
+
+
+def _reference(digest):
+    from Hub.models import Blob
+
+    with transaction.atomic(savepoint=False):
+        if Blob.objects.filter(digest=digest).update(refCount=F('refCount') + 1) == 0:
+            return None
+        return Blob.objects.get(digest=digest)
+
+
+def reference(blob):
+    from Hub.models import Blob
+
+    Blob.objects.filter(pk=blob.pk).update(refCount=F('refCount') + 1)
+
+
+def release(blob_id):
+    """Drops a reference and deletes the blob and its file once nothing uses it."""
+    from Hub.models import Blob
+
+    with transaction.atomic():
+        Blob.objects.filter(pk=blob_id, refCount__gt=0).update(refCount=F('refCount') - 1)
+        blob = Blob.objects.filter(pk=blob_id, refCount=0).first()
+        if blob is None:
+            return False
+        name = blob.blobFile.name
+        storage = blob.blobFile.storage
+        blob.delete()
+        transaction.on_commit(lambda: storage.delete(name))
+    return True
+
+
+def collect_garbage():
+    """Deletes blobs that lost all references, e.g. after a crash between decrement and delete."""
+    from Hub.models import Blob
+
+    return sum(release(pk) for pk in Blob.objects.filter(refCount=0).values_list('pk', flat=True))
+
+
+def find_reusable(user, digest):
+    """A blob with ``digest`` that ``user`` can already read, so it may be attached without re-uploading."""
+    from Hub.models import Blob
+
+    return Blob.objects.filter(digest=digest, documents__shipmentId__shipmentaccess__userid=user).first()
+
+
+def attach(shipment, blob, file_name):
+    document = document_for(shipment, blob, file_name)
+    document.save()
+    return document
+
+
+def document_for(shipment, blob, file_name):
+    """An unsaved Documents row pointing at ``blob``, e.g. for bulk_create."""
+    from Hub.models import Documents
+
+    return Documents(Cargo_Doc=blob.blobFile.name, fileName=file_name, blob=blob, dataKey=blob.dataKey,
+                     digest=blob.digest, shipmentId=shipment)
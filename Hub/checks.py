@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_access_cache(app_configs, **kwargs):
+    """Warns when ACCESS_CACHE_ALIAS is a process-local cache, which turns the access cache off."""
+    from Hub.access import resolver
+
+    if resolver.shared:
+        return []
+    return [Warning(
+        'ACCESS_CACHE_ALIAS is a cache that every process keeps to itself, so shipment access is not cached '
+        'between requests.',
+        hint='Point ACCESS_CACHE_ALIAS at a cache shared between processes (file based, memcached or redis).',
+        id='Hub.W001',
+    )]
+
+
+
+@register(Tags.security)
+def check_document_master_key(app_configs, **kwargs):
+    """Warns while document keys are wrapped under SECRET_KEY, which Hub.keys.server_key only allows in DEBUG."""
+    if getattr(settings, 'DOCUMENT_MASTER_KEY', None) or not settings.DEBUG:
+        return []
+    return [Warning(
+        'DOCUMENT_MASTER_KEY is not set, document keys are wrapped under a key derived from SECRET_KEY.',
+        hint='Set DOCUMENT_MASTER_KEY before storing documents you mean to keep: changing it later leaves the '
+             'stored ones unreadable.',
+        id='Hub.W002',
+    )]
+
+
+@register(Tags.security, deploy=True)
+def check_document_master_key_deploy(app_configs, **kwargs):
+    if getattr(settings, 'DOCUMENT_MASTER_KEY', None):
+        return []
+    return [Error(
+        'DOCUMENT_MASTER_KEY must be set when DEBUG is off.',
+        hint='Generate a long random value and keep it out of the repository, e.g. in the environment.',
+        id='Hub.E001',
+    )]
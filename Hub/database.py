@@ -0,0 +1,119 @@
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.template.response import SimpleTemplateResponse
+
+# Applied to every new SQLite connection unless SQLITE_PRAGMAS says otherwise. busy_timeout comes first so
+# that switching the journal mode waits for other connections rather than failing
+PRAGMAS = {
+    'busy_timeout': 5000,
+    # Readers no longer wait for the writer, and commits append to the log instead of rewriting pages
+    'journal_mode': 'wal',
+    # In WAL mode only checkpoints fsync: a power loss can drop the last commits but never corrupts the file
+    'synchronous': 'normal',
+    # Negative sizes are KiB
+    'cache_size': -32000,
+    'temp_store': 'memory',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+_reading = ContextVar('reading', default=False)
+
+
+def read_alias():
+    """The database read-only views query, or None when READ_DATABASE is not configured."""
+    alias = getattr(settings, 'READ_DATABASE', None)
+    return alias if alias in settings.DATABASES else None
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver: tunes each SQLite connection, and keeps the read database read only."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', PRAGMAS))
+    if connection.alias == read_alias():
+        pragmas['query_only'] = 1
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def on_rollback(func, using=None):
+    """
+    Calls ``func`` if the current transaction, or the savepoint it is in, is
+    rolled back; nothing happens outside a transaction.
+
+    Django has no rollback hook, but it drops the on_commit callbacks of what
+    it rolls back: ``func`` runs when a callback registered here is dropped
+    without having run.
+    """
+    if not transaction.get_connection(using).in_atomic_block:
+        return
+    committed = []
+
+    def commit():
+        committed.append(True)
+
+    weakref.finalize(commit, lambda: committed or func())
+    transaction.on_commit(commit, using=using)
+
+
+@contextmanager
+def reading():
+    """Sends the reads made inside the block to the read database (see ReadWriteRouter)."""
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+class ReadWriteRouter:
+    """
+    Writes go to the default database, and so do reads unless they are made
+    inside reading(), e.g. by a ReadOnlyViewMixin view. Reads stay on the
+    default database while it has a transaction open, so that they see what
+    it wrote, and for related objects of an instance, which come from
+    wherever the instance did.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias()
+        if alias is None or not _reading.get() or 'instance' in hints:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        aliases = {DEFAULT_DB_ALIAS, read_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == read_alias():
+            return False
+        return None
+
+
+class ReadOnlyViewMixin:
+    """
+    Runs a view that only reads (lists, reports, details) on the read
+    database. Template responses are rendered inside, so that the queries
+    the template makes are routed too.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with reading():
+            response = super().dispatch(request, *args, **kwargs)
+            if isinstance(response, SimpleTemplateResponse):
+                response.render()
+        return response
@@ -0,0 +1,205 @@
+import mimetypes
+import os
+import re
+import threading
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import content_disposition_header
+
+from Cryptography import Container
+from Hub import access, keys, models
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+READ_SIZE = 64 * 1024
+# Largest record of a default container: a segment, its compression marker and its tag
+RECORD_BUFFER_SIZE = Container.DEFAULT_SEGMENT_SIZE + 1 + Container.TAG_SIZE
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Returns the ``(start, end)`` byte range (end exclusive) asked for by a Range
+    header, or None when the whole file should be sent.
+
+    Only single ranges are honoured; anything else is ignored as RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size
+
+    start = int(first)
+    end = size if not last else min(int(last) + 1, size)
+    if start >= size or start >= end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+class BufferPool:
+    """
+    Record buffers shared by the downloads of a process: each download reads
+    its ciphertext into one buffer for as long as it streams. Released
+    buffers are kept for reuse up to ``idle`` of them, so a burst of
+    downloads allocates and the steady state does not.
+    """
+
+    def __init__(self, buffer_size=RECORD_BUFFER_SIZE, idle=None):
+        self.buffer_size = buffer_size
+        self.idle = idle if idle is not None else getattr(settings, 'DOWNLOAD_BUFFER_POOL_SIZE', 64)
+        self.free = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+        return bytearray(self.buffer_size)
+
+    def release(self, buffer):
+        with self.lock:
+            if len(self.free) < self.idle:
+                self.free.append(buffer)
+
+
+buffers = BufferPool()
+
+
+def document_filename(document):
+    if document.fileName:
+        return document.fileName
+    name = os.path.basename(document.Cargo_Doc.name)
+    if name.endswith('.encrypted'):
+        name = name[:-len('.encrypted')]
+    return name
+
+
+class DocumentReader:
+    """
+    Plaintext view of a stored document, decrypting only the segments that
+    are read. The stored file is only open while a range is iterated (along
+    with a buffer from ``buffers``), so a response that is never streamed
+    holds nothing.
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.key = keys.unwrap_data_key(document.dataKey) if document.dataKey else None
+        if self.key is None:
+            field = document.Cargo_Doc
+            self.size = field.storage.size(field.name)
+        else:
+            with self.open() as file:
+                self.size = Container.SegmentReader(file, self.key).plaintext_size
+
+    @property
+    def filename(self):
+        return document_filename(self.document)
+
+    @property
+    def content_type(self):
+        return mimetypes.guess_type(self.filename)[0] or 'application/octet-stream'
+
+    def open(self):
+        field = self.document.Cargo_Doc
+        return field.storage.open(field.name, 'rb')
+
+    def iter_range(self, start, end):
+        with self.open() as file:
+            if self.key is not None:
+                buffer = buffers.acquire()
+                try:
+                    yield from Container.SegmentReader(file, self.key).read_range(start, end, buffer)
+                finally:
+                    buffers.release(buffer)
+                return
+
+            file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = file.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def get_readable_document(user, pk):
+    document = get_object_or_404(models.Documents.objects.select_related('shipmentId'), pk=pk)
+    if not access.resolver.can(user, access.DOWNLOAD, document.shipmentId_id):
+        raise Http404()
+    return document
+
+
+def range_response(reader, range_header, stream):
+    """
+    Builds the 200/206/416 response for ``reader``; ``stream(start, end)``
+    returns the (sync or async) iterator producing the bytes.
+    """
+    try:
+        byte_range = parse_range(range_header, reader.size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{reader.size}"
+        return response
+
+    start, end = byte_range or (0, reader.size)
+    response = StreamingHttpResponse(stream(start, end), content_type=reader.content_type,
+                                     status=206 if byte_range else 200)
+    response['Content-Length'] = str(end - start)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(False, reader.filename)
+    if byte_range:
+        response['Content-Range'] = f"bytes {start}-{end - 1}/{reader.size}"
+    return response
+
+
+def ciphertext_response(document, user):
+    """
+    The stored file of ``document`` as it is, for clients that decrypt it
+    themselves with their wrapped key (sent in X-Document-Key).
+
+    The bytes never pass through Python: the front-end server sends the file
+    (DOCUMENT_OFFLOAD 'x-accel-redirect' for nginx, 'x-sendfile' for Apache
+    or lighttpd), otherwise the WSGI server does (FileResponse goes to
+    wsgi.file_wrapper, which sendfile()s it); files in object storage are
+    fetched from a signed URL instead.
+    """
+    field = document.Cargo_Doc
+    try:
+        path = field.storage.path(field.name)
+    except NotImplementedError:
+        response = HttpResponseRedirect(field.storage.url(field.name))
+    else:
+        offload = getattr(settings, 'DOCUMENT_OFFLOAD', None)
+        if offload == 'x-accel-redirect':
+            response = HttpResponse(content_type='application/octet-stream')
+            response['X-Accel-Redirect'] = quote(getattr(settings, 'DOCUMENT_OFFLOAD_PREFIX', '/protected') + path)
+        elif offload == 'x-sendfile':
+            response = HttpResponse(content_type='application/octet-stream')
+            response['X-Sendfile'] = path
+        else:
+            response = FileResponse(open(path, 'rb'), content_type='application/octet-stream')
+    response['Content-Disposition'] = content_disposition_header(True, f"{document_filename(document)}.encrypted")
+
+    wrapped = (models.ShipmentAccess.objects.filter(userid=user, shipment_id=document.shipmentId_id)
+               .values_list('wrappedKeys', flat=True).first() or {}).get(str(document.pk))
+    if wrapped:
+        response['X-Document-Key'] = wrapped
+    return response
@@ -1,26 +1,26 @@
-import random
-import string
-
 from django import forms
 
 from Hub import models
 
 
-def generate_unique_alphanumeric(length):
-    alphanumeric = string.ascii_letters + string.digits
-    while True:
-        generated_text = ''.join(random.choice(alphanumeric) for _ in range(length))
-        if generated_text not in models.Shipment.manager.all().filter(shipmentId=generated_text):
-            return generated_text
-
 class ShipmentForm(forms.ModelForm):
-    document = forms.FileField(label="Documents", allow_empty_file=False)
+    document = forms.FileField(label="Documents", allow_empty_file=False, required=False)
+    # SHA-256 of a document the user already stored, attached instead of uploading it again
+    documentDigest = forms.CharField(max_length=64, required=False, widget=forms.HiddenInput)
+    # Set by clients that send the document afterwards through a resumable upload (Hub.uploads)
+    uploadLater = forms.BooleanField(required=False, widget=forms.HiddenInput)
 
     class Meta:
         model = models.Shipment
         fields = (
             "Shipper_Name", "Shipment_Company", "Receiver_Name", "Source", "Destination", "Cargo_Name", "Cargo_Type")
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if not (cleaned_data.get('document') or cleaned_data.get('documentDigest') or cleaned_data.get('uploadLater')):
+            self.add_error('document', "This field is required.")
+        return cleaned_data
+
 
 class ShipmentApprove(forms.ModelForm):
 
@@ -29,3 +29,16 @@ class ShipmentApprove(forms.ModelForm):
         fields = (
             "Shipper_Name", "Shipment_Company", "Receiver_Name", "Source", "Destination", "Cargo_Name", "Cargo_Type")
 
+
+
+class PendingApprovalFilter(forms.Form):
+    source = forms.CharField(max_length=25, required=False, label="Origin")
+    destination = forms.CharField(max_length=25, required=False)
+    cargoType = forms.ChoiceField(choices=[('', "Any")] + models.Shipment.CargoTypes.choices, required=False,
+                                  label="Cargo Type")
+
+
+class UploadSessionForm(forms.Form):
+    fileName = forms.CharField(max_length=255)
+    size = forms.IntegerField(min_value=1)
+    shipment = forms.IntegerField()
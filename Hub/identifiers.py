@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+
+# Sorted so that identifiers compare (as plain strings) in the order they were allocated
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+TIME_BITS = 48
+RANDOM_BITS = 40
+# 62 ** 15 > 2 ** 88, so every identifier has exactly this many characters
+LENGTH = 15
+
+_lock = threading.Lock()
+_last = (0, 0)
+
+
+def _encode(number):
+    chars = []
+    for _ in range(LENGTH):
+        number, digit = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def new_shipment_id():
+    """
+    Allocates a shipment ID without looking anything up: milliseconds since
+    the epoch followed by 40 random bits. Within one millisecond a process
+    increments the random part instead of drawing it again, so its IDs are
+    strictly increasing; two processes collide only by drawing the same 40
+    bits in the same millisecond, which the unique index on shipmentId
+    catches.
+    """
+    global _last
+    with _lock:
+        millis = time.time_ns() // 1_000_000
+        last_millis, last_random = _last
+        if millis <= last_millis:
+            millis, rand = last_millis, last_random + 1
+            if rand >> RANDOM_BITS:
+                # 2**40 IDs in one millisecond: borrow the next one
+                millis, rand = millis + 1, int.from_bytes(os.urandom(5), 'big') >> 1
+        else:
+            rand = int.from_bytes(os.urandom(5), 'big') >> 1
+        _last = (millis, rand)
+    return _encode(millis << RANDOM_BITS | rand)
@@ -0,0 +1,170 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Job priorities, higher runs first
+HIGH = 10
+NORMAL = 0
+LOW = -10
+
+# Registered task functions by job kind, see task()
+TASKS = {}
+
+
+def task(kind):
+    """
+    Registers ``fn(job, **payload)`` as the task run for jobs of ``kind``.
+    Whatever it returns (JSON serialisable) is stored as the job's result;
+    an exception fails the attempt, which is retried until the job's
+    ``maxAttempts`` are used up. Tasks may run more than once, so they must
+    be safe to repeat.
+    """
+    def register(fn):
+        TASKS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, payload=None, owner=None, priority=NORMAL, max_attempts=None, delay=None):
+    """
+    Queues a job. It is written in the caller's transaction, so workers only
+    see it once that commits and never run it for work that rolled back.
+    """
+    from Hub.models import Job
+
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    return Job.objects.create(kind=kind, payload=payload or {}, owner=owner, priority=priority,
+                              maxAttempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+                              runAfter=timezone.now() + (delay or timedelta()))
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'JOB_LEASE', 300))
+
+
+def requeue_abandoned():
+    """Queues again the running jobs whose worker stopped renewing its heartbeat, e.g. because it was killed."""
+    from Hub.models import Job
+
+    now = timezone.now()
+    abandoned = Job.objects.filter(status=Job.Statuses.RUNNING, heartbeatAt__lt=now - lease())
+    # A job that keeps taking its worker down is not tried forever
+    abandoned.filter(attempts__gte=F('maxAttempts')).update(status=Job.Statuses.FAILED, finishedAt=now,
+                                                            error="Worker lost on the last attempt")
+    return abandoned.update(status=Job.Statuses.QUEUED, worker='', message="Worker lost, queued again")
+
+
+def claim(worker):
+    """
+    Takes the next runnable job for ``worker``, or returns None. The claim is
+    a conditional UPDATE, so concurrent workers never take the same job
+    whether or not the database supports SKIP LOCKED.
+    """
+    from Hub.models import Job
+
+    now = timezone.now()
+    candidates = (Job.objects.filter(status=Job.Statuses.QUEUED, runAfter__lte=now)
+                  .order_by('-priority', 'runAfter', 'id').values_list('pk', flat=True)[:10])
+    for pk in candidates:
+        if Job.objects.filter(pk=pk, status=Job.Statuses.QUEUED).update(
+                status=Job.Statuses.RUNNING, worker=worker, heartbeatAt=now, attempts=F('attempts') + 1):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def _running(job):
+    from Hub.models import Job
+
+    # Guards every write, so a worker that lost its job (see requeue_abandoned) cannot overwrite the new run
+    return Job.objects.filter(pk=job.pk, worker=job.worker, status=Job.Statuses.RUNNING)
+
+
+def report(job, progress, message=''):
+    """Records how far a running job got (0 to 1) and renews its heartbeat."""
+    job.progress, job.message = progress, message
+    _running(job).update(progress=progress, message=message[:255], heartbeatAt=timezone.now())
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'JOB_RETRY_DELAY', 5)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+def run(job):
+    """Runs a claimed job and records the outcome; returns the job's new status."""
+    from Hub.models import Job
+
+    fn = TASKS.get(job.kind)
+    try:
+        if fn is None:
+            raise LookupError(f"No task is registered for {job.kind!r}")
+        result = fn(job, **job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if fn is not None and job.attempts < job.maxAttempts:
+            status = Job.Statuses.QUEUED
+            _running(job).update(status=status, error=error, worker='',
+                                 runAfter=timezone.now() + retry_delay(job.attempts))
+            logger.warning("Job %s (%s) failed, attempt %d of %d", job.pk, job.kind, job.attempts, job.maxAttempts)
+        else:
+            status = Job.Statuses.FAILED
+            _running(job).update(status=status, error=error, finishedAt=timezone.now())
+            logger.error("Job %s (%s) failed for good:\n%s", job.pk, job.kind, error)
+    else:
+        status = Job.Statuses.DONE
+        _running(job).update(status=status, result=result, progress=1, finishedAt=timezone.now())
+    job.status = status
+    return status
+
+
+def work(worker=None, burst=False, poll=1.0, stop=None):
+    """
+    Claims and runs jobs until ``stop`` (a threading.Event) is set, or, with
+    ``burst``, until none is runnable. Returns the number of jobs run.
+    """
+    worker = worker or worker_name()
+    count = 0
+    while stop is None or not stop.is_set():
+        # Like a request boundary, unless the caller holds the connection in a transaction (e.g. tests)
+        if not connection.in_atomic_block:
+            close_old_connections()
+        requeue_abandoned()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll)
+            continue
+        run(job)
+        count += 1
+    return count
+
+
+def status(job):
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'attempts': job.attempts,
+        'result': job.result,
+        'createdAt': job.createdAt.isoformat(),
+        'finishedAt': job.finishedAt.isoformat() if job.finishedAt else None,
+    }
@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import logging
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from Cryptography.Encryption import AsyncEncrypt
+from Hub.access import access_changed
+
+WRAP_NONCE_SIZE = 16
+WRAP_TAG_SIZE = 16
+
+logger = logging.getLogger(__name__)
+
+
+def server_key():
+    # Document keys are stored wrapped under a key derived from DOCUMENT_MASTER_KEY
+    secret = getattr(settings, 'DOCUMENT_MASTER_KEY', None)
+    if not secret:
+        if not settings.DEBUG:
+            raise ImproperlyConfigured("DOCUMENT_MASTER_KEY must be set when DEBUG is off")
+        # Development only, see Hub.checks.check_document_master_key
+        secret = settings.SECRET_KEY
+    return hashlib.sha256(b"RemoteSecureFileStorage document keys|" + secret.encode('utf-8')).digest()
+
+
+def wrap_data_key(data_key):
+    nonce = get_random_bytes(WRAP_NONCE_SIZE)
+    cipher = AES.new(server_key(), AES.MODE_EAX, nonce=nonce)
+    wrapped, tag = cipher.encrypt_and_digest(data_key)
+    return nonce + wrapped + tag
+
+
+def unwrap_data_key(blob):
+    blob = bytes(blob)
+    nonce, wrapped, tag = blob[:WRAP_NONCE_SIZE], blob[WRAP_NONCE_SIZE:-WRAP_TAG_SIZE], blob[-WRAP_TAG_SIZE:]
+    cipher = AES.new(server_key(), AES.MODE_EAX, nonce=nonce)
+    return cipher.decrypt_and_verify(wrapped, tag)
+
+
+def wrap_document_keys(users, data_keys):
+    """
+    Wraps every ``{document pk: data key}`` for each user with a public key,
+    as ``{user pk: {document pk (str): base64}}`` ready for ShipmentAccess.wrappedKeys.
+
+    A user whose public key cannot be used (not RSA, too small) is logged and
+    left out, as if they had none, instead of failing it for everyone else.
+    """
+    encrypt = AsyncEncrypt()
+    wrapped = {}
+    for user in users:
+        if not user.pubKey:
+            continue
+        try:
+            wrapped[user.pk] = {str(document_pk): base64.b64encode(encrypt.encrypt_key(user, data_key)).decode('ascii')
+                                for document_pk, data_key in data_keys.items()}
+        except ValueError as error:
+            logger.warning("Document keys not wrapped for user %s, their public key is unusable: %s", user.pk, error)
+    return wrapped
+
+
+def grant_access(shipment, users, access):
+    """
+    Gives ``users`` access to ``shipment`` and wraps every document key of the
+    shipment for each of them, without touching the encrypted files.
+
+    Runs a fixed number of queries however many users are granted access;
+    users without a public key get access rows but no wrapped keys.
+    """
+    from Hub.models import Documents, ShipmentAccess
+
+    data_keys = {
+        document_pk: unwrap_data_key(data_key)
+        for document_pk, data_key in Documents.objects.filter(shipmentId=shipment, dataKey__isnull=False)
+        .values_list('pk', 'dataKey')
+    }
+    wrapped = wrap_document_keys(users, data_keys)
+
+    with transaction.atomic():
+        existing = {row.userid_id: row for row in ShipmentAccess.objects.filter(shipment=shipment, userid__in=users)}
+        created, updated = [], []
+        for user in users:
+            row = existing.get(user.pk)
+            if row is None:
+                created.append(ShipmentAccess(userid=user, shipment=shipment, access=access,
+                                              wrappedKeys=wrapped.get(user.pk, {})))
+            else:
+                row.access = access
+                row.wrappedKeys = {**row.wrappedKeys, **wrapped.get(user.pk, {})}
+                updated.append(row)
+        ShipmentAccess.objects.bulk_create(created)
+        ShipmentAccess.objects.bulk_update(updated, ['access', 'wrappedKeys'])
+        access_changed.send(sender=ShipmentAccess, user_ids=[user.pk for user in users])
+    return created + updated
+
+
+def share_document(document):
+    """Wraps the key of a document added to an existing shipment for everyone who already has access to it."""
+    from Hub.models import ShipmentAccess
+
+    rows = list(ShipmentAccess.objects.select_related('userid').filter(shipment_id=document.shipmentId_id))
+    wrapped = wrap_document_keys([row.userid for row in rows], {document.pk: unwrap_data_key(document.dataKey)})
+    for row in rows:
+        row.wrappedKeys = {**row.wrappedKeys, **wrapped.get(row.userid_id, {})}
+    ShipmentAccess.objects.bulk_update(rows, ['wrappedKeys'])
@@ -0,0 +1,330 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.dispatch import Signal
+
+from Cryptography.Ledger import Ledger as engine
+
+# Entries are sealed into Merkle batches of this many leaves (a power of two,
+# so that every batch is a complete subtree of the ledger's tree)
+BATCH_SIZE = 1024
+
+APPEND_ATTEMPTS = 8
+
+# Sent inside the appending transaction with the new entries, oldest first
+ledger_appended = Signal()
+
+
+class LedgerIntegrityError(Exception):
+    pass
+
+
+def payload(entry):
+    return engine.canonical_payload(seq=entry.seq, user=entry.userId_id, shipment=entry.shipmentId_id,
+                                    event=entry.event, timestamp=entry.timestamp.isoformat())
+
+
+def compute_hash(entry):
+    prev_hash = bytes.fromhex(entry.prevHash) if entry.prevHash else engine.GENESIS
+    return engine.entry_hash(prev_hash, payload(entry))
+
+
+def leaf(entry_hash):
+    return engine.leaf_hash(bytes.fromhex(entry_hash))
+
+
+def append(events):
+    """
+    Appends ``events`` (an iterable of (user, shipment, event) tuples) to the
+    hash chain and returns the saved entries.
+    """
+    events = list(events)
+    if not events:
+        return []
+    # Only a transaction of our own can be retried; inside the caller's the error must propagate
+    owns_transaction = not connection.in_atomic_block
+    for attempt in range(APPEND_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _append(events)
+        except IntegrityError:
+            # Another writer took the same sequence numbers first
+            if attempt == APPEND_ATTEMPTS - 1:
+                raise
+        except OperationalError as e:
+            # SQLite refuses to upgrade a read lock while another writer holds the database
+            if not owns_transaction or 'locked' not in str(e) or attempt == APPEND_ATTEMPTS - 1:
+                raise
+            time.sleep(0.005 * 2 ** attempt)
+
+
+def append_event(user, shipment, event):
+    return append([(user, shipment, event)])[0]
+
+
+def record(user, shipment, event, durable=True):
+    """
+    Appends one event through the group-commit writer. With ``durable`` the
+    call returns the entry once its batch has committed; otherwise it returns
+    a Future at once.
+
+    Inside an atomic block the event is appended in the caller's own
+    transaction instead, so that it commits or rolls back with it.
+    """
+    if connection.in_atomic_block or not getattr(settings, 'LEDGER_GROUP_COMMIT', True):
+        future = Future()
+        future.set_result(append_event(user, shipment, event))
+    else:
+        future = get_writer().submit(user, shipment, event)
+    return future.result() if durable else future
+
+
+class LedgerWriter:
+    """
+    Collects events from any number of threads and appends them in batches
+    of up to ``max_batch``, one transaction (and one fsync) per batch.
+
+    A batch is whatever is queued when the writer gets to it, topped up for
+    at most ``max_delay`` seconds, so an idle writer adds little latency and
+    a busy one commits large batches.
+    """
+    _STOP = object()
+
+    def __init__(self, max_batch=1000, max_delay=0.002):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='LedgerWriter', daemon=True)
+        self.thread.start()
+
+    def submit(self, user, shipment, event):
+        future = Future()
+        self.queue.put(((user, shipment, event), future))
+        return future
+
+    def close(self):
+        """Commits everything queued so far and stops the writer."""
+        if self.thread.is_alive():
+            self.queue.put(self._STOP)
+            self.thread.join()
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                item = self.queue.get()
+                if item is self._STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        timeout = deadline - time.monotonic()
+                        if timeout <= 0:
+                            break
+                        try:
+                            item = self.queue.get(timeout=timeout)
+                        except queue.Empty:
+                            break
+                    if item is self._STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit(batch)
+        finally:
+            connection.close()
+
+    def _commit(self, batch):
+        batch = [(event, future) for event, future in batch if future.set_running_or_notify_cancel()]
+        try:
+            entries = append([event for event, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # Retry one by one so that a single bad event only fails its own caller
+            for item in batch:
+                self._commit_one(*item)
+        else:
+            for (_, future), entry in zip(batch, entries):
+                future.set_result(entry)
+
+    @staticmethod
+    def _commit_one(event, future):
+        try:
+            future.set_result(append([event])[0])
+        except Exception as e:
+            future.set_exception(e)
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer, _writer_pid
+    with _writer_lock:
+        # The writer thread does not survive a fork; each process gets its own
+        if _writer is None or _writer_pid != os.getpid() or not _writer.thread.is_alive():
+            _writer = LedgerWriter(getattr(settings, 'LEDGER_GROUP_COMMIT_SIZE', 1000),
+                                   getattr(settings, 'LEDGER_GROUP_COMMIT_DELAY', 0.002))
+            _writer_pid = os.getpid()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def _append(events):
+    from Hub.models import Ledger
+
+    head = (Ledger.manager.select_for_update().filter(seq__isnull=False).order_by('-seq')
+            .values_list('seq', 'entryHash').first())
+    seq, prev_hash = (head[0] + 1, head[1]) if head else (0, '')
+
+    entries = []
+    for user, shipment, event in events:
+        entry = Ledger(userId=user, shipmentId=shipment, event=event, seq=seq, prevHash=prev_hash)
+        entry.entryHash = compute_hash(entry).hex()
+        entries.append(entry)
+        seq, prev_hash = seq + 1, entry.entryHash
+    Ledger.manager.bulk_create(entries)
+
+    _seal_batches(entries[0].seq, seq)
+    ledger_appended.send(sender=Ledger, entries=entries)
+    return entries
+
+
+def _seal_batches(start, end):
+    from Hub.models import LedgerBatch
+
+    first, last = start // BATCH_SIZE, end // BATCH_SIZE
+    batches = [LedgerBatch(index=index, root=engine.root_of(_leaves(index * BATCH_SIZE, (index + 1) * BATCH_SIZE)).hex())
+               for index in range(first, last)]
+    LedgerBatch.manager.bulk_create(batches)
+
+
+def _leaves(start, end):
+    from Hub.models import Ledger
+
+    hashes = list(Ledger.manager.filter(seq__gte=start, seq__lt=end).order_by('seq')
+                  .values_list('entryHash', flat=True))
+    if len(hashes) != end - start:
+        raise LedgerIntegrityError(f"Ledger entries {start}..{end - 1} are incomplete")
+    return [leaf(entry_hash) for entry_hash in hashes]
+
+
+class _BatchCache:
+    """Serves subtrees made of whole sealed batches from the stored batch roots."""
+
+    def __init__(self):
+        self.memo = {}
+
+    def __call__(self, start, end):
+        from Hub.models import LedgerBatch
+
+        n = end - start
+        if n < BATCH_SIZE or n & (n - 1) or start % n:
+            return None
+        key = (start, end)
+        if key not in self.memo:
+            roots = list(LedgerBatch.manager.filter(index__gte=start // BATCH_SIZE, index__lt=end // BATCH_SIZE)
+                         .order_by('index').values_list('root', flat=True))
+            if len(roots) != n // BATCH_SIZE:
+                return None
+            self.memo[key] = engine.root_of([bytes.fromhex(root) for root in roots])
+        return self.memo[key]
+
+
+def size():
+    from Hub.models import Ledger
+
+    head = Ledger.manager.filter(seq__isnull=False).order_by('-seq').values_list('seq', flat=True).first()
+    return 0 if head is None else head + 1
+
+
+def tree(tree_size=None):
+    return engine.MerkleTree(size() if tree_size is None else tree_size, _leaves, _BatchCache())
+
+
+def checkpoint():
+    """Records (or returns the existing) tree head for the ledger as it stands now."""
+    from Hub.models import Ledger, LedgerCheckpoint
+
+    with transaction.atomic():
+        tree_size = size()
+        existing = LedgerCheckpoint.manager.filter(treeSize=tree_size).first()
+        if existing is not None:
+            return existing
+        head_hash = Ledger.manager.get(seq=tree_size - 1).entryHash if tree_size else ''
+        return LedgerCheckpoint.manager.create(treeSize=tree_size, root=tree(tree_size).root().hex(),
+                                               headHash=head_hash)
+
+
+def inclusion_proof(entry, head):
+    """Audit path (hex) proving ``entry`` is part of the tree behind checkpoint ``head``."""
+    return [node.hex() for node in tree(head.treeSize).inclusion_proof(entry.seq)]
+
+
+def consistency_proof(old, new):
+    """Proof (hex) that checkpoint ``new`` extends checkpoint ``old`` without rewriting it."""
+    return [node.hex() for node in tree(new.treeSize).consistency_proof(old.treeSize)]
+
+
+def verify_entry(entry, proof, head):
+    """
+    Checks ``entry`` against a checkpoint: its stored fields must hash to its
+    entryHash, and that hash must sit at position seq in the checkpoint's tree.
+    """
+    if entry.seq is None or compute_hash(entry).hex() != entry.entryHash:
+        return False
+    return engine.verify_inclusion(leaf(entry.entryHash), entry.seq, head.treeSize,
+                                   [bytes.fromhex(node) for node in proof], bytes.fromhex(head.root))
+
+
+def verify_consistency(old, new, proof):
+    return engine.verify_consistency(old.treeSize, new.treeSize, bytes.fromhex(old.root), bytes.fromhex(new.root),
+                                     [bytes.fromhex(node) for node in proof])
+
+
+def shipment_history(shipment, head=None):
+    """
+    Returns ``[(entry, proof)]`` for every event of ``shipment`` covered by
+    checkpoint ``head`` (a fresh one by default), ready for verify_entry.
+    """
+    from Hub.models import Ledger
+
+    head = head or checkpoint()
+    merkle = tree(head.treeSize)
+    entries = Ledger.manager.filter(shipmentId=shipment, seq__lt=head.treeSize).order_by('seq')
+    return [(entry, [node.hex() for node in merkle.inclusion_proof(entry.seq)]) for entry in entries]
+
+
+def verify_chain(chunk_size=BATCH_SIZE):
+    """
+    Full audit: walks the whole chain re-hashing every entry and every sealed
+    batch. Returns the seq of the first bad entry, or None.
+    """
+    from Hub.models import Ledger, LedgerBatch
+
+    prev_hash, expected_seq, batch = '', 0, []
+    batch_roots = dict(LedgerBatch.manager.values_list('index', 'root'))
+    for entry in Ledger.manager.filter(seq__isnull=False).order_by('seq').iterator(chunk_size=chunk_size):
+        if entry.seq != expected_seq or entry.prevHash != prev_hash or compute_hash(entry).hex() != entry.entryHash:
+            return expected_seq
+        batch.append(leaf(entry.entryHash))
+        if len(batch) == BATCH_SIZE:
+            index = entry.seq // BATCH_SIZE
+            if batch_roots.get(index) != engine.root_of(batch).hex():
+                return index * BATCH_SIZE
+            batch = []
+        prev_hash, expected_seq = entry.entryHash, expected_seq + 1
+    return None
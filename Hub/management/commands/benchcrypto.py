@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from Cryptography import Benchmark
+
+
+def csv(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = "Measures encryption/decryption throughput, RSA key wrapping and peak RSS, and emits JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=csv, default=list(Benchmark.DEFAULT_SIZES),
+                            help="Comma separated file sizes, e.g. 4KiB,1MiB,4GiB")
+        parser.add_argument('--segment-sizes', type=csv, default=list(Benchmark.DEFAULT_SEGMENT_SIZES),
+                            help="Comma separated segment/chunk sizes")
+        parser.add_argument('--formats', type=csv, default=list(Benchmark.FORMATS))
+        parser.add_argument('--backends', type=csv, default=None,
+                            help="Cipher backends to compare, defaults to every backend available on this host")
+        parser.add_argument('--codecs', type=csv, default=['none'],
+                            help="Compression codecs to compare; compressible sample data is used for any but 'none'")
+        parser.add_argument('--workers', type=lambda value: [int(item) for item in csv(value)], default=[1])
+        parser.add_argument('--rsa-bits', type=int, default=2048)
+        parser.add_argument('--rsa-operations', type=int, default=50)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        def progress(result):
+            self.stderr.write(json.dumps(result))
+
+        report = Benchmark.run(sizes=options['sizes'], segment_sizes=options['segment_sizes'],
+                               formats=options['formats'], workers=options['workers'],
+                               backends=options['backends'], codecs=options['codecs'], rsa_bits=options['rsa_bits'],
+                               rsa_operations=options['rsa_operations'], progress=progress)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
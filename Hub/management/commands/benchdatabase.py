@@ -0,0 +1,123 @@
+import itertools
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test import override_settings
+
+from Hub import database, models
+
+# Pragmas, and whether each thread keeps its connection, per configuration measured
+MODES = {
+    # What a plain NAME in DATABASES gets: rollback journal, fsync on every commit, a connection per request
+    'rollback_journal': ({'journal_mode': 'delete', 'synchronous': 'full'}, False),
+    'wal_reconnecting': (database.PRAGMAS, False),
+    'wal_persistent': (database.PRAGMAS, True),
+}
+
+
+class Command(BaseCommand):
+    help = ("Runs writer threads inserting shipments (one transaction each) alongside reader threads listing them, "
+            "against a throwaway on-disk test database, once per journal/pragma/connection configuration, "
+            "and reports operations per second and latencies as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--rows', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write("The benchmark needs SQLite")
+            return
+        workdir = tempfile.mkdtemp(prefix='benchdatabase')
+        # On disk rather than the usual in-memory test database, so that commits pay for their fsync
+        connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'database.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            models.Shipment.manager.bulk_create([self.shipment(f'F{i:014d}') for i in range(options['rows'])],
+                                                batch_size=1000)
+            # Shipment ids of the writers, unique across the modes
+            self.ids = itertools.count()
+            report = {key: options[key] for key in ('seconds', 'writers', 'readers', 'rows')}
+            for mode, (pragmas, persistent) in MODES.items():
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    # Reopened with the pragmas of the mode; the journal mode is changed on the file itself
+                    connection.close()
+                    with connection.cursor() as cursor:
+                        cursor.execute("PRAGMA journal_mode")
+                        journal = cursor.fetchone()[0]
+                    connection.close()
+                    report[mode] = {'journal_mode': journal, **self.measure(options, persistent)}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def shipment(shipment_id):
+        return models.Shipment(shipmentId=shipment_id, Shipper_Name='Bench Shipper', Shipment_Company='Bench Lines',
+                               Receiver_Name='Bench Receiver', Source='Chennai', Destination='Singapore',
+                               Cargo_Name='Tea', Cargo_Type=models.Shipment.CargoTypes.Fragile)
+
+    def measure(self, options, persistent):
+        deadline = time.perf_counter() + options['seconds']
+        timings = {'write': [], 'read': []}
+        errors = {'write': 0, 'read': 0}
+        lock = threading.Lock()
+
+        def write():
+            with lock:
+                shipment_id = f'W{next(self.ids):014d}'
+            self.shipment(shipment_id).save()
+
+        def read():
+            list(models.Shipment.manager.filter(Destination='Singapore').order_by('-pk')[:25])
+
+        def loop(kind, operation):
+            own, failed = [], 0
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        operation()
+                    except OperationalError:
+                        # Locked past busy_timeout
+                        failed += 1
+                    else:
+                        own.append((time.perf_counter() - started) * 1000)
+                    if not persistent:
+                        connection.close()
+            finally:
+                connection.close()
+            with lock:
+                timings[kind].extend(own)
+                errors[kind] += failed
+
+        threads = ([threading.Thread(target=loop, args=('write', write)) for _ in range(options['writers'])]
+                   + [threading.Thread(target=loop, args=('read', read)) for _ in range(options['readers'])])
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        result = {}
+        for kind, kind_timings in timings.items():
+            kind_timings.sort()
+            result[kind] = {
+                'per_s': len(kind_timings) / elapsed,
+                'median_ms': statistics.median(kind_timings) if kind_timings else None,
+                'p99_ms': kind_timings[int(len(kind_timings) * 0.99)] if kind_timings else None,
+                'errors': errors[kind],
+            }
+        return result
@@ -0,0 +1,118 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from Cryptography import Container
+from Hub import keys, models
+
+
+class Command(BaseCommand):
+    help = ("Downloads one encrypted document with N simultaneous clients through the WSGI view and the "
+            "async view, against a throwaway test database, and reports throughput as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--size', type=int, default=8 * 1024 * 1024, help="Document size in bytes")
+        parser.add_argument('--client-delay', type=float, default=0.005,
+                            help="Seconds a (slow) client waits between chunks")
+        parser.add_argument('--wsgi-threads', type=int, default=16,
+                            help="Worker threads available to the WSGI view, like a threaded WSGI server")
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp(prefix='benchdownloads')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                user, document = self.seed(options['size'])
+                report = {
+                    'clients': options['clients'],
+                    'size_bytes': options['size'],
+                    'client_delay_s': options['client_delay'],
+                    'wsgi': self.run_wsgi(user, document, options),
+                    'asgi': asyncio.run(self.run_asgi(user, document, options)),
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def seed(self, size):
+        user = get_user_model().objects.create_user(email='bench@example.com', password='bench', country='IN',
+                                                    phone_no='0')
+        shipment = models.Shipment.manager.create(shipmentId='BENCH', Shipper_Name='Bench', Shipment_Company='Bench',
+                                                  Receiver_Name='Bench', Source='Chennai', Destination='Singapore',
+                                                  Cargo_Name='Bench', Cargo_Type=models.Shipment.CargoTypes.Fragile)
+        models.ShipmentAccess.objects.create(userid=user, shipment=shipment)
+
+        key = os.urandom(32)
+        out = io.BytesIO()
+        with Container.SegmentWriter(out, key) as writer:
+            writer.write(os.urandom(size))
+        document = models.Documents(shipmentId=shipment, fileName='bench.pdf', dataKey=keys.wrap_data_key(key))
+        document.Cargo_Doc.save('bench.pdf.encrypted', ContentFile(out.getvalue()))
+        return user, document
+
+    @staticmethod
+    def summary(started, clients, received):
+        elapsed = time.perf_counter() - started
+        return {
+            'seconds': elapsed,
+            'requests_per_s': clients / elapsed,
+            'mb_per_s': received / elapsed / 1024 ** 2,
+        }
+
+    @staticmethod
+    def login(user):
+        # One session shared by every simulated client, so the run itself does no writes
+        client = Client()
+        client.force_login(user)
+        return client.cookies
+
+    def run_wsgi(self, user, document, options):
+        url = reverse('hub:DocumentDownload', args=[document.pk])
+        cookies = self.login(user)
+
+        def download(_):
+            client = Client()
+            client.cookies = cookies
+            received = 0
+            for chunk in client.get(url).streaming_content:
+                received += len(chunk)
+                time.sleep(options['client_delay'])
+            return received
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['wsgi_threads']) as pool:
+            received = sum(pool.map(download, range(options['clients'])))
+        return self.summary(started, options['clients'], received)
+
+    async def run_asgi(self, user, document, options):
+        url = reverse('hub:DocumentDownloadAsync', args=[document.pk])
+        client = AsyncClient()
+        client.cookies = await asyncio.to_thread(self.login, user)
+
+        async def download():
+            received = 0
+            response = await client.get(url)
+            async for chunk in response.streaming_content:
+                received += len(chunk)
+                await asyncio.sleep(options['client_delay'])
+            return received
+
+        started = time.perf_counter()
+        received = sum(await asyncio.gather(*(download() for _ in range(options['clients']))))
+        return self.summary(started, options['clients'], received)
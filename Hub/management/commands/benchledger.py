@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from Hub import ledger, models
+
+
+class Command(BaseCommand):
+    help = ("Appends ledger events from N threads one transaction per event and through the group-commit "
+            "writer, against a throwaway on-disk test database, and reports events per second as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=5000)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--delay', type=float, default=0.002)
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='benchledger')
+        # On disk rather than the usual in-memory test database, so that commits pay for their fsync
+        connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'ledger.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user = get_user_model().objects.create_user(email='bench@example.com', password='bench', country='IN',
+                                                        phone_no='0')
+            shipment = models.Shipment.manager.create(
+                shipmentId='BENCH', Shipper_Name='Bench', Shipment_Company='Bench', Receiver_Name='Bench',
+                Source='Chennai', Destination='Singapore', Cargo_Name='Bench',
+                Cargo_Type=models.Shipment.CargoTypes.Fragile)
+            event = (user, shipment, models.Ledger.Events.SHARED)
+
+            report = {'events': options['events'], 'threads': options['threads']}
+            # SQLite takes one writer at a time; without the lock the threads mostly measure lock retries
+            lock = threading.Lock()
+
+            def append_one():
+                with lock:
+                    ledger.append_event(*event)
+
+            report['per_event'] = self.measure(options, append_one)
+
+            writer = ledger.LedgerWriter(options['batch_size'], options['delay'])
+            report['group_commit_durable'] = self.measure(options, lambda: writer.submit(*event).result())
+            futures = []
+            report['group_commit_queued'] = self.measure(
+                options, lambda: futures.append(writer.submit(*event)), lambda: wait(futures))
+            writer.close()
+            report['chain_intact'] = ledger.verify_chain() is None
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def measure(options, append, drain=None):
+        def run(_):
+            try:
+                append()
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(run, range(options['events'])))
+        if drain:
+            drain()
+        elapsed = time.perf_counter() - started
+        return {'seconds': elapsed, 'events_per_s': options['events'] / elapsed}
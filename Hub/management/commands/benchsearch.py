@@ -0,0 +1,87 @@
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from Hub import models, search
+
+SYLLABLES = ('ka', 'ro', 'mi', 'tan', 'vel', 'su', 'ra', 'lo', 'den', 'pri', 'sha', 'mo', 'ti', 'nar', 'el', 'gu')
+PORTS = ('Chennai', 'Mumbai', 'Kolkata', 'Kochi', 'Singapore', 'Rotterdam', 'Dubai', 'Shanghai', 'Hamburg',
+         'Antwerp', 'Colombo', 'Busan', 'Santos', 'Durban', 'Felixstowe', 'Valencia')
+CARGO = ('Tea', 'Rice', 'Cotton', 'Spices', 'Steel Coils', 'Auto Parts', 'Textiles', 'Machinery', 'Pharmaceuticals',
+         'Electronics', 'Cashew', 'Granite', 'Leather Goods', 'Rubber', 'Coffee', 'Marine Products')
+
+
+class Command(BaseCommand):
+    help = ("Fills a throwaway on-disk test database with N shipments and times the FTS5 search against "
+            "icontains lookups for rare and common words, reporting milliseconds per query as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write("The search index needs SQLite")
+            return
+        rng = random.Random(options['seed'])
+        workdir = tempfile.mkdtemp(prefix='benchsearch')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'search.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            started = time.perf_counter()
+            names = self.fill(rng, options['rows'])
+            report = {'rows': options['rows'], 'fill_seconds': time.perf_counter() - started}
+
+            rare = [rng.choice(names) for _ in range(options['queries'])]
+            common = [rng.choice(PORTS) for _ in range(options['queries'])]
+            prefixes = [rng.choice(names)[:4] for _ in range(options['queries'])]
+            for label, texts in (('rare_word', rare), ('common_word', common), ('prefix', prefixes)):
+                report[label] = {
+                    'fts5': self.measure(texts, lambda text: search.search(text)),
+                    'icontains': self.measure(texts, lambda text: list(
+                        models.Shipment.manager.filter(search.contains_filter(text)).order_by('-pk')[:25])),
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def fill(rng, rows):
+        """Inserts ``rows`` shipments (through the index triggers) and returns the person names used."""
+        names = sorted({''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+                        for _ in range(max(rows // 20, 100))})
+        table = connection.ops.quote_name(models.Shipment._meta.db_table)
+        columns = ['shipmentId', 'Shipper_Name', 'Shipment_Company', 'Receiver_Name', 'Source', 'Destination',
+                   'Cargo_Name', 'Cargo_Type']
+        sql = (f"INSERT INTO {table} ({', '.join(connection.ops.quote_name(column) for column in columns)}) "
+               f"VALUES ({', '.join(['%s'] * len(columns))})")
+        cargo_types = models.Shipment.CargoTypes.values
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, rows, 10000):
+                cursor.executemany(sql, [
+                    (f'B{i:014d}', f'{rng.choice(names)} {rng.choice(names)}', f'{rng.choice(names)} Lines',
+                     f'{rng.choice(names)} {rng.choice(names)}', rng.choice(PORTS), rng.choice(PORTS),
+                     rng.choice(CARGO), rng.choice(cargo_types))
+                    for i in range(start, min(start + 10000, rows))
+                ])
+        return names
+
+    @staticmethod
+    def measure(texts, run):
+        timings = []
+        for text in texts:
+            started = time.perf_counter()
+            run(text)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {'median_ms': statistics.median(timings), 'max_ms': timings[-1]}
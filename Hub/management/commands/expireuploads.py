@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from Hub import uploadhandlers, uploads
+
+
+class Command(BaseCommand):
+    help = ("Deletes resumable uploads (and their stored chunks) that were opened long ago and never finalized, "
+            "and encrypted uploads left unattached")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24)
+
+    def handle(self, *args, **options):
+        age = timedelta(hours=options['hours'])
+        self.stdout.write(f"Deleted {uploads.expire(age)} abandoned upload(s)")
+        self.stdout.write(f"Deleted {uploadhandlers.expire_incoming(age)} unattached encrypted file(s)")
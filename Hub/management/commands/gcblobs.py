@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from Hub import blobs
+
+
+class Command(BaseCommand):
+    help = "Deletes stored document blobs that are no longer referenced by any document"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {blobs.collect_garbage()} unreferenced blob(s)")
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Hub import projections
+
+
+class Command(BaseCommand):
+    help = "Recomputes every shipment state and the approval queue from the ledger, e.g. after a backfill or a change to the projection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help="Processes replaying shipments in parallel")
+        parser.add_argument('--ignore-snapshots', action='store_true',
+                            help="Replay every event instead of resuming from stored snapshots")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = projections.rebuild(workers=options['workers'], use_snapshots=not options['ignore_snapshots'])
+        self.stdout.write(f"Rebuilt {count} shipment state(s) in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Hub import rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the report counters from the ledger, e.g. after a backfill or a new report dimension"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rollups.rebuild()
+        self.stdout.write(f"Rebuilt {count} counter(s) in {time.perf_counter() - started:.2f}s")
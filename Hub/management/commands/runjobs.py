@@ -0,0 +1,46 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from Hub import jobs
+
+
+def work(burst, poll):
+    # SIGTERM/SIGINT let the running job finish before the worker exits
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+    return jobs.work(burst=burst, poll=poll, stop=stop)
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs (see Hub.jobs) in one or more worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds to wait when no job is runnable")
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is runnable")
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            count = work(options['burst'], options['poll'])
+            self.stdout.write(f"Ran {count} job(s)")
+            return
+
+        # Every process opens its own database connection
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=work, args=(options['burst'], options['poll']))
+                     for _ in range(options['processes'])]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+                process.join()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Hub import ledger
+
+
+class Command(BaseCommand):
+    help = "Records a checkpoint (Merkle tree head) of the shipment ledger, optionally auditing the whole chain first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Re-hash every entry and sealed batch before recording the checkpoint")
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            bad = ledger.verify_chain()
+            if bad is not None:
+                raise CommandError(f"Ledger chain is broken at entry {bad}")
+            self.stdout.write("Ledger chain verified")
+        head = ledger.checkpoint()
+        self.stdout.write(f"Checkpoint: {head.treeSize} entries, root {head.root}")
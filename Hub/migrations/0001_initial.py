@@ -0,0 +1,209 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:19
+
+import Hub.identifiers
+import Hub.models
+import django.db.models.deletion
+import django.db.models.manager
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('manifest', models.TextField()),
+                ('size', models.BigIntegerField()),
+                ('blobFile', models.FileField(upload_to='')),
+                ('dataKey', models.BinaryField()),
+                ('refCount', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=64)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=10)),
+                ('priority', models.SmallIntegerField(default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('maxAttempts', models.PositiveSmallIntegerField(default=5)),
+                ('runAfter', models.DateTimeField(default=django.utils.timezone.now)),
+                ('progress', models.FloatField(default=0)),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('result', models.JSONField(null=True)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=64)),
+                ('heartbeatAt', models.DateTimeField(null=True)),
+                ('createdAt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finishedAt', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Ledger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('CREATE', 'Create'), ('APPROVED', 'Approved'), ('SHARED', 'Shared'), ('ACCESS_REQUEST', 'Access Request'), ('APPROVE_ACCESS', 'Approve Access'), ('APPROVE_REQUEST', 'Approve Request')], max_length=20)),
+                ('seq', models.PositiveBigIntegerField(editable=False, null=True, unique=True)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('prevHash', models.CharField(editable=False, max_length=64)),
+                ('entryHash', models.CharField(editable=False, max_length=64)),
+            ],
+            managers=[
+                ('manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveBigIntegerField(unique=True)),
+                ('root', models.CharField(max_length=64)),
+                ('sealedAt', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            managers=[
+                ('manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('treeSize', models.PositiveBigIntegerField(unique=True)),
+                ('root', models.CharField(max_length=64)),
+                ('headHash', models.CharField(max_length=64)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            managers=[
+                ('manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PendingApproval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requestedAt', models.DateTimeField()),
+                ('source', models.CharField(max_length=25)),
+                ('destination', models.CharField(max_length=25)),
+                ('cargoType', models.CharField(choices=[('Inflammable', 'Inflammable'), ('Fragile', 'Fragile'), ('Hazardous', 'Hazardous'), ('Live-stock', 'Live Stock'), ('Perishable', 'Perishable')], max_length=20)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Rollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=20)),
+                ('key', models.CharField(blank=True, max_length=64)),
+                ('day', models.DateField()),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Shipment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shipmentId', models.CharField(default=Hub.identifiers.new_shipment_id, max_length=20, unique=True)),
+                ('Shipper_Name', models.CharField(max_length=40)),
+                ('Shipment_Company', models.CharField(max_length=40)),
+                ('Receiver_Name', models.CharField(max_length=30)),
+                ('Source', models.CharField(max_length=25)),
+                ('Destination', models.CharField(max_length=25)),
+                ('Cargo_Name', models.CharField(max_length=35)),
+                ('Cargo_Type', models.CharField(choices=[('Inflammable', 'Inflammable'), ('Fragile', 'Fragile'), ('Hazardous', 'Hazardous'), ('Live-stock', 'Live Stock'), ('Perishable', 'Perishable')], max_length=20)),
+            ],
+            managers=[
+                ('manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShipmentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('access', models.CharField(choices=[('Owner', 'Owner'), ('Viewer', 'Viewer')], default='Owner', max_length=20)),
+                ('wrappedKeys', models.JSONField(default=dict, editable=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShipmentAccessRequests',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShipmentState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('CREATED', 'Created'), ('PENDING_APPROVAL', 'Pending Approval'), ('APPROVED', 'Approved')], default='CREATED', max_length=20)),
+                ('shares', models.PositiveIntegerField(default=0)),
+                ('pendingAccessRequests', models.PositiveIntegerField(default=0)),
+                ('eventCount', models.PositiveIntegerField(default=0)),
+                ('lastSeq', models.PositiveBigIntegerField(null=True)),
+                ('createdAt', models.DateTimeField(null=True)),
+                ('requestedAt', models.DateTimeField(null=True)),
+                ('approvedAt', models.DateTimeField(null=True)),
+                ('lastEventAt', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShipmentStateSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField()),
+                ('state', models.JSONField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Shipper',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            managers=[
+                ('manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('storedName', models.CharField(max_length=255)),
+                ('records', models.JSONField()),
+                ('manifest', models.TextField()),
+                ('nonce', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('fileName', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('chunkSize', models.PositiveIntegerField()),
+                ('header', models.BinaryField()),
+                ('dataKey', models.BinaryField()),
+                ('createdAt', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Documents',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Cargo_Doc', models.FileField(upload_to=Hub.models.getFileUploadPath)),
+                ('fileName', models.CharField(max_length=255, null=True)),
+                ('dataKey', models.BinaryField(null=True)),
+                ('digest', models.CharField(editable=False, max_length=64, null=True)),
+                ('blob', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='Hub.blob')),
+            ],
+        ),
+    ]
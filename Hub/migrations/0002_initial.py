@@ -0,0 +1,159 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('Hub', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='owner',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='ledger',
+            name='userId',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='LedgerUser', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='rollup',
+            index=models.Index(fields=['day'], name='rollup_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='rollup',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key', 'day'), name='unique_rollup'),
+        ),
+        migrations.AddField(
+            model_name='pendingapproval',
+            name='shipment',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pendingApproval', to='Hub.shipment'),
+        ),
+        migrations.AddField(
+            model_name='ledger',
+            name='shipmentId',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='LedgerShipment', to='Hub.shipment'),
+        ),
+        migrations.AddField(
+            model_name='documents',
+            name='shipmentId',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Hub.shipment'),
+        ),
+        migrations.AddField(
+            model_name='shipmentaccess',
+            name='shipment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Hub.shipment'),
+        ),
+        migrations.AddField(
+            model_name='shipmentaccess',
+            name='userid',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shipmentaccessrequests',
+            name='requester',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='Requester', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shipmentaccessrequests',
+            name='shipmentId',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ShipmentId', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shipmentstate',
+            name='shipment',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='state', to='Hub.shipment'),
+        ),
+        migrations.AddField(
+            model_name='shipmentstatesnapshot',
+            name='shipment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stateSnapshots', to='Hub.shipment'),
+        ),
+        migrations.AddField(
+            model_name='shipper',
+            name='shipment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Hub.shipment'),
+        ),
+        migrations.AddField(
+            model_name='shipper',
+            name='shipperId',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='document',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='Hub.documents'),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='shipment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Hub.shipment'),
+        ),
+        migrations.AddField(
+            model_name='uploadchunk',
+            name='session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='Hub.uploadsession'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', '-priority', 'runAfter', 'id'], name='job_queue'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['owner', '-id'], name='job_owner'),
+        ),
+        migrations.AddIndex(
+            model_name='pendingapproval',
+            index=models.Index(fields=['source', 'id'], name='pending_approval_source'),
+        ),
+        migrations.AddIndex(
+            model_name='pendingapproval',
+            index=models.Index(fields=['destination', 'id'], name='pending_approval_destination'),
+        ),
+        migrations.AddIndex(
+            model_name='pendingapproval',
+            index=models.Index(fields=['cargoType', 'id'], name='pending_approval_cargo_type'),
+        ),
+        migrations.AddIndex(
+            model_name='ledger',
+            index=models.Index(fields=['shipmentId', 'event'], name='ledger_shipment_event'),
+        ),
+        migrations.AddIndex(
+            model_name='ledger',
+            index=models.Index(fields=['shipmentId', 'seq'], name='ledger_shipment_seq'),
+        ),
+        migrations.AddConstraint(
+            model_name='shipmentaccess',
+            constraint=models.UniqueConstraint(fields=('userid', 'shipment'), name='unique_shipment_access'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentstate',
+            index=models.Index(fields=['status'], name='shipment_state_status'),
+        ),
+        migrations.AddConstraint(
+            model_name='shipmentstatesnapshot',
+            constraint=models.UniqueConstraint(fields=('shipment', 'seq'), name='unique_shipment_snapshot'),
+        ),
+        migrations.AddConstraint(
+            model_name='shipper',
+            constraint=models.UniqueConstraint(fields=('shipperId', 'shipment'), name='unique_shipper_shipment'),
+        ),
+        migrations.AddConstraint(
+            model_name='uploadchunk',
+            constraint=models.UniqueConstraint(fields=('session', 'index'), name='unique_upload_chunk'),
+        ),
+    ]
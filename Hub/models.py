@@ -1,7 +1,12 @@
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
+
+from Hub import identifiers
 
 
 # Create your models here.
@@ -13,7 +18,7 @@ class Shipment(models.Model):
         Live_stock = "Live-stock"
         Perishable = "Perishable"
 
-    shipmentId = models.CharField(name="shipmentId", max_length=20)
+    shipmentId = models.CharField(name="shipmentId", max_length=20, unique=True, default=identifiers.new_shipment_id)
     ShipperName = models.CharField(name="Shipper_Name", max_length=40)
     ShipmentCompany = models.CharField(name="Shipment_Company", max_length=40)
     ReceiverName = models.CharField(name="Receiver_Name", max_length=30)
@@ -35,18 +40,46 @@ def getFileUploadPath(instance , filename):
     return f"{instance.shipmentId.shipmentId}/{filename}"
 
 
+class Blob(models.Model):
+    """
+    Encrypted document content stored once and shared by every Documents row
+    with the same bytes. Deleted (file included) when the last reference goes.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    # SHA-256 of every CHUNK_SIZE piece of the plaintext, hex encoded and concatenated
+    manifest = models.TextField()
+    size = models.BigIntegerField()
+    blobFile = models.FileField()
+    dataKey = models.BinaryField(editable=False)
+    refCount = models.PositiveIntegerField(default=0)
+
+
 class Documents(models.Model):
     document = models.FileField(name="Cargo_Doc", upload_to=getFileUploadPath)
+    # Name the document was uploaded with; the stored file may be shared with other uploads
+    fileName = models.CharField(max_length=255, null=True)
+    blob = models.ForeignKey(to=Blob, null=True, on_delete=models.PROTECT)
+    # Segmented container key wrapped by Hub.keys; empty for documents stored in plaintext
+    dataKey = models.BinaryField(null=True, editable=False)
+    # SHA-256 of the plaintext, computed while the upload streamed in
+    digest = models.CharField(max_length=64, null=True, editable=False)
 
     shipmentId = models.ForeignKey(to=Shipment, on_delete=models.CASCADE)
 
 
+    def get_download_url(self):
+        return reverse('hub:DocumentDownload', args=[str(self.pk)])
+
+
 class Shipper(models.Model):
     shipperId = models.ForeignKey(to=get_user_model(), on_delete=models.CASCADE)
     shipment = models.ForeignKey(to=Shipment, on_delete=models.CASCADE)
 
     manager = models.Manager()
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['shipperId', 'shipment'], name='unique_shipper_shipment')]
+
 
 class ShipmentAccess(models.Model):
     class AccessLevels(models.TextChoices):
@@ -56,6 +89,11 @@ class ShipmentAccess(models.Model):
     userid = models.ForeignKey(to=get_user_model(), on_delete=models.CASCADE)
     shipment = models.ForeignKey(to=Shipment, on_delete=models.CASCADE)
     access = models.CharField(max_length=20, choices=AccessLevels.choices, default=AccessLevels.OWNER)
+    # Document data keys wrapped with the user's public key, as {document pk: base64}
+    wrappedKeys = models.JSONField(default=dict, editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['userid', 'shipment'], name='unique_shipment_access')]
 
 
 class ShipmentAccessRequests(models.Model):
@@ -72,9 +110,193 @@ class Ledger(models.Model):
         APPROVE_ACCESS = "APPROVE_ACCESS"
         APPROVE_REQUEST = "APPROVE_REQUEST"
 
-    userId = models.ForeignKey(to=get_user_model(),related_name='LedgerUser',on_delete=models.CASCADE)
-    shipmentId = models.ForeignKey(to=Shipment,related_name='LedgerShipment',on_delete=models.CASCADE)
+    # Entries outlive the users and shipments they mention; deleting them would break the hash chain
+    userId = models.ForeignKey(to=get_user_model(),related_name='LedgerUser',on_delete=models.DO_NOTHING,
+                               db_constraint=False)
+    shipmentId = models.ForeignKey(to=Shipment,related_name='LedgerShipment',on_delete=models.DO_NOTHING,
+                                   db_constraint=False)
     event = models.CharField(max_length=20,choices=Events.choices)
 
+    # Position in the hash chain and Merkle tree, assigned by Hub.ledger.append
+    seq = models.PositiveBigIntegerField(unique=True, null=True, editable=False)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    prevHash = models.CharField(max_length=64, editable=False)
+    entryHash = models.CharField(max_length=64, editable=False)
+
     manager = models.Manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['shipmentId', 'event'], name='ledger_shipment_event'),
+            # A shipment's history in ledger order, for proofs and projection replays
+            models.Index(fields=['shipmentId', 'seq'], name='ledger_shipment_seq'),
+        ]
+
+
+class LedgerBatch(models.Model):
+    """Merkle root of a full, aligned block of Hub.ledger.BATCH_SIZE ledger entries."""
+    index = models.PositiveBigIntegerField(unique=True)
+    root = models.CharField(max_length=64)
+    sealedAt = models.DateTimeField(default=timezone.now)
+
+    manager = models.Manager()
+
+
+class LedgerCheckpoint(models.Model):
+    """Signed-off tree head: the Merkle root over the first treeSize ledger entries."""
+    treeSize = models.PositiveBigIntegerField(unique=True)
+    root = models.CharField(max_length=64)
+    # entryHash of the last entry covered, i.e. the tip of the hash chain
+    headHash = models.CharField(max_length=64)
+    created = models.DateTimeField(default=timezone.now)
+
+    manager = models.Manager()
+
+
+class ShipmentState(models.Model):
+    """
+    Current state of a shipment folded from its ledger events by
+    Hub.projections; kept up to date as events are appended.
+    """
+    class Statuses(models.TextChoices):
+        CREATED = "CREATED"
+        PENDING_APPROVAL = "PENDING_APPROVAL"
+        APPROVED = "APPROVED"
+
+    shipment = models.OneToOneField(to=Shipment, related_name='state', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=Statuses.choices, default=Statuses.CREATED)
+    shares = models.PositiveIntegerField(default=0)
+    pendingAccessRequests = models.PositiveIntegerField(default=0)
+    eventCount = models.PositiveIntegerField(default=0)
+    # seq of the last ledger entry folded in; older entries are ignored when replayed
+    lastSeq = models.PositiveBigIntegerField(null=True)
+    createdAt = models.DateTimeField(null=True)
+    requestedAt = models.DateTimeField(null=True)
+    approvedAt = models.DateTimeField(null=True)
+    lastEventAt = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status'], name='shipment_state_status')]
+
+
+class PendingApproval(models.Model):
+    """
+    A shipment waiting for an authority's approval: added by Hub.projections
+    when its APPROVE_REQUEST is appended to the ledger and removed when it is
+    APPROVED, so the approval queue never grows with approved history.
+    """
+    shipment = models.OneToOneField(to=Shipment, related_name='pendingApproval', on_delete=models.CASCADE)
+    requestedAt = models.DateTimeField()
+    # Copied from the shipment so that a filtered queue is read in order off one index
+    source = models.CharField(max_length=25)
+    destination = models.CharField(max_length=25)
+    cargoType = models.CharField(max_length=20, choices=Shipment.CargoTypes.choices)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'id'], name='pending_approval_source'),
+            models.Index(fields=['destination', 'id'], name='pending_approval_destination'),
+            models.Index(fields=['cargoType', 'id'], name='pending_approval_cargo_type'),
+        ]
+
+
+class Rollup(models.Model):
+    """
+    Number of ledger events of one kind per report dimension value and day,
+    e.g. shipments created with cargo type Fragile on a date. Kept up to date
+    by Hub.rollups as events are appended.
+    """
+    dimension = models.CharField(max_length=20)
+    key = models.CharField(max_length=64, blank=True)
+    day = models.DateField()
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['dimension', 'key', 'day'], name='unique_rollup')]
+        indexes = [models.Index(fields=['day'], name='rollup_day')]
+
+
+class ShipmentStateSnapshot(models.Model):
+    """ShipmentState as of ledger entry seq, taken every Hub.projections.SNAPSHOT_INTERVAL events."""
+    shipment = models.ForeignKey(to=Shipment, related_name='stateSnapshots', on_delete=models.CASCADE)
+    seq = models.PositiveBigIntegerField()
+    state = models.JSONField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['shipment', 'seq'], name='unique_shipment_snapshot')]
+
+
+class UploadSession(models.Model):
+    """
+    A document uploaded in chunks by Hub.uploads: chunks arrive in any order,
+    each encrypted as it streams in, and finalizing assembles them into one
+    container attached to ``shipment`` as ``document``.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(to=get_user_model(), on_delete=models.CASCADE)
+    shipment = models.ForeignKey(to=Shipment, on_delete=models.CASCADE)
+    fileName = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # Plaintext bytes per chunk, a whole number of container segments
+    chunkSize = models.PositiveIntegerField()
+    # Container header the chunks are encrypted under, each with its own base nonce (see Cryptography.Container)
+    header = models.BinaryField(editable=False)
+    dataKey = models.BinaryField(editable=False)
+    createdAt = models.DateTimeField(default=timezone.now)
+    document = models.ForeignKey(to=Documents, null=True, on_delete=models.SET_NULL)
+
+
+class UploadChunk(models.Model):
+    """One received chunk of an UploadSession, stored encrypted until the session is finalized."""
+    session = models.ForeignKey(to=UploadSession, related_name='chunks', on_delete=models.CASCADE)
+    index = models.PositiveIntegerField()
+    storedName = models.CharField(max_length=255)
+    # Sizes of the encrypted segment records in the stored file
+    records = models.JSONField()
+    # Hashes of the plaintext segments, as in Blob.manifest
+    manifest = models.TextField()
+    # Base nonce this copy of the chunk was encrypted under, fresh for every attempt
+    nonce = models.BinaryField(editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['session', 'index'], name='unique_upload_chunk')]
+
+
+class Job(models.Model):
+    """
+    Work taken off the request path and run by Hub.jobs workers (the runjobs
+    command), e.g. assembling a resumable upload. Runnable jobs are claimed
+    highest priority first, and failed attempts are retried with backoff.
+    """
+    class Statuses(models.TextChoices):
+        QUEUED = "QUEUED"
+        RUNNING = "RUNNING"
+        DONE = "DONE"
+        FAILED = "FAILED"
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    # Who may see the job's status
+    owner = models.ForeignKey(to=get_user_model(), null=True, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=Statuses.choices, default=Statuses.QUEUED)
+    priority = models.SmallIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    maxAttempts = models.PositiveSmallIntegerField(default=5)
+    runAfter = models.DateTimeField(default=timezone.now)
+    # Fraction done, reported by the running task
+    progress = models.FloatField(default=0)
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=64, blank=True)
+    # Renewed while the job runs; a RUNNING job whose worker went quiet is queued again
+    heartbeatAt = models.DateTimeField(null=True)
+    createdAt = models.DateTimeField(default=timezone.now)
+    finishedAt = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # The next job to claim is read off this index in order
+            models.Index(fields=['status', '-priority', 'runAfter', 'id'], name='job_queue'),
+            models.Index(fields=['owner', '-id'], name='job_owner'),
+        ]
@@ -0,0 +1,167 @@
+import json
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Max, Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+CURSOR_SALT = 'Hub.paginators.cursor'
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class _CursorSerializer:
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), cls=DjangoJSONEncoder).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+def estimate_count(queryset):
+    """
+    Row count of an unfiltered queryset from the database's own statistics
+    instead of COUNT(*); None when no cheap estimate exists.
+    """
+    if queryset.query.where:
+        return None
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass"
+    elif connection.vendor == 'mysql':
+        sql = "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+    else:
+        sql = None
+    if sql is not None:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 until the table is first analysed
+        return row[0] if row and row[0] is not None and row[0] >= 0 else None
+    if model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+        # The highest auto-increment key is an index lookup; it over-counts deleted rows
+        return queryset.aggregate(estimate=Max('pk'))['estimate'] or 0
+    return None
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self.object_list)} object(s)>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Pages through ``queryset`` by position in ``ordering`` rather than by
+    offset: every page is "the next ``per_page`` rows after this key", which
+    is an index range read however deep the page is. ``ordering`` must end
+    in a unique, indexed field so that the order is total and stable.
+
+    Pages are addressed by opaque, signed cursor tokens holding the ordering
+    values of the row at the page boundary.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-pk',), count_estimate=False):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.count_estimate = count_estimate
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.queryset) if self.count_estimate else None
+
+    def order_by(self, reverse=False):
+        return [('-' if descending != reverse else '') + name for name, descending in self.ordering]
+
+    def values_of(self, obj):
+        return [getattr(obj, name if name == 'pk' else obj._meta.get_field(name).attname)
+                for name, _ in self.ordering]
+
+    def encode_cursor(self, obj, direction):
+        return signing.dumps([direction, self.values_of(obj)], salt=CURSOR_SALT, serializer=_CursorSerializer)
+
+    def decode_cursor(self, token):
+        try:
+            direction, values = signing.loads(token, salt=CURSOR_SALT, serializer=_CursorSerializer)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidCursor(token)
+        if direction not in (NEXT, PREVIOUS) or len(values) != len(self.ordering):
+            raise InvalidCursor(token)
+        return direction, values
+
+    def beyond(self, values, reverse=False):
+        """Rows strictly after ``values`` in the ordering (before them with ``reverse``)."""
+        conditions = []
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            equal = {field: value for (field, _), value in zip(self.ordering[:i], values[:i])}
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': values[i]}))
+        return reduce(or_, conditions)
+
+    def page(self, cursor=None):
+        direction, values = self.decode_cursor(cursor) if cursor else (NEXT, None)
+        reverse = direction == PREVIOUS
+        queryset = self.queryset if values is None else self.queryset.filter(self.beyond(values, reverse))
+        rows = list(queryset.order_by(*self.order_by(reverse))[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if more or reverse:
+                next_cursor = self.encode_cursor(rows[-1], NEXT)
+            if (more and reverse) or (values is not None and not reverse):
+                previous_cursor = self.encode_cursor(rows[0], PREVIOUS)
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin:
+    """Swaps ListView's offset pagination for keyset pagination; pages are chosen with ``?cursor=``."""
+    paginate_by = 25
+    page_ordering = ('-pk',)
+    page_count_estimate = False
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.page_ordering, self.page_count_estimate)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,273 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from multiprocessing import get_context
+from operator import or_
+
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_datetime
+
+# Every this many events of a shipment its folded state is also stored as a snapshot
+SNAPSHOT_INTERVAL = 100
+# Shipments replayed per query when rebuilding
+REBUILD_CHUNK_SIZE = 200
+
+STATE_FIELDS = ('status', 'shares', 'pendingAccessRequests', 'eventCount', 'lastSeq', 'createdAt', 'requestedAt',
+                'approvedAt', 'lastEventAt')
+DATETIME_FIELDS = ('createdAt', 'requestedAt', 'approvedAt', 'lastEventAt')
+
+
+def initial_state():
+    from Hub.models import ShipmentState
+
+    return {'status': ShipmentState.Statuses.CREATED, 'shares': 0, 'pendingAccessRequests': 0, 'eventCount': 0,
+            'lastSeq': None, 'createdAt': None, 'requestedAt': None, 'approvedAt': None, 'lastEventAt': None}
+
+
+def fold(state, entry):
+    """Applies one ledger entry to a state dict; entries already folded in are ignored."""
+    from Hub.models import Ledger, ShipmentState
+
+    if state['lastSeq'] is not None and entry.seq <= state['lastSeq']:
+        return False
+    event, timestamp = entry.event, entry.timestamp
+    if event in (Ledger.Events.CREATE, Ledger.Events.APPROVE_REQUEST):
+        state['createdAt'] = state['createdAt'] or timestamp
+    if event == Ledger.Events.APPROVE_REQUEST and state['status'] == ShipmentState.Statuses.CREATED:
+        state['status'] = ShipmentState.Statuses.PENDING_APPROVAL
+        state['requestedAt'] = timestamp
+    elif event == Ledger.Events.APPROVED:
+        state['status'] = ShipmentState.Statuses.APPROVED
+        state['approvedAt'] = timestamp
+    elif event == Ledger.Events.SHARED:
+        state['shares'] += 1
+    elif event == Ledger.Events.ACCESS_REQUEST:
+        state['pendingAccessRequests'] += 1
+    elif event == Ledger.Events.APPROVE_ACCESS:
+        state['pendingAccessRequests'] = max(0, state['pendingAccessRequests'] - 1)
+    state['eventCount'] += 1
+    state['lastSeq'] = entry.seq
+    state['lastEventAt'] = timestamp
+    return True
+
+
+def dump(state):
+    return {field: value.isoformat() if field in DATETIME_FIELDS and value else value
+            for field, value in state.items()}
+
+
+def load(data):
+    state = initial_state()
+    state.update({field: parse_datetime(value) if field in DATETIME_FIELDS and value else value
+                  for field, value in data.items() if field in state})
+    return state
+
+
+def shipments_of(entries):
+    """{shipment pk: Shipment} for ledger ``entries``; deleted shipments are left out."""
+    from Hub.models import Ledger, Shipment
+
+    # Appenders usually hold the shipments already
+    shipment_field = Ledger._meta.get_field('shipmentId')
+    shipments, missing = {}, set()
+    for entry in entries:
+        if shipment_field.is_cached(entry):
+            shipments[entry.shipmentId_id] = entry.shipmentId
+        else:
+            missing.add(entry.shipmentId_id)
+    missing.difference_update(shipments)
+    if missing:
+        shipments.update(Shipment.manager.in_bulk(list(missing)))
+    return shipments
+
+
+def pending_approval(shipment, requested_at):
+    from Hub.models import PendingApproval
+
+    return PendingApproval(shipment=shipment, requestedAt=requested_at, source=shipment.Source,
+                           destination=shipment.Destination, cargoType=shipment.Cargo_Type)
+
+
+def apply(entries):
+    """
+    Folds ``entries`` (ordered by seq) into the stored shipment states and the
+    pending-approval queue, at most two reads and five writes however many
+    shipments they touch.
+    """
+    from Hub.models import PendingApproval, ShipmentState, ShipmentStateSnapshot
+
+    by_shipment = OrderedDict()
+    for entry in entries:
+        by_shipment.setdefault(entry.shipmentId_id, []).append(entry)
+    if not by_shipment:
+        return
+
+    # Always runs inside the appending (or rebuilding) transaction; a savepoint would buy nothing
+    with transaction.atomic(savepoint=False):
+        rows = {row.shipment_id: row for row in
+                ShipmentState.objects.select_for_update().filter(shipment_id__in=list(by_shipment))}
+        created, updated, snapshots = [], [], []
+        queued, dequeued = {}, []
+        for shipment_id, events in by_shipment.items():
+            row = rows.get(shipment_id)
+            state = initial_state() if row is None else {field: getattr(row, field) for field in STATE_FIELDS}
+            was_pending = state['status'] == ShipmentState.Statuses.PENDING_APPROVAL
+            changed = False
+            for entry in events:
+                if fold(state, entry):
+                    changed = True
+                    if state['eventCount'] % SNAPSHOT_INTERVAL == 0:
+                        snapshots.append(ShipmentStateSnapshot(shipment_id=shipment_id, seq=entry.seq,
+                                                               state=dump(state)))
+            is_pending = state['status'] == ShipmentState.Statuses.PENDING_APPROVAL
+            if is_pending and not was_pending:
+                queued[shipment_id] = state['requestedAt']
+            elif was_pending and not is_pending:
+                dequeued.append(shipment_id)
+            if row is None:
+                created.append(ShipmentState(shipment_id=shipment_id, **state))
+            elif changed:
+                for field in STATE_FIELDS:
+                    setattr(row, field, state[field])
+                updated.append(row)
+
+        ShipmentState.objects.bulk_create(created)
+        ShipmentState.objects.bulk_update(updated, STATE_FIELDS)
+        ShipmentStateSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+
+        if dequeued:
+            PendingApproval.objects.filter(shipment_id__in=dequeued).delete()
+        if queued:
+            shipments = shipments_of(by_shipment[shipment_id][0] for shipment_id in queued)
+            PendingApproval.objects.bulk_create(
+                [pending_approval(shipments[shipment_id], requested_at)
+                 for shipment_id, requested_at in queued.items() if shipment_id in shipments],
+                ignore_conflicts=True)
+
+
+def state_of(shipment):
+    """The projected state of ``shipment`` (a single indexed read), or None before its first event."""
+    from Hub.models import ShipmentState
+
+    return ShipmentState.objects.filter(shipment=shipment).first()
+
+
+def status_counts(shipments=None):
+    """
+    ``{status: number of shipments}`` for a Shipment queryset, or for every
+    shipment, counted off the projection's status index.
+    """
+    from Hub.models import ShipmentState
+
+    states = ShipmentState.objects.all()
+    if shipments is not None:
+        states = states.filter(shipment__in=shipments)
+    counts = dict.fromkeys(ShipmentState.Statuses, 0)
+    counts.update(states.order_by().values_list('status').annotate(Count('pk')))
+    return counts
+
+
+def recent_states(shipments, limit):
+    """Projected states of the ``limit`` shipments of a queryset that changed last, with their shipments."""
+    from Hub.models import ShipmentState
+
+    return (ShipmentState.objects.filter(shipment__in=shipments).select_related('shipment')
+            .order_by('-lastEventAt')[:limit])
+
+
+def state_at(shipment, seq):
+    """State of ``shipment`` as of ledger entry ``seq``, replayed from the nearest snapshot."""
+    from Hub.models import Ledger, ShipmentStateSnapshot
+
+    snapshot = ShipmentStateSnapshot.objects.filter(shipment=shipment, seq__lte=seq).order_by('-seq').first()
+    state = initial_state() if snapshot is None else load(snapshot.state)
+    after = -1 if snapshot is None else snapshot.seq
+    for entry in Ledger.manager.filter(shipmentId=shipment, seq__gt=after, seq__lte=seq).order_by('seq'):
+        fold(state, entry)
+    return state
+
+
+def replay(shipment_ids, through, use_snapshots=True):
+    """Folds every entry before seq ``through`` for the given shipments; returns {shipment pk: state}."""
+    from Hub.models import Ledger, ShipmentStateSnapshot
+
+    states = {shipment_id: initial_state() for shipment_id in shipment_ids}
+    if use_snapshots:
+        for shipment_id, data in (ShipmentStateSnapshot.objects.filter(shipment_id__in=shipment_ids, seq__lt=through)
+                                  .order_by('shipment_id', '-seq').values_list('shipment_id', 'state')):
+            if states[shipment_id]['lastSeq'] is None:
+                states[shipment_id] = load(data)
+
+    # Only read the events after each shipment's snapshot
+    resume = [Q(shipmentId=shipment_id, seq__gt=state['lastSeq'])
+              for shipment_id, state in states.items() if state['lastSeq'] is not None]
+    fresh = [shipment_id for shipment_id, state in states.items() if state['lastSeq'] is None]
+    if fresh:
+        resume.append(Q(shipmentId__in=fresh))
+    if resume:
+        entries = (Ledger.manager.filter(reduce(or_, resume), seq__lt=through).order_by('seq')
+                   .only('seq', 'shipmentId', 'event', 'timestamp'))
+        for entry in entries.iterator(chunk_size=2000):
+            fold(states[entry.shipmentId_id], entry)
+    return states
+
+
+def _replay_chunks(chunks, through, use_snapshots):
+    states = {}
+    for chunk in chunks:
+        states.update(replay(chunk, through, use_snapshots))
+    return states
+
+
+def _replay_in_worker(chunks, through, use_snapshots):
+    # Runs in a worker process with its own database connection
+    try:
+        return _replay_chunks(chunks, through, use_snapshots)
+    finally:
+        connections.close_all()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def rebuild(workers=1, use_snapshots=True):
+    """
+    Recomputes every shipment state from the ledger, replaying shipments in
+    ``workers`` processes, and swaps the results in. Events appended while the
+    replay runs are folded in afterwards. Returns the number of states written.
+    """
+    from Hub import ledger
+    from Hub.models import Ledger, PendingApproval, Shipment, ShipmentState
+
+    through = ledger.size()
+    shipment_ids = list(Shipment.manager.order_by('pk').values_list('pk', flat=True))
+    chunks = [shipment_ids[i:i + REBUILD_CHUNK_SIZE] for i in range(0, len(shipment_ids), REBUILD_CHUNK_SIZE)]
+
+    states = {}
+    if workers > 1 and len(chunks) > 1:
+        # Workers must not share the parent's connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                                 initializer=_init_worker) as pool:
+            for result in pool.map(_replay_in_worker, [chunks[i::workers] for i in range(workers)],
+                                   [through] * workers, [use_snapshots] * workers):
+                states.update(result)
+    else:
+        states = _replay_chunks(chunks, through, use_snapshots)
+
+    rows = [ShipmentState(shipment_id=shipment_id, **state) for shipment_id, state in states.items()
+            if state['lastSeq'] is not None]
+    with transaction.atomic():
+        ShipmentState.objects.all().delete()
+        ShipmentState.objects.bulk_create(rows, batch_size=500)
+        PendingApproval.objects.all().delete()
+        PendingApproval.objects.bulk_create(
+            [pending_approval(state.shipment, state.requestedAt) for state in
+             ShipmentState.objects.filter(status=ShipmentState.Statuses.PENDING_APPROVAL)
+             .select_related('shipment').order_by('requestedAt', 'shipment_id').iterator(chunk_size=2000)],
+            batch_size=500)
+        apply(Ledger.manager.filter(seq__gte=through, shipmentId__in=Shipment.manager.values('pk')).order_by('seq'))
+    return len(rows)
@@ -0,0 +1,145 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import CharField, Count, F, Value
+from django.db.models.functions import Concat, TruncDate
+from django.utils import timezone
+
+# Report dimensions, each counting one ledger event
+SHIPMENTS = 'shipments'
+CARGO_TYPE = 'cargoType'
+LANE = 'lane'
+REQUESTS = 'requests'
+APPROVALS = 'approvals'
+
+LANE_SEPARATOR = ' → '
+
+
+def _sources():
+    """(dimension, counted event, key expression over the entry's shipment or None)."""
+    from Hub.models import Ledger
+
+    return (
+        (SHIPMENTS, Ledger.Events.CREATE, None),
+        (CARGO_TYPE, Ledger.Events.CREATE, F('shipmentId__Cargo_Type')),
+        (LANE, Ledger.Events.CREATE, Concat('shipmentId__Source', Value(LANE_SEPARATOR), 'shipmentId__Destination',
+                                            output_field=CharField())),
+        (REQUESTS, Ledger.Events.APPROVE_REQUEST, None),
+        (APPROVALS, Ledger.Events.APPROVED, None),
+    )
+
+
+def _key(dimension, shipment):
+    if dimension == CARGO_TYPE:
+        return shipment.Cargo_Type
+    if dimension == LANE:
+        return f"{shipment.Source}{LANE_SEPARATOR}{shipment.Destination}"
+    return ''
+
+
+def counts(entries):
+    """Counter of ``(dimension, key, day)`` for ledger ``entries``."""
+    from Hub import projections
+
+    entries = list(entries)
+    sources = _sources()
+    by_event = defaultdict(list)
+    for dimension, event, key in sources:
+        by_event[event].append((dimension, key is not None))
+
+    keyed = {event for event, dimensions in by_event.items() if any(needs for _, needs in dimensions)}
+    shipments = projections.shipments_of(entry for entry in entries if entry.event in keyed)
+
+    counter = Counter()
+    for entry in entries:
+        day = timezone.localdate(entry.timestamp)
+        for dimension, needs_shipment in by_event.get(entry.event, ()):
+            if needs_shipment:
+                shipment = shipments.get(entry.shipmentId_id)
+                if shipment is None:
+                    continue
+                counter[dimension, _key(dimension, shipment), day] += 1
+            else:
+                counter[dimension, '', day] += 1
+    return counter
+
+
+def apply(entries):
+    """
+    Adds ``entries`` to the stored counters: one read (two when the appender
+    did not hold the shipments) and at most two writes per call.
+    """
+    from Hub.models import Rollup
+
+    counter = counts(entries)
+    if not counter:
+        return
+
+    # Runs inside the appending transaction, which already serialises writers on the ledger head
+    with transaction.atomic(savepoint=False):
+        rows = Rollup.objects.select_for_update().filter(dimension__in={dimension for dimension, _, _ in counter},
+                                                         key__in={key for _, key, _ in counter},
+                                                         day__in={day for _, _, day in counter})
+        existing = {(row.dimension, row.key, row.day): row for row in rows}
+        created, updated = [], []
+        for (dimension, key, day), count in counter.items():
+            row = existing.get((dimension, key, day))
+            if row is None:
+                created.append(Rollup(dimension=dimension, key=key, day=day, count=count))
+            else:
+                row.count += count
+                updated.append(row)
+        Rollup.objects.bulk_create(created)
+        Rollup.objects.bulk_update(updated, ['count'])
+
+
+def rebuild():
+    """Recomputes every counter from the ledger with one GROUP BY per dimension; returns the rows written."""
+    from Hub.models import Ledger, Rollup
+
+    rows = []
+    with transaction.atomic():
+        # Hold the ledger head so that no append lands between the recount and the swap
+        Ledger.manager.select_for_update().filter(seq__isnull=False).order_by('-seq').values_list('seq').first()
+        for dimension, event, key in _sources():
+            queryset = Ledger.manager.filter(event=event).annotate(day=TruncDate('timestamp'))
+            if key is None:
+                queryset = queryset.annotate(key=Value('', output_field=CharField()))
+            else:
+                # An inner join: events of deleted shipments have nothing to be keyed by
+                queryset = queryset.annotate(key=key)
+            rows.extend(Rollup(dimension=dimension, key=row['key'], day=row['day'], count=row['count'])
+                        for row in queryset.values('key', 'day').annotate(count=Count('pk')).order_by())
+        Rollup.objects.all().delete()
+        Rollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def report(days=30, today=None):
+    """
+    Totals per dimension value and a per-day series of the last ``days``
+    days, from a single read of the pre-aggregated rows.
+    """
+    from Hub.models import Rollup
+
+    today = today or timezone.localdate()
+    since = today - timedelta(days=days - 1)
+    totals = defaultdict(Counter)
+    daily = {since + timedelta(days=offset): Counter() for offset in range(days)}
+    for dimension, key, day, count in Rollup.objects.filter(day__gte=since, day__lte=today).values_list(
+            'dimension', 'key', 'day', 'count'):
+        totals[dimension][key] += count
+        if not key:
+            daily[day][dimension] += count
+    return {
+        'since': since,
+        'until': today,
+        'shipments': totals[SHIPMENTS][''],
+        'requests': totals[REQUESTS][''],
+        'approvals': totals[APPROVALS][''],
+        'cargoTypes': totals[CARGO_TYPE].most_common(),
+        'lanes': totals[LANE].most_common(),
+        'daily': [(day, counter[SHIPMENTS], counter[REQUESTS], counter[APPROVALS])
+                  for day, counter in sorted(daily.items())],
+    }
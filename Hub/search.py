@@ -0,0 +1,119 @@
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.db import connections
+from django.db.models import Q
+
+# The FTS5 index over Shipment, kept in sync by triggers on the shipment table
+TABLE = 'hub_shipment_search'
+# bm25 weight of a match in each indexed field
+WEIGHTS = {
+    'shipmentId': 10.0,
+    'Shipper_Name': 4.0,
+    'Receiver_Name': 4.0,
+    'Cargo_Name': 3.0,
+    'Shipment_Company': 2.0,
+    'Source': 1.0,
+    'Destination': 1.0,
+}
+COLUMNS = tuple(WEIGHTS)
+# Matches scored per search, newest first
+RANKED_MATCHES = 2000
+# Words as the unicode61 tokenizer splits them
+WORD_PATTERN = re.compile(r'[^\W_]+')
+
+
+def _names(connection):
+    from Hub.models import Shipment
+
+    quote = connection.ops.quote_name
+    return quote(TABLE), quote(Shipment._meta.db_table), [quote(column) for column in COLUMNS]
+
+
+def install(connection):
+    """
+    Creates the search index and the triggers that maintain it, and fills it
+    from the existing shipments the first time. Safe to run repeatedly; does
+    nothing outside SQLite.
+    """
+    from Hub.models import Shipment
+
+    if connection.vendor != 'sqlite':
+        return False
+    table, shipments, columns = _names(connection)
+    listed = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    with connection.cursor() as cursor:
+        exists = TABLE in connection.introspection.table_names(cursor)
+        # External content: the index stores only the tokens and reads the text back from the shipment table
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({listed}, content='{Shipment._meta.db_table}', "
+                       f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON {shipments} BEGIN "
+                       f"INSERT INTO {table}(rowid, {listed}) VALUES (new.id, {new}); END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON {shipments} BEGIN "
+                       f"INSERT INTO {table}({table}, rowid, {listed}) VALUES ('delete', old.id, {old}); END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {TABLE}_update AFTER UPDATE ON {shipments} BEGIN "
+                       f"INSERT INTO {table}({table}, rowid, {listed}) VALUES ('delete', old.id, {old}); "
+                       f"INSERT INTO {table}(rowid, {listed}) VALUES (new.id, {new}); END")
+        if not exists:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+    return True
+
+
+def words(text):
+    return WORD_PATTERN.findall(text or '')
+
+
+def match_expression(text):
+    """An FTS5 query matching every word of ``text`` as a prefix, or None when it has no words."""
+    tokens = words(text)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def contains_filter(text):
+    """The same match as ``icontains`` lookups: every word in some indexed field."""
+    return reduce(and_, (reduce(or_, (Q(**{f'{column}__icontains': token}) for column in COLUMNS))
+                         for token in words(text)))
+
+
+def search(text, queryset=None, limit=25, offset=0):
+    """
+    Shipments of ``queryset`` (all by default) with a word starting with
+    each word of ``text``, best match among the newest RANKED_MATCHES
+    first, in one query. Outside SQLite falls back to ``icontains``
+    lookups, newest first.
+    """
+    from Hub.models import Shipment
+
+    queryset = Shipment.manager.all() if queryset is None else queryset
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    connection = connections[queryset.db]
+    if connection.vendor != 'sqlite':
+        return list(queryset.filter(contains_filter(text)).order_by('-pk')[offset:offset + limit])
+
+    table, shipments, _ = _names(connection)
+    weights = ', '.join(str(weight) for weight in WEIGHTS.values())
+    # Scoring every match of a common word costs more than the search itself: only the newest
+    # RANKED_MATCHES matches are scored, which FTS5 reads off its rowid order and stops
+    sql = f"SELECT rowid, bm25({table}, {weights}) AS score FROM {table} WHERE {table} MATCH %s"
+    params = [expression]
+    if queryset.query.where:
+        # Narrowed (e.g. to what the user may see) inside the same query
+        inner_sql, inner_params = queryset.values('pk').query.sql_with_params()
+        sql += f" AND rowid IN ({inner_sql})"
+        params.extend(inner_params)
+    sql = (f"SELECT {shipments}.* FROM ({sql} ORDER BY rowid DESC LIMIT %s) matches "
+           f"JOIN {shipments} ON {shipments}.id = matches.rowid ORDER BY matches.score, matches.rowid DESC "
+           f"LIMIT %s OFFSET %s")
+    params.extend([RANKED_MATCHES, limit, offset])
+    return list(Shipment.manager.db_manager(queryset.db).raw(sql, params))
+
+
+def install_index(sender, using, **kwargs):
+    install(connections[using])
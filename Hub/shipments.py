@@ -0,0 +1,59 @@
+from django.db import transaction
+
+from Hub import access, blobs, keys, ledger
+from Hub.uploadhandlers import EncryptedUploadedFile
+
+
+def create(owner, shipment, upload=None, reused=None):
+    """
+    Saves the unsaved ``shipment`` for ``owner`` together with its shipper
+    row, its document (a fresh ``upload`` or an already stored Blob
+    ``reused``, or none yet), the owner's access row and its CREATE and APPROVE_REQUEST
+    ledger events, all in one transaction and a fixed number of queries.
+    """
+    from Hub.models import Documents, Ledger, Shipper, ShipmentAccess
+
+    with transaction.atomic():
+        shipment.save(force_insert=True)
+        Shipper.manager.bulk_create([Shipper(shipperId=owner, shipment=shipment)])
+
+        if reused is not None:
+            blobs.reference(reused)
+            documents = [blobs.document_for(shipment, reused,
+                                            reused.documents_set.values_list('fileName', flat=True).first())]
+        elif isinstance(upload, EncryptedUploadedFile):
+            # Already encrypted by the upload handler; identical content is only stored once
+            documents = [blobs.document_for(shipment, blobs.store(upload), upload.name)]
+        elif upload is not None:
+            documents = [Documents(Cargo_Doc=upload, fileName=upload.name, shipmentId=shipment)]
+        else:
+            # Attached later by a resumable upload
+            documents = []
+        Documents.objects.bulk_create(documents)
+
+        data_keys = {document.pk: keys.unwrap_data_key(document.dataKey) for document in documents
+                     if document.dataKey is not None}
+        wrapped = keys.wrap_document_keys([owner], data_keys)
+        ShipmentAccess.objects.bulk_create([
+            ShipmentAccess(userid=owner, shipment=shipment, access=ShipmentAccess.AccessLevels.OWNER,
+                           wrappedKeys=wrapped.get(owner.pk, {}))
+        ])
+        access.access_changed.send(sender=ShipmentAccess, user_ids=[owner.pk])
+
+        ledger.append([(owner, shipment, Ledger.Events.CREATE), (owner, shipment, Ledger.Events.APPROVE_REQUEST)])
+    return shipment
+
+
+def approve(authority, shipments):
+    """
+    Approves those of ``shipments`` (primary keys, or a queryset of them)
+    that are waiting for approval, in one transaction and one ledger append
+    however many there are; returns the approved shipments.
+    """
+    from Hub.models import Ledger, PendingApproval
+
+    with transaction.atomic():
+        pending = list(PendingApproval.objects.select_for_update().select_related('shipment')
+                       .filter(shipment__in=shipments).order_by('pk'))
+        ledger.append([(authority, row.shipment, Ledger.Events.APPROVED) for row in pending])
+    return [row.shipment for row in pending]
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Hub import access, blobs, ledger, models, projections, rollups
+
+
+@receiver(post_delete, sender=models.Documents)
+def release_document_blob(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        blobs.release(instance.blob_id)
+
+
+@receiver(ledger.ledger_appended)
+def project_ledger_entries(sender, entries, **kwargs):
+    projections.apply(entries)
+
+
+@receiver(ledger.ledger_appended)
+def count_ledger_entries(sender, entries, **kwargs):
+    rollups.apply(entries)
+
+
+@receiver(post_save, sender=models.Shipment)
+def refresh_pending_approval(sender, instance, created, **kwargs):
+    # The queue keeps its own copy of the fields it is filtered by
+    if not created:
+        models.PendingApproval.objects.filter(shipment=instance).update(
+            source=instance.Source, destination=instance.Destination, cargoType=instance.Cargo_Type)
+
+
+@receiver(post_save, sender=models.ShipmentAccess)
+@receiver(post_delete, sender=models.ShipmentAccess)
+def invalidate_shipment_access(sender, instance, **kwargs):
+    access.invalidate([instance.userid_id])
+
+
+@receiver(access.access_changed)
+def invalidate_changed_access(sender, user_ids, **kwargs):
+    access.invalidate(user_ids)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_new_user(sender, instance, created, **kwargs):
+    # A new user may reuse the primary key of a deleted one
+    if created:
+        access.invalidate([instance.pk])
@@ -0,0 +1,450 @@
+import hashlib
+import io
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+from django.utils._os import safe_join
+from django.utils.functional import cached_property
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - boto3 is only needed for S3Storage
+    boto3 = None
+
+MB = 1024 * 1024
+
+
+def shard(name, depth=2, width=2):
+    """``name`` behind ``depth`` directories named after its hash, e.g. ``3f/a2/SHIP1/manifest.pdf``."""
+    digest = hashlib.sha256(name.encode()).hexdigest()
+    return posixpath.join(*(digest[i * width:(i + 1) * width] for i in range(depth)), name)
+
+
+class ShardedNamesMixin:
+    """
+    Puts every new file behind hash-named shard directories, so that no
+    directory (or object-store prefix) collects millions of siblings.
+    Names already stored are used as they are.
+    """
+    shard_depth = 2
+    shard_width = 2
+
+    def generate_filename(self, filename):
+        return shard(super().generate_filename(filename), self.shard_depth, self.shard_width)
+
+
+@deconstructible(path='Hub.storage.ShardedFileSystemStorage')
+class ShardedFileSystemStorage(ShardedNamesMixin, FileSystemStorage):
+    """
+    Local storage with a sharded layout, spread over MEDIA_ROOT and the
+    MEDIA_EXTRA_ROOTS directories (e.g. one per disk) by the hash of each
+    name. Adding a root moves where names live: existing files have to be
+    rebalanced when the list changes.
+    """
+
+    def __init__(self, location=None, extra_locations=None, **kwargs):
+        super().__init__(location=location, **kwargs)
+        self._extra_locations = extra_locations
+
+    @property
+    def roots(self):
+        extra = self._extra_locations
+        if extra is None:
+            extra = getattr(settings, 'MEDIA_EXTRA_ROOTS', ())
+        return [self.location] + [os.path.abspath(root) for root in extra]
+
+    def root_of(self, name):
+        roots = self.roots
+        if len(roots) == 1:
+            return roots[0]
+        return roots[int(hashlib.sha256(name.encode()).hexdigest()[:8], 16) % len(roots)]
+
+    def path(self, name):
+        return safe_join(self.root_of(name), name)
+
+    def _save(self, name, content):
+        # FileSystemStorage names the saved file relative to MEDIA_ROOT; make it relative to its own root
+        full_path = os.path.normpath(os.path.join(self.location, super()._save(name, content)))
+        root = next(root for root in self.roots if full_path.startswith(os.path.join(root, '')))
+        return os.path.relpath(full_path, root).replace('\\', '/')
+
+    def listdir(self, path):
+        directories, files = set(), set()
+        for root in self.roots:
+            full = os.path.join(root, path)
+            if os.path.isdir(full):
+                for entry in os.scandir(full):
+                    (directories if entry.is_dir() else files).add(entry.name)
+        return sorted(directories), sorted(files)
+
+    def open_writer(self, name):
+        return LocalWriter(self.path(name))
+
+    def move(self, old_name, new_name):
+        _move_local(self.path(old_name), self.path(new_name))
+
+
+class LocalWriter(io.FileIO):
+    """Writes a new local file; ``abort()`` removes what was written."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        super().__init__(path, 'wb')
+
+    def abort(self):
+        self.close()
+        os.remove(self.name)
+
+
+def _move_local(old_path, new_path):
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    # A rename when both are on one disk, a copy otherwise
+    shutil.move(old_path, new_path)
+
+
+def open_writer(storage, name):
+    """
+    A binary file to stream a new file ``name`` into: written as it goes
+    when the storage allows, kept once closed and dropped by ``abort()``.
+    """
+    if hasattr(storage, 'open_writer'):
+        return storage.open_writer(name)
+    try:
+        return LocalWriter(storage.path(name))
+    except NotImplementedError:
+        return SpooledWriter(storage, name)
+
+
+def move(storage, old_name, new_name):
+    """Renames a stored file, without reading it through the application when the storage can."""
+    if hasattr(storage, 'move'):
+        return storage.move(old_name, new_name)
+    try:
+        return _move_local(storage.path(old_name), storage.path(new_name))
+    except NotImplementedError:
+        pass
+    with storage.open(old_name, 'rb') as content:
+        storage.save(new_name, content)
+    storage.delete(old_name)
+
+
+class SpooledWriter(io.RawIOBase):
+    """Buffers a new file (in memory, then on disk) and saves it through any Storage when closed."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=8 * MB)
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.buffer.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.buffer.seek(offset, whence)
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def close(self):
+        if not self.closed:
+            self.buffer.seek(0)
+            self.storage.save(self.name, File(self.buffer, self.name))
+            self.buffer.close()
+        super().close()
+
+    def abort(self):
+        self.buffer.close()
+        super().close()
+
+
+@deconstructible(path='Hub.storage.S3Storage')
+class S3Storage(ShardedNamesMixin, Storage):
+    """
+    Stores files as objects in an S3 (or S3-compatible) bucket. Options come
+    from the S3_STORAGE setting unless passed in:
+
+    ``bucket``, ``prefix``, ``endpoint_url``, ``region_name``,
+    ``access_key``, ``secret_key``; ``max_pool_connections`` (HTTP
+    connections kept open per process), ``part_size`` and ``max_concurrency``
+    (size and number of multipart parts transferred at once).
+    """
+    defaults = {
+        'bucket': None,
+        'prefix': '',
+        'endpoint_url': None,
+        'region_name': None,
+        'access_key': None,
+        'secret_key': None,
+        'max_pool_connections': 32,
+        'part_size': 8 * MB,
+        'max_concurrency': 8,
+    }
+
+    def __init__(self, **options):
+        self._options = options
+
+    @cached_property
+    def options(self):
+        options = {**self.defaults, **getattr(settings, 'S3_STORAGE', {}), **self._options}
+        if not options['bucket']:
+            raise ImproperlyConfigured("S3Storage needs a bucket (S3_STORAGE['bucket'])")
+        return options
+
+    @cached_property
+    def client(self):
+        if boto3 is None:
+            raise ImproperlyConfigured("S3Storage needs boto3")
+        options = self.options
+        # Clients are thread-safe; one per storage shares its connection pool between threads
+        return boto3.session.Session().client(
+            's3', endpoint_url=options['endpoint_url'], region_name=options['region_name'],
+            aws_access_key_id=options['access_key'], aws_secret_access_key=options['secret_key'],
+            config=Config(max_pool_connections=options['max_pool_connections'],
+                          retries={'max_attempts': 5, 'mode': 'standard'}))
+
+    @cached_property
+    def transfer_config(self):
+        return TransferConfig(multipart_threshold=self.options['part_size'],
+                              multipart_chunksize=self.options['part_size'],
+                              max_concurrency=self.options['max_concurrency'])
+
+    @property
+    def bucket(self):
+        return self.options['bucket']
+
+    def key(self, name):
+        return posixpath.join(self.options['prefix'], name) if self.options['prefix'] else name
+
+    def head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(name) from None
+            raise
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError("S3 objects are written with save() or open_writer()")
+        raw = S3RangeReader(self, name)
+        return File(io.BufferedReader(raw, buffer_size=min(self.options['part_size'], 1 * MB)), name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        self.client.upload_fileobj(content, self.bucket, self.key(name), Config=self.transfer_config)
+        return name
+
+    def open_writer(self, name):
+        return S3Writer(self, name)
+
+    def move(self, old_name, new_name):
+        # Copied inside S3 (in parallel parts when large), never through this process
+        self.client.copy({'Bucket': self.bucket, 'Key': self.key(old_name)}, self.bucket, self.key(new_name),
+                         Config=self.transfer_config)
+        self.delete(old_name)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+
+    def exists(self, name):
+        try:
+            self.head(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, name):
+        return self.head(name)['ContentLength']
+
+    def get_modified_time(self, name):
+        return self.head(name)['LastModified']
+
+    def listdir(self, path):
+        prefix = self.key(path).rstrip('/') + '/' if path else self.key('')
+        directories, files = [], []
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix,
+                                                                           Delimiter='/'):
+            directories.extend(entry['Prefix'][len(prefix):].rstrip('/') for entry in page.get('CommonPrefixes', ()))
+            files.extend(entry['Key'][len(prefix):] for entry in page.get('Contents', ()))
+        return directories, files
+
+    def url(self, name):
+        return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': self.key(name)},
+                                                  ExpiresIn=3600)
+
+
+class S3RangeReader(io.RawIOBase):
+    """A seekable read-only view of an object, fetching only the byte ranges that are read."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.position = 0
+        self.length = storage.size(name)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.length + offset
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.length)
+        if end <= self.position:
+            return 0
+        response = self.storage.client.get_object(Bucket=self.storage.bucket, Key=self.storage.key(self.name),
+                                                  Range=f"bytes={self.position}-{end - 1}")
+        data = response['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class S3Writer(io.RawIOBase):
+    """
+    Streams a new object as a multipart upload: every ``part_size`` bytes
+    written become a part, uploaded by up to ``max_concurrency`` threads while
+    writing continues. Objects smaller than one part are a single PUT.
+
+    The first part is held back until the end, so that writers may seek
+    back into it to patch a header (as Cryptography.Container does).
+    """
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.part_size = storage.options['part_size']
+        self.head = bytearray()
+        self.pending = bytearray()
+        self.length = 0
+        self.position = 0
+        self.upload_id = None
+        self.parts = []
+        self.pool = None
+        # Bounds the parts held in memory to those being uploaded
+        self.slots = threading.BoundedSemaphore(storage.options['max_concurrency'])
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        position = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}[whence] + offset
+        if position != self.length and position > len(self.head):
+            raise io.UnsupportedOperation("Only the first part of an S3 upload can be rewritten")
+        self.position = position
+        return position
+
+    def write(self, data):
+        size = len(data)
+        if self.position < self.length:
+            if self.position + size > len(self.head):
+                raise io.UnsupportedOperation("Only the first part of an S3 upload can be rewritten")
+            self.head[self.position:self.position + size] = data
+            self.position += size
+            return size
+
+        view = memoryview(data)
+        if len(self.head) < self.part_size:
+            take = self.part_size - len(self.head)
+            self.head += view[:take]
+            view = view[take:]
+        self.pending += view
+        while len(self.pending) >= self.part_size:
+            part = bytes(self.pending[:self.part_size])
+            del self.pending[:self.part_size]
+            self._submit(part)
+        self.length += size
+        self.position = self.length
+        return size
+
+    def _start(self):
+        storage = self.storage
+        self.upload_id = storage.client.create_multipart_upload(Bucket=storage.bucket,
+                                                                 Key=storage.key(self.name))['UploadId']
+        self.pool = ThreadPoolExecutor(max_workers=storage.options['max_concurrency'])
+
+    def _submit(self, data, number=None):
+        if self.upload_id is None:
+            self._start()
+        self.slots.acquire()
+        # Part 1 is the held back head
+        number = number or len(self.parts) + 2
+        self.parts.append(self.pool.submit(self._upload_part, number, data))
+
+    def _upload_part(self, number, data):
+        storage = self.storage
+        try:
+            response = storage.client.upload_part(Bucket=storage.bucket, Key=storage.key(self.name),
+                                                  UploadId=self.upload_id, PartNumber=number, Body=data)
+            return {'PartNumber': number, 'ETag': response['ETag']}
+        finally:
+            self.slots.release()
+
+    def close(self):
+        if self.closed:
+            return
+        storage = self.storage
+        try:
+            if self.upload_id is None:
+                storage.client.put_object(Bucket=storage.bucket, Key=storage.key(self.name),
+                                          Body=bytes(self.head + self.pending))
+            else:
+                if self.pending:
+                    self._submit(bytes(self.pending))
+                self._submit(bytes(self.head), number=1)
+                parts = sorted((future.result() for future in self.parts), key=lambda part: part['PartNumber'])
+                storage.client.complete_multipart_upload(Bucket=storage.bucket, Key=storage.key(self.name),
+                                                         UploadId=self.upload_id, MultipartUpload={'Parts': parts})
+                self.pool.shutdown()
+        except BaseException:
+            self.abort()
+            raise
+        self.head = self.pending = bytearray()
+        super().close()
+
+    def abort(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        if self.upload_id is not None:
+            self.storage.client.abort_multipart_upload(Bucket=self.storage.bucket, Key=self.storage.key(self.name),
+                                                       UploadId=self.upload_id)
+            self.upload_id = None
+        self.head = self.pending = bytearray()
+        super().close()
@@ -1,3 +1,1625 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from Crypto.PublicKey import RSA
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import FileResponse
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from Cryptography import Container
+from Cryptography.Encryption import AsyncDecrypt, SyncDecrypt
+from Hub import (access, asyncviews, blobs, checks, database, downloads, identifiers, jobs, keys, ledger, models,
+                 paginators, projections, rollups, search, shipments, storage, uploadhandlers, uploads)
+from UserManagement.models import UserGroups
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:  # pragma: no cover - the S3 tests need boto3 and moto
+    boto3 = mock_aws = None
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+# Tests run with DEBUG off, where document keys need their own master key
+master_key = override_settings(DOCUMENT_MASTER_KEY='test document master key')
+
+
+def setUpModule():
+    master_key.enable()
+    # The access cache outlives test databases, whose primary keys start over
+    access.resolver.cache.clear()
+
+
+def tearDownModule():
+    master_key.disable()
+
+
+def make_shipment(**fields):
+    values = dict(shipmentId='SHIP000000000001', Shipper_Name='Shipper', Shipment_Company='Company',
+                  Receiver_Name='Receiver', Source='Chennai', Destination='Singapore', Cargo_Name='Cargo',
+                  Cargo_Type=models.Shipment.CargoTypes.Fragile)
+    values.update(fields)
+    return models.Shipment.manager.create(**values)
+
+
+class DocumentMixin:
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='shipper@example.com', password='secret',
+                                                         country='IN', phone_no='1')
+        self.shipment = make_shipment()
+        models.ShipmentAccess.objects.create(userid=self.user, shipment=self.shipment)
+        self.client.force_login(self.user)
+
+        self.plaintext = os.urandom(5 * 1024 + 17)
+        key = os.urandom(32)
+        out = io.BytesIO()
+        with Container.SegmentWriter(out, key, segment_size=1024) as writer:
+            writer.write(self.plaintext)
+        # Named like uploads are: the stored name gets a suffix once an earlier test left the same file behind
+        self.document = models.Documents(shipmentId=self.shipment, fileName='manifest.pdf',
+                                         dataKey=keys.wrap_data_key(key))
+        self.document.Cargo_Doc.save('manifest.pdf.encrypted', ContentFile(out.getvalue()))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DocumentDownloadTests(DocumentMixin, TestCase):
+
+    def get(self, **extra):
+        return self.client.get(reverse('hub:DocumentDownload', args=[self.document.pk]), **extra)
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(response.streaming_content), self.plaintext)
+
+    def test_range_download(self):
+        response = self.get(HTTP_RANGE='bytes=1000-3100')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-3100/{len(self.plaintext)}')
+        self.assertEqual(b''.join(response.streaming_content), self.plaintext[1000:3101])
+
+        response = self.get(HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.plaintext[-10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE=f'bytes={len(self.plaintext)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_stored_file_is_only_open_while_streaming(self):
+        opened = []
+        real_open = downloads.DocumentReader.open
+
+        def open_document(reader):
+            opened.append(real_open(reader))
+            return opened[-1]
+
+        with mock.patch.object(downloads.DocumentReader, 'open', open_document):
+            self.get(HTTP_RANGE=f'bytes={len(self.plaintext)}-')
+            response = self.get()
+            self.assertTrue(all(f.closed for f in opened))
+            # Dropped without being read, as for a HEAD request or a client that went away
+            response.close()
+            self.assertTrue(all(f.closed for f in opened))
+
+    def test_file_name_is_escaped(self):
+        models.Documents.objects.filter(pk=self.document.pk).update(fileName='a"; filename="evil.exe')
+        self.assertEqual(self.get()['Content-Disposition'], 'inline; filename="a\\"; filename=\\"evil.exe"')
+
+        models.Documents.objects.filter(pk=self.document.pk).update(fileName='manifeste-été.pdf')
+        self.assertEqual(self.get()['Content-Disposition'], "inline; filename*=utf-8''manifeste-%C3%A9t%C3%A9.pdf")
+
+    def test_requires_shipment_access(self):
+        other = get_user_model().objects.create_user(email='other@example.com', password='secret',
+                                                     country='IN', phone_no='2')
+        self.client.force_login(other)
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_decryption_reuses_pooled_buffers(self):
+        with mock.patch.object(downloads, 'buffers', downloads.BufferPool(idle=1)) as pool:
+            first, second = self.get(), self.get()
+            # Both stream at once, each with its own buffer
+            chunks = iter(first.streaming_content), iter(second.streaming_content)
+            next(chunks[0]), next(chunks[1])
+            self.assertEqual(pool.free, [])
+            for chunk in chunks:
+                list(chunk)
+            # Only ``idle`` buffers are kept
+            self.assertEqual(len(pool.free), 1)
+            buffer = pool.free[0]
+            self.assertEqual(b''.join(self.get().streaming_content), self.plaintext)
+            self.assertIs(pool.free[0], buffer)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CiphertextDownloadTests(DocumentMixin, TestCase):
+
+    def get(self):
+        return self.client.get(reverse('hub:DocumentCiphertext', args=[self.document.pk]))
+
+    def test_file_is_sent_as_stored(self):
+        models.ShipmentAccess.objects.filter(userid=self.user).update(wrappedKeys={str(self.document.pk): 'a2V5'})
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Length'], str(self.document.Cargo_Doc.size))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="manifest.pdf.encrypted"')
+        self.assertEqual(response['X-Document-Key'], 'a2V5')
+        with self.document.Cargo_Doc.open('rb') as f:
+            self.assertEqual(b''.join(response.streaming_content), f.read())
+
+    def test_file_name_is_escaped(self):
+        models.Documents.objects.filter(pk=self.document.pk).update(fileName='bill "final".pdf')
+        response = self.get()
+        response.close()
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bill \\"final\\".pdf.encrypted"')
+
+    def test_offloaded_to_the_front_end_server(self):
+        path = self.document.Cargo_Doc.path
+        with self.settings(DOCUMENT_OFFLOAD='x-accel-redirect', DOCUMENT_OFFLOAD_PREFIX='/protected'):
+            response = self.get()
+            self.assertEqual(response['X-Accel-Redirect'], '/protected' + path)
+            self.assertEqual(response.content, b'')
+        with self.settings(DOCUMENT_OFFLOAD='x-sendfile'):
+            self.assertEqual(self.get()['X-Sendfile'], path)
+        self.assertNotIn('X-Document-Key', response)
+
+    def test_object_storage_redirects_to_a_signed_url(self):
+        storage = self.document.Cargo_Doc.storage
+        with mock.patch.object(storage, 'path', side_effect=NotImplementedError), \
+                mock.patch.object(storage, 'url', return_value='https://s3.example.com/signed'):
+            response = self.get()
+        self.assertEqual((response.status_code, response['Location']), (302, 'https://s3.example.com/signed'))
+
+    def test_requires_shipment_access(self):
+        other = get_user_model().objects.create_user(email='other@example.com', password='secret',
+                                                     country='IN', phone_no='2')
+        self.client.force_login(other)
+        self.assertEqual(self.get().status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AsyncDocumentDownloadTests(DocumentMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+        self.url = reverse('hub:DocumentDownloadAsync', args=[self.document.pk])
+
+    async def download(self, **extra):
+        response = await self.async_client.get(self.url, **extra)
+        return response, b''.join([chunk async for chunk in response.streaming_content])
+
+    def store(self, plaintext):
+        key = os.urandom(32)
+        out = io.BytesIO()
+        with Container.SegmentWriter(out, key) as writer:
+            writer.write(plaintext)
+        document = models.Documents(shipmentId=self.shipment, fileName='stowage.pdf', dataKey=keys.wrap_data_key(key))
+        document.Cargo_Doc.save('stowage.pdf.encrypted', ContentFile(out.getvalue()))
+        return reverse('hub:DocumentDownloadAsync', args=[document.pk])
+
+    async def test_simultaneous_downloads(self):
+        plaintext = os.urandom(4 * Container.DEFAULT_SEGMENT_SIZE + 17)
+        self.url = await sync_to_async(self.store)(plaintext)
+
+        loop_thread = threading.get_ident()
+        lock = threading.Lock()
+        running, peak, threads = 0, 0, set()
+        decrypt_segment = Container.decrypt_segment
+
+        def tracked_decrypt(*args):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+                threads.add((threading.get_ident(), threading.current_thread().name))
+            try:
+                # Long enough for the other downloads to queue up behind it
+                time.sleep(0.002)
+                return decrypt_segment(*args)
+            finally:
+                with lock:
+                    running -= 1
+
+        with override_settings(ASYNC_CRYPTO_WORKERS=2), mock.patch.object(asyncviews, '_executor', None), \
+                mock.patch.object(Container, 'decrypt_segment', tracked_decrypt):
+            try:
+                results = await asyncio.gather(*(self.download() for _ in range(20)))
+            finally:
+                asyncviews.crypto_executor().shutdown()
+
+        for response, content in results:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(content, plaintext)
+        # Every segment was decrypted on the bounded crypto pool, never on the event loop
+        self.assertEqual(peak, 2)
+        self.assertNotIn(loop_thread, {ident for ident, _ in threads})
+        self.assertTrue(all(name.startswith('crypto') for _, name in threads))
+
+    async def test_range_download(self):
+        response, content = await self.download(headers={'Range': 'bytes=2000-2999'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, self.plaintext[2000:3000])
+
+    async def test_anonymous_user_is_redirected_to_login(self):
+        response = await AsyncClient().get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+class ShipmentUploadMixin:
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='shipper@example.com', password='secret',
+                                                         country='IN', phone_no='1')
+        self.client.force_login(self.user)
+
+    def create_shipment(self, **fields):
+        data = {
+            'Shipper_Name': 'Shipper', 'Shipment_Company': 'Company', 'Receiver_Name': 'Receiver',
+            'Source': 'Chennai', 'Destination': 'Singapore', 'Cargo_Name': 'Cargo',
+            'Cargo_Type': models.Shipment.CargoTypes.Fragile,
+        }
+        data.update(fields)
+        return self.client.post(reverse('hub:NewShipment'), data)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class EncryptingUploadTests(ShipmentUploadMixin, TestCase):
+
+    def test_upload_is_encrypted_into_place(self):
+        plaintext = os.urandom(3 * Container.DEFAULT_SEGMENT_SIZE + 11)
+        response = self.create_shipment(document=SimpleUploadedFile('manifest.pdf', plaintext))
+        self.assertEqual(response.status_code, 302)
+
+        document = models.Documents.objects.get()
+        self.assertEqual(document.fileName, 'manifest.pdf')
+        self.assertEqual(document.digest, hashlib.sha256(plaintext).hexdigest())
+        self.assertEqual(document.Cargo_Doc.name, blobs.blob_name(document.digest))
+        self.assertEqual(len(document.blob.manifest), 4 * 64)
+
+        path = document.Cargo_Doc.path
+        with open(path, 'rb') as f:
+            self.assertTrue(Container.is_container(f.read(4)))
+        decrypted = b''.join(SyncDecrypt().decrypt_chunks(path, keys.unwrap_data_key(document.dataKey)))
+        self.assertEqual(decrypted, plaintext)
+
+    def incoming(self):
+        return [name for directory, _, files in os.walk(MEDIA_ROOT) if os.path.basename(directory) == 'incoming'
+                for name in files]
+
+    def test_rejected_uploads_are_discarded(self):
+        # Invalid form
+        response = self.create_shipment(Cargo_Name='', document=SimpleUploadedFile('manifest.pdf', b'manifest'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.incoming(), [])
+
+        # Failed while saving
+        with mock.patch.object(shipments, 'create', side_effect=RuntimeError("database unavailable")), \
+                self.assertRaises(RuntimeError):
+            self.create_shipment(document=SimpleUploadedFile('manifest.pdf', b'manifest'))
+        self.assertEqual(self.incoming(), [])
+        self.assertFalse(models.Documents.objects.exists())
+
+    def test_csrf_is_checked_after_encryption_is_set_up(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        data = {'document': SimpleUploadedFile('manifest.pdf', b'manifest')}
+        self.assertEqual(client.post(reverse('hub:NewShipment'), data).status_code, 403)
+        self.assertEqual(self.incoming(), [])
+
+        # Other views parse uploads with the default handlers
+        with mock.patch('Hub.uploadhandlers.EncryptingUploadHandler.new_file') as new_file:
+            data = {'document': SimpleUploadedFile('manifest.pdf', b'manifest')}
+            self.assertEqual(client.post(reverse('hub:About'), data).status_code, 403)
+        new_file.assert_not_called()
+
+    def test_unattached_files_expire(self):
+        storage = models.Documents._meta.get_field('Cargo_Doc').storage
+        old, new = (storage.save(uploadhandlers.incoming_name(storage), ContentFile(b'x')) for _ in range(2))
+        stale = (timezone.now() - timedelta(days=2)).timestamp()
+        os.utime(storage.path(old), (stale, stale))
+
+        self.assertEqual(uploadhandlers.expire_incoming(timedelta(hours=1)), 1)
+        self.assertFalse(storage.exists(old))
+        self.assertTrue(storage.exists(new))
+        storage.delete(new)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AsyncShipmentUploadTests(ShipmentUploadMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+
+    async def upload(self, plaintext):
+        data = {
+            'Shipper_Name': 'Shipper', 'Shipment_Company': 'Company', 'Receiver_Name': 'Receiver',
+            'Source': 'Chennai', 'Destination': 'Singapore', 'Cargo_Name': 'Cargo',
+            'Cargo_Type': models.Shipment.CargoTypes.Fragile, 'document': SimpleUploadedFile('manifest.pdf', plaintext),
+        }
+        return await self.async_client.post(reverse('hub:NewShipmentAsync'), data)
+
+    async def test_simultaneous_uploads_are_encrypted_side_by_side(self):
+        lock = threading.Lock()
+        running, peak, threads = 0, 0, set()
+        receive_data_chunk = uploadhandlers.EncryptingUploadHandler.receive_data_chunk
+
+        def tracked_receive(handler, raw_data, start):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+                threads.add(threading.current_thread().name)
+            try:
+                time.sleep(0.01)
+                return receive_data_chunk(handler, raw_data, start)
+            finally:
+                with lock:
+                    running -= 1
+
+        plaintexts = [os.urandom(3 * Container.DEFAULT_SEGMENT_SIZE) for _ in range(2)]
+        with override_settings(ASYNC_CRYPTO_WORKERS=2), mock.patch.object(asyncviews, '_executor', None), \
+                mock.patch.object(uploadhandlers.EncryptingUploadHandler, 'receive_data_chunk', tracked_receive):
+            try:
+                responses = await asyncio.gather(*(self.upload(plaintext) for plaintext in plaintexts))
+            finally:
+                asyncviews.crypto_executor().shutdown()
+
+        self.assertEqual([response.status_code for response in responses], [302, 302])
+        digests = {document.digest async for document in models.Documents.objects.all()}
+        self.assertEqual(digests, {hashlib.sha256(plaintext).hexdigest() for plaintext in plaintexts})
+        # Both uploads were being encrypted at once, on the crypto pool
+        self.assertEqual(peak, 2)
+        self.assertTrue(all(name.startswith('crypto') for name in threads))
+
+    async def test_bodies_that_would_spill_to_disk_are_refused_unread(self):
+        handler = asyncviews.BodyInMemoryASGIHandler()
+        for headers in ([(b'content-length', str(settings.FILE_UPLOAD_MAX_MEMORY_SIZE + 1).encode())],
+                        [(b'transfer-encoding', b'chunked')]):
+            receive, sent = mock.AsyncMock(), []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'method': 'POST', 'path': reverse('hub:NewShipmentAsync'), 'headers': headers}
+            await handler.handle(scope, receive, send)
+            self.assertEqual(sent[0]['status'], 413)
+            receive.assert_not_awaited()
+
+        # Only views that ask for it
+        scope = {'type': 'http', 'method': 'PUT', 'path': reverse('hub:UploadSessions'), 'headers': []}
+        self.assertFalse(handler.body_must_stay_in_memory(scope))
+
+
+
+class GrantAccessTests(TestCase):
+
+    def test_document_master_key_is_required_outside_debug(self):
+        with override_settings(DOCUMENT_MASTER_KEY=None):
+            with self.assertRaises(ImproperlyConfigured):
+                keys.server_key()
+            self.assertEqual([error.id for error in checks.check_document_master_key_deploy(None)], ['Hub.E001'])
+            with override_settings(DEBUG=True):
+                self.assertEqual(len(keys.server_key()), 32)
+                self.assertEqual([warning.id for warning in checks.check_document_master_key(None)],
+                                 ['Hub.W002'])
+        self.assertEqual(checks.check_document_master_key_deploy(None), [])
+
+    def test_wraps_document_keys_for_many_viewers(self):
+        private_key = RSA.generate(1024)
+        User = get_user_model()
+        viewers = User.objects.bulk_create([
+            User(email=f'viewer{i}@example.com', password=make_password(None), country='IN', phone_no=str(i),
+                 pubKey=private_key.publickey().export_key().decode())
+            for i in range(50)
+        ])
+        shipment = make_shipment()
+        data_key = os.urandom(32)
+        document = models.Documents.objects.create(Cargo_Doc='documents/x/manifest.pdf.encrypted',
+                                                   dataKey=keys.wrap_data_key(data_key), shipmentId=shipment)
+
+        # documents, existing rows, bulk insert (plus the savepoint pair)
+        with self.assertNumQueries(5):
+            keys.grant_access(shipment, viewers, models.ShipmentAccess.AccessLevels.VIEWER)
+
+        rows = models.ShipmentAccess.objects.filter(shipment=shipment)
+        self.assertEqual(rows.count(), 50)
+        for row in rows:
+            wrapped = base64.b64decode(row.wrappedKeys[str(document.pk)])
+            self.assertEqual(AsyncDecrypt().decrypt_key(private_key, wrapped), data_key)
+
+    def test_unusable_public_key_is_skipped(self):
+        private_key = RSA.generate(1024)
+        User = get_user_model()
+        good, bad = User.objects.bulk_create([
+            User(email='good@example.com', password=make_password(None), country='IN', phone_no='1',
+                 pubKey=private_key.publickey().export_key().decode()),
+            User(email='bad@example.com', password=make_password(None), country='IN', phone_no='2',
+                 pubKey='-----BEGIN PUBLIC KEY-----\nnot a key\n-----END PUBLIC KEY-----'),
+        ])
+        shipment = make_shipment()
+        document = models.Documents.objects.create(Cargo_Doc='documents/x/manifest.pdf.encrypted',
+                                                   dataKey=keys.wrap_data_key(os.urandom(32)), shipmentId=shipment)
+
+        with self.assertLogs('Hub.keys', 'WARNING'):
+            keys.grant_access(shipment, [good, bad], models.ShipmentAccess.AccessLevels.VIEWER)
+
+        rows = {row.userid_id: row.wrappedKeys for row in models.ShipmentAccess.objects.filter(shipment=shipment)}
+        self.assertEqual(list(rows[good.pk]), [str(document.pk)])
+        self.assertEqual(rows[bad.pk], {})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DeduplicationTests(ShipmentUploadMixin, TestCase):
+
+    def test_identical_documents_are_stored_once(self):
+        plaintext = os.urandom(100 * 1024)
+        for _ in range(3):
+            self.create_shipment(document=SimpleUploadedFile('certificate.pdf', plaintext))
+
+        blob = models.Blob.objects.get()
+        self.assertEqual(blob.refCount, 3)
+        self.assertEqual(models.Documents.objects.filter(blob=blob).count(), 3)
+        self.assertEqual(os.listdir(os.path.dirname(blob.blobFile.path)), [os.path.basename(blob.blobFile.name)])
+        # The other two uploads were discarded
+        self.assertEqual([files for directory, _, files in os.walk(MEDIA_ROOT)
+                          if os.path.basename(directory) == 'incoming' and files], [])
+
+        path = blob.blobFile.path
+        shipments = list(models.Shipment.manager.all())
+        with self.captureOnCommitCallbacks(execute=True):
+            shipments[0].delete()
+        self.assertEqual(models.Blob.objects.get().refCount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for shipment in shipments[1:]:
+                shipment.delete()
+        self.assertFalse(models.Blob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_rolled_back_store_leaves_no_blob_file(self):
+        storage = models.Blob._meta.get_field('blobFile').storage
+        stored_name = storage.save(uploadhandlers.incoming_name(storage), ContentFile(b'ciphertext'))
+        digest = hashlib.sha256(b'plaintext').hexdigest()
+        upload = uploadhandlers.EncryptedUploadedFile('scan.pdf', stored_name, os.urandom(32), digest, digest,
+                                                      'application/pdf', 9, None, {})
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            blob = blobs.store(upload)
+            self.assertTrue(storage.exists(blob.blobFile.name))
+            raise RuntimeError
+        self.assertFalse(models.Blob.objects.exists())
+        self.assertFalse(storage.exists(blobs.blob_name(digest)))
+        self.assertFalse(storage.exists(stored_name))
+
+    def test_known_document_is_attached_by_digest(self):
+        plaintext = b'certificate of origin' * 100
+        self.create_shipment(document=SimpleUploadedFile('certificate.pdf', plaintext))
+
+        response = self.create_shipment(documentDigest=hashlib.sha256(plaintext).hexdigest())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(models.Blob.objects.get().refCount, 2)
+        self.assertEqual(list(models.Documents.objects.values_list('fileName', flat=True)),
+                         ['certificate.pdf', 'certificate.pdf'])
+
+    def test_digest_of_someone_elses_document_is_refused(self):
+        plaintext = b'certificate of origin' * 100
+        self.create_shipment(document=SimpleUploadedFile('certificate.pdf', plaintext))
+
+        other = get_user_model().objects.create_user(email='other@example.com', password='secret',
+                                                     country='IN', phone_no='2')
+        self.client.force_login(other)
+        response = self.create_shipment(documentDigest=hashlib.sha256(plaintext).hexdigest())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.Documents.objects.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, UPLOAD_CHUNK_SIZE=2 * Container.DEFAULT_SEGMENT_SIZE)
+class ResumableUploadTests(ShipmentUploadMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_shipment(document=SimpleUploadedFile('invoice.pdf', b'invoice' * 100))
+        self.shipment = models.Shipment.manager.get()
+        # Random segments stay raw, repeated ones are compressed: records of both sizes
+        segment = Container.DEFAULT_SEGMENT_SIZE
+        self.plaintext = os.urandom(3 * segment) + b'bill of lading ' * (segment // 8) + os.urandom(123)
+
+    def open_session(self, **fields):
+        data = {'fileName': 'scan.pdf', 'size': len(self.plaintext), 'shipment': self.shipment.pk}
+        data.update(fields)
+        return self.client.post(reverse('hub:UploadSessions'), data)
+
+    def put(self, session, index, data=None):
+        if data is None:
+            size = session['chunkSize']
+            data = self.plaintext[index * size:(index + 1) * size]
+        return self.client.put(reverse('hub:UploadChunk', args=[session['id'], index]), data,
+                               content_type='application/octet-stream')
+
+    def finalize(self, session):
+        return self.client.post(reverse('hub:UploadFinalize', args=[session['id']]))
+
+    def finalize_and_wait(self, session):
+        """Queues the assembly and runs it as a worker would; returns the job's status."""
+        response = self.finalize(session)
+        self.assertEqual(response.status_code, 202)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(jobs.work(burst=True), 1)
+        return self.client.get(response.json()['url']).json()
+
+    def test_chunks_in_any_order_are_assembled(self):
+        response = self.open_session()
+        self.assertEqual(response.status_code, 201)
+        session = response.json()
+        self.assertEqual(session['chunks'], 3)
+
+        self.assertEqual(self.put(session, 2).status_code, 200)
+        status = self.put(session, 0).json()
+        self.assertEqual((status['received'], status['offset']), ([0, 2], session['chunkSize']))
+
+        response = self.finalize(session)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['missing'], [1])
+
+        # A retried chunk replaces the first copy
+        self.put(session, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            status = self.put(session, 1).json()
+        self.assertEqual((status['received'], status['offset']), ([0, 1, 2], len(self.plaintext)))
+
+        job = self.finalize_and_wait(session)
+        self.assertEqual((job['status'], job['progress']), (models.Job.Statuses.DONE, 1))
+        document = models.Documents.objects.get(pk=job['result']['document'])
+        self.assertEqual((document.shipmentId, document.fileName), (self.shipment, 'scan.pdf'))
+        self.assertEqual(document.digest, hashlib.sha256(self.plaintext).hexdigest())
+        self.assertEqual(document.blob.manifest, ''.join(hashlib.sha256(self.plaintext[i:i + blobs.CHUNK_SIZE])
+                                                         .hexdigest()
+                                                         for i in range(0, len(self.plaintext), blobs.CHUNK_SIZE)))
+        self.assertFalse(models.UploadChunk.objects.exists())
+        self.assertEqual([files for directory, _, files in os.walk(MEDIA_ROOT)
+                          if os.path.basename(directory) == session['id'].replace('-', '') and files], [])
+
+        download = self.client.get(document.get_download_url())
+        self.assertEqual(b''.join(download.streaming_content), self.plaintext)
+        download = self.client.get(document.get_download_url(), HTTP_RANGE='bytes=786000-800000')
+        self.assertEqual(b''.join(download.streaming_content), self.plaintext[786000:800001])
+
+        self.assertEqual(self.finalize(session).json()['document'], document.pk)
+        self.assertEqual(self.put(session, 0).status_code, 409)
+
+    def test_identical_content_shares_the_blob(self):
+        self.create_shipment(document=SimpleUploadedFile('scan.pdf', self.plaintext))
+        session = self.open_session().json()
+        for index in range(session['chunks']):
+            self.put(session, index)
+        self.finalize_and_wait(session)
+        blob = models.Blob.objects.get(digest=hashlib.sha256(self.plaintext).hexdigest())
+        self.assertEqual(blob.refCount, 2)
+
+    def test_resent_chunk_is_encrypted_under_a_new_nonce(self):
+        session = self.open_session().json()
+        size = session['chunkSize']
+        for index in range(session['chunks']):
+            self.put(session, index, bytes(len(self.plaintext[index * size:(index + 1) * size])))
+        first = bytes(models.UploadChunk.objects.get(index=0).nonce)
+
+        # Different bytes for the same segments: same key, so the nonces must differ
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(session['chunks']):
+                self.put(session, index)
+        nonces = {bytes(nonce) for nonce in models.UploadChunk.objects.values_list('nonce', flat=True)}
+        self.assertNotIn(first, nonces)
+        self.assertEqual(len(nonces), session['chunks'])
+
+        job = self.finalize_and_wait(session)
+        document = models.Documents.objects.get(pk=job['result']['document'])
+        with document.Cargo_Doc.open('rb') as f:
+            self.assertNotIn(Container.Header.read(f).base_nonce, nonces | {first})
+        self.assertEqual(b''.join(self.client.get(document.get_download_url()).streaming_content), self.plaintext)
+
+    def test_rejected_requests(self):
+        session = self.open_session().json()
+        self.assertEqual(self.put(session, 0, b'short').status_code, 400)
+        self.assertEqual(self.put(session, 3, b'').status_code, 404)
+        self.assertEqual(self.open_session(size=0).status_code, 400)
+        self.assertFalse(models.UploadChunk.objects.exists())
+
+        other = get_user_model().objects.create_user(email='other@example.com', password='secret',
+                                                     country='IN', phone_no='2')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('hub:UploadSession', args=[session['id']])).status_code, 404)
+        self.assertEqual(self.open_session().status_code, 404)
+
+    def test_abandoned_sessions_are_deleted(self):
+        session = self.open_session().json()
+        self.put(session, 0)
+        path = models.Documents._meta.get_field('Cargo_Doc').storage.path(models.UploadChunk.objects.get().storedName)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(reverse('hub:UploadSession', args=[session['id']])).status_code, 204)
+        self.assertFalse(models.UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+        self.open_session()
+        self.assertEqual(uploads.expire(timedelta(hours=1)), 0)
+        models.UploadSession.objects.update(createdAt=timezone.now() - timedelta(days=2))
+        self.assertEqual(uploads.expire(timedelta(hours=1)), 1)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.runs = []
+        tasks = mock.patch.dict(jobs.TASKS, {'test.record': self.record, 'test.fail': self.fail_task})
+        tasks.start()
+        self.addCleanup(tasks.stop)
+
+    def record(self, job, name):
+        jobs.report(job, 0.5, f"Halfway through {name}")
+        self.runs.append(name)
+        return {'name': name}
+
+    def fail_task(self, job):
+        raise RuntimeError("storage unavailable")
+
+    def test_jobs_run_highest_priority_first(self):
+        jobs.enqueue('test.record', {'name': 'low'}, priority=jobs.LOW)
+        jobs.enqueue('test.record', {'name': 'later'}, delay=timedelta(hours=1))
+        jobs.enqueue('test.record', {'name': 'normal'})
+        jobs.enqueue('test.record', {'name': 'high'}, priority=jobs.HIGH)
+
+        self.assertEqual(jobs.work(burst=True), 3)
+        self.assertEqual(self.runs, ['high', 'normal', 'low'])
+        job = models.Job.objects.get(payload__name='high')
+        self.assertEqual((job.status, job.progress, job.result), (models.Job.Statuses.DONE, 1, {'name': 'high'}))
+        self.assertEqual(job.message, "Halfway through high")
+        self.assertEqual(models.Job.objects.get(payload__name='later').status, models.Job.Statuses.QUEUED)
+
+    def test_a_job_is_claimed_once(self):
+        job = jobs.enqueue('test.record', {'name': 'once'})
+        self.assertEqual(jobs.claim('first').pk, job.pk)
+        self.assertIsNone(jobs.claim('second'))
+
+    def test_failed_attempts_are_retried_with_backoff(self):
+        job = jobs.enqueue('test.fail', max_attempts=2)
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (models.Job.Statuses.QUEUED, 1))
+        self.assertIn("storage unavailable", job.error)
+        self.assertGreater(job.runAfter, timezone.now())
+        # Not runnable before the backoff is over
+        self.assertEqual(jobs.work(burst=True), 0)
+
+        models.Job.objects.update(runAfter=timezone.now())
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (models.Job.Statuses.FAILED, 2))
+
+    def test_jobs_of_lost_workers_are_queued_again(self):
+        job = jobs.enqueue('test.record', {'name': 'lost'})
+        claimed = jobs.claim('crashed')
+        models.Job.objects.update(heartbeatAt=timezone.now() - jobs.lease() - timedelta(seconds=1))
+
+        self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (models.Job.Statuses.DONE, 2))
+        # The lost worker can no longer write to it
+        jobs.report(claimed, 0.1, "stale")
+        job.refresh_from_db()
+        self.assertEqual(job.progress, 1)
+
+    def test_status_is_only_shown_to_the_owner(self):
+        owner = get_user_model().objects.create_user(email='owner@example.com', password='secret', country='IN',
+                                                     phone_no='1')
+        job = jobs.enqueue('test.record', {'name': 'mine'}, owner=owner)
+        self.client.force_login(owner)
+        self.assertEqual(self.client.get(reverse('hub:Job', args=[job.pk])).json()['status'], 'QUEUED')
+        self.assertEqual([entry['id'] for entry in self.client.get(reverse('hub:Jobs')).json()['jobs']], [job.pk])
+
+        other = get_user_model().objects.create_user(email='other@example.com', password='secret', country='IN',
+                                                     phone_no='2')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('hub:Job', args=[job.pk])).status_code, 404)
+
+
+class ShardedStorageTests(TestCase):
+
+    def setUp(self):
+        self.roots = [tempfile.mkdtemp() for _ in range(3)]
+        self.addCleanup(lambda: [shutil.rmtree(root, ignore_errors=True) for root in self.roots])
+        self.storage = storage.ShardedFileSystemStorage(location=self.roots[0], extra_locations=self.roots[1:])
+
+    def test_documents_use_the_sharded_storage(self):
+        self.assertIsInstance(default_storage, storage.ShardedFileSystemStorage)
+        self.assertIsInstance(models.Documents._meta.get_field('Cargo_Doc').storage, storage.ShardedFileSystemStorage)
+        self.assertIsInstance(models.Blob._meta.get_field('blobFile').storage, storage.ShardedFileSystemStorage)
+
+    def test_names_are_sharded(self):
+        name = self.storage.generate_filename('documents/SHIP1/manifest.pdf')
+        self.assertRegex(name, r'^[0-9a-f]{2}/[0-9a-f]{2}/documents/SHIP1/manifest\.pdf$')
+        self.assertEqual(self.storage.generate_filename('documents/SHIP1/manifest.pdf'), name)
+
+    def test_files_are_spread_over_every_root(self):
+        names = [self.storage.save(f'incoming/{i}.encrypted', ContentFile(b'x' * i)) for i in range(30)]
+        for name in names:
+            self.assertTrue(self.storage.path(name).startswith(self.storage.root_of(name)))
+        self.assertEqual({self.storage.root_of(name) for name in names}, set(self.roots))
+        self.assertEqual(self.storage.listdir('incoming')[1], sorted(f'{i}.encrypted' for i in range(30)))
+        self.assertEqual(self.storage.size('incoming/7.encrypted'), 7)
+
+    def test_move_between_roots(self):
+        names = [f'a/{i}' for i in range(20)]
+        old = names[0]
+        new = next(name for name in names if self.storage.root_of(name) != self.storage.root_of(old))
+        self.storage.save(old, ContentFile(b'content'))
+        storage.move(self.storage, old, new)
+        self.assertFalse(self.storage.exists(old))
+        with self.storage.open(new) as f:
+            self.assertEqual(f.read(), b'content')
+
+    def test_aborted_writer_leaves_nothing(self):
+        writer = storage.open_writer(self.storage, 'incoming/partial')
+        writer.write(b'partial')
+        writer.abort()
+        self.assertFalse(self.storage.exists('incoming/partial'))
+
+
+@skipUnless(mock_aws, "The S3 tests need boto3 and moto")
+class S3StorageTests(ShipmentUploadMixin, TestCase):
+    """Against moto's in-process S3."""
+
+    def setUp(self):
+        super().setUp()
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='documents')
+        self.storage = storage.S3Storage(bucket='documents', prefix='media', region_name='us-east-1',
+                                         access_key='test', secret_key='test', part_size=5 * storage.MB,
+                                         max_concurrency=4)
+
+    def test_objects(self):
+        data = os.urandom(100 * 1024)
+        name = self.storage.save(self.storage.generate_filename('incoming/a.encrypted'), ContentFile(data))
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), len(data))
+        self.assertEqual(self.storage.listdir(os.path.dirname(name)), ([], ['a.encrypted']))
+
+        with self.storage.open(name) as f:
+            f.seek(5000)
+            self.assertEqual(f.read(100), data[5000:5100])
+            f.seek(-10, os.SEEK_END)
+            self.assertEqual(f.read(), data[-10:])
+
+        storage.move(self.storage, name, 'blobs/a.encrypted')
+        self.assertFalse(self.storage.exists(name))
+        self.storage.delete('blobs/a.encrypted')
+        self.assertFalse(self.storage.exists('blobs/a.encrypted'))
+
+    def test_writer_uploads_parts_and_patches_the_head(self):
+        data = bytearray(os.urandom(12 * storage.MB + 123))
+        writer = storage.open_writer(self.storage, 'big')
+        for start in range(0, len(data), 256 * 1024):
+            writer.write(data[start:start + 256 * 1024])
+        writer.seek(10)
+        writer.write(b'header')
+        writer.seek(0, os.SEEK_END)
+        writer.close()
+        data[10:16] = b'header'
+
+        response = self.storage.client.head_object(Bucket='documents', Key='media/big', PartNumber=1)
+        self.assertEqual(response['PartsCount'], 3)
+        with self.storage.open('big') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_aborted_writer_leaves_nothing(self):
+        writer = storage.open_writer(self.storage, 'big')
+        writer.write(os.urandom(11 * storage.MB))
+        writer.abort()
+        self.assertFalse(self.storage.exists('big'))
+        self.assertNotIn('Uploads', self.storage.client.list_multipart_uploads(Bucket='documents'))
+
+    def test_encrypted_upload_and_download(self):
+        plaintext = os.urandom(3 * Container.DEFAULT_SEGMENT_SIZE + 11)
+        fields = [models.Documents._meta.get_field('Cargo_Doc'), models.Blob._meta.get_field('blobFile')]
+        with mock.patch.object(fields[0], 'storage', self.storage), \
+                mock.patch.object(fields[1], 'storage', self.storage):
+            self.create_shipment(document=SimpleUploadedFile('manifest.pdf', plaintext))
+            document = models.Documents.objects.get()
+            self.assertTrue(self.storage.exists(blobs.blob_name(document.digest)))
+            # The incoming ciphertext was moved to its content address
+            self.assertEqual(self.storage.listdir(''), (['blobs'], []))
+
+            response = self.client.get(reverse('hub:DocumentDownload', args=[document.pk]),
+                                       HTTP_RANGE='bytes=1000-99999')
+            self.assertEqual(b''.join(response.streaming_content), plaintext[1000:100000])
+
+
+class LedgerTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='shipper@example.com', password='secret',
+                                                         country='IN', phone_no='1')
+        self.shipments = [make_shipment(shipmentId=f'SHIP{i:012d}') for i in range(3)]
+
+    def append(self, count):
+        events = [(self.user, self.shipments[i % 3], models.Ledger.Events.CREATE) for i in range(count)]
+        return ledger.append(events)
+
+    @mock.patch.object(ledger, 'BATCH_SIZE', 8)
+    def test_entries_are_chained_and_sealed_into_batches(self):
+        entries = self.append(20) + self.append(5)
+        self.assertEqual([entry.seq for entry in entries], list(range(25)))
+        self.assertEqual(entries[10].prevHash, entries[9].entryHash)
+        self.assertEqual(models.LedgerBatch.manager.count(), 3)
+        self.assertIsNone(ledger.verify_chain())
+
+    @mock.patch.object(ledger, 'BATCH_SIZE', 8)
+    def test_shipment_history_verifies_against_a_checkpoint(self):
+        self.append(50)
+        head = ledger.checkpoint()
+        self.assertEqual(head.treeSize, 50)
+
+        history = ledger.shipment_history(self.shipments[1], head)
+        self.assertEqual(len(history), 17)
+        for entry, proof in history:
+            self.assertTrue(ledger.verify_entry(entry, proof, head))
+
+    @mock.patch.object(ledger, 'BATCH_SIZE', 8)
+    def test_later_checkpoint_is_consistent_with_an_earlier_one(self):
+        self.append(13)
+        old = ledger.checkpoint()
+        self.append(30)
+        new = ledger.checkpoint()
+        self.assertTrue(ledger.verify_consistency(old, new, ledger.consistency_proof(old, new)))
+
+        forged = models.LedgerCheckpoint(treeSize=old.treeSize, root='00' * 32)
+        self.assertFalse(ledger.verify_consistency(forged, new, ledger.consistency_proof(old, new)))
+
+    @mock.patch.object(ledger, 'BATCH_SIZE', 8)
+    def test_tampering_is_detected(self):
+        self.append(30)
+        head = ledger.checkpoint()
+        models.Ledger.manager.filter(seq=11).update(event=models.Ledger.Events.APPROVED)
+
+        entry = models.Ledger.manager.get(seq=11)
+        self.assertFalse(ledger.verify_entry(entry, ledger.inclusion_proof(entry, head), head))
+        self.assertEqual(ledger.verify_chain(), 11)
+
+    def test_single_proof_does_not_rescan_the_ledger(self):
+        self.append(3 * ledger.BATCH_SIZE + 5)
+        head = ledger.checkpoint()
+        entry = models.Ledger.manager.get(seq=100)
+        # one query per stored subtree on the path plus one leaf window
+        with self.assertNumQueries(4):
+            proof = ledger.inclusion_proof(entry, head)
+        self.assertTrue(ledger.verify_entry(entry, proof, head))
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT)
+    def test_shipment_creation_is_recorded(self):
+        self.client.force_login(self.user)
+        ShipmentUploadMixin.create_shipment(self, document=SimpleUploadedFile('manifest.pdf', b'%PDF'))
+        self.assertEqual(list(models.Ledger.manager.order_by('seq').values_list('seq', 'event')),
+                         [(0, models.Ledger.Events.CREATE), (1, models.Ledger.Events.APPROVE_REQUEST)])
+        self.assertIsNone(ledger.verify_chain())
+
+
+class ProjectionTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='shipper@example.com', password='secret',
+                                                         country='IN', phone_no='1')
+        self.shipments = [make_shipment(shipmentId=f'SHIP{i:012d}') for i in range(4)]
+
+    def events(self, *names, shipment=0):
+        return [(self.user, self.shipments[shipment], name) for name in names]
+
+    def snapshot_of_states(self):
+        return {state.shipment_id: {field: getattr(state, field) for field in projections.STATE_FIELDS}
+                for state in models.ShipmentState.objects.all()}
+
+    def test_state_follows_appended_events(self):
+        Events = models.Ledger.Events
+        ledger.append(self.events(Events.APPROVE_REQUEST, Events.ACCESS_REQUEST, Events.SHARED))
+        state = projections.state_of(self.shipments[0])
+        self.assertEqual(state.status, models.ShipmentState.Statuses.PENDING_APPROVAL)
+        self.assertEqual((state.shares, state.pendingAccessRequests, state.eventCount), (1, 1, 3))
+
+        ledger.append_event(self.user, self.shipments[0], Events.APPROVED)
+        with self.assertNumQueries(1):
+            state = projections.state_of(self.shipments[0])
+        self.assertEqual(state.status, models.ShipmentState.Statuses.APPROVED)
+        self.assertIsNone(projections.state_of(self.shipments[1]))
+
+    def test_dashboards_show_projected_status(self):
+        Events = models.Ledger.Events
+        Statuses = models.ShipmentState.Statuses
+        models.Shipper.manager.bulk_create([models.Shipper(shipperId=self.user, shipment=shipment)
+                                            for shipment in self.shipments[:2]])
+        ledger.append(self.events(Events.APPROVE_REQUEST) + self.events(Events.APPROVE_REQUEST, shipment=1)
+                      + self.events(Events.APPROVE_REQUEST, shipment=2))
+        ledger.append_event(self.user, self.shipments[1], Events.APPROVED)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('hub:ShipperDashboard'))
+        self.assertEqual(response.context['status_counts'],
+                         {Statuses.CREATED: 0, Statuses.PENDING_APPROVAL: 1, Statuses.APPROVED: 1})
+        self.assertEqual([state.shipment for state in response.context['recent_states']], self.shipments[1::-1])
+        self.assertContains(response, 'Pending Approval')
+
+        authority = get_user_model().objects.create_user(email='authority@example.com', password='secret',
+                                                         country='IN', phone_no='2', role=UserGroups.authority)
+        self.client.force_login(authority)
+        response = self.client.get(reverse('hub:AuthorityDashboard'))
+        self.assertEqual(response.context['status_counts'][Statuses.PENDING_APPROVAL], 2)
+
+    @mock.patch.object(projections, 'SNAPSHOT_INTERVAL', 5)
+    def test_snapshots_are_taken_and_used_for_point_in_time_state(self):
+        Events = models.Ledger.Events
+        entries = ledger.append(self.events(Events.APPROVE_REQUEST, *[Events.SHARED] * 11))
+        self.assertEqual(list(models.ShipmentStateSnapshot.objects.values_list('seq', flat=True).order_by('seq')),
+                         [4, 9])
+
+        state = projections.state_at(self.shipments[0], entries[6].seq)
+        self.assertEqual((state['shares'], state['eventCount']), (6, 7))
+
+    @mock.patch.object(projections, 'SNAPSHOT_INTERVAL', 3)
+    @mock.patch.object(projections, 'REBUILD_CHUNK_SIZE', 2)
+    def test_rebuild_matches_incremental_projection(self):
+        Events = models.Ledger.Events
+        for i in range(len(self.shipments)):
+            ledger.append(self.events(Events.APPROVE_REQUEST, *[Events.ACCESS_REQUEST, Events.APPROVE_ACCESS] * i,
+                                      shipment=i))
+        ledger.append(self.events(Events.APPROVED, shipment=2))
+        expected = self.snapshot_of_states()
+
+        models.ShipmentState.objects.all().delete()
+        self.assertEqual(projections.rebuild(), 4)
+        self.assertEqual(self.snapshot_of_states(), expected)
+
+        models.ShipmentState.objects.update(status=models.ShipmentState.Statuses.CREATED)
+        self.assertEqual(projections.rebuild(use_snapshots=False), 4)
+        self.assertEqual(self.snapshot_of_states(), expected)
+
+
+class LedgerWriterTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='shipper@example.com', password='secret',
+                                                         country='IN', phone_no='1')
+        self.shipment = make_shipment()
+        self.writer = ledger.LedgerWriter(max_batch=50, max_delay=0.05)
+        self.addCleanup(self.writer.close)
+
+    def test_concurrent_events_are_committed_in_batches(self):
+        with mock.patch.object(ledger, 'append', wraps=ledger.append) as append:
+            futures = [self.writer.submit(self.user, self.shipment, models.Ledger.Events.SHARED) for _ in range(200)]
+            entries = [future.result(timeout=10) for future in futures]
+
+        self.assertEqual(sorted(entry.seq for entry in entries), list(range(200)))
+        self.assertLessEqual(append.call_count, 10)
+        self.assertIsNone(ledger.verify_chain())
+        self.assertEqual(projections.state_of(self.shipment).shares, 200)
+
+    def test_failing_event_only_fails_its_caller(self):
+        good = self.writer.submit(self.user, self.shipment, models.Ledger.Events.SHARED)
+        bad = self.writer.submit(self.user, None, models.Ledger.Events.SHARED)
+        also_good = self.writer.submit(self.user, self.shipment, models.Ledger.Events.SHARED)
+
+        self.assertIsNotNone(good.result(timeout=10).seq)
+        self.assertIsNotNone(also_good.result(timeout=10).seq)
+        with self.assertRaises(Exception):
+            bad.result(timeout=10)
+
+    def test_record_waits_for_durability_or_joins_the_callers_transaction(self):
+        entry = ledger.record(self.user, self.shipment, models.Ledger.Events.CREATE)
+        self.assertTrue(models.Ledger.manager.filter(seq=entry.seq).exists())
+
+        with transaction.atomic():
+            ledger.record(self.user, self.shipment, models.Ledger.Events.SHARED, durable=False)
+            transaction.set_rollback(True)
+        self.assertEqual(models.Ledger.manager.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ShipmentCreationTests(ShipmentUploadMixin, TestCase):
+
+    def test_shipment_ids_are_unique_and_time_ordered(self):
+        allocated = [identifiers.new_shipment_id() for _ in range(10000)]
+        self.assertEqual(len(set(allocated)), len(allocated))
+        self.assertEqual(allocated, sorted(allocated))
+        self.assertTrue(all(len(shipment_id) == identifiers.LENGTH for shipment_id in allocated))
+
+    def test_creation_runs_a_fixed_number_of_queries(self):
+        self.create_shipment(document=SimpleUploadedFile('manifest.pdf', os.urandom(1024)))
+        blob = models.Blob.objects.get()
+        # shipment, shipper, blob reference + file name, document, access, ledger head + insert,
+        # projected state read + insert, approval queue insert, report counters read + write, and two savepoints
+        for _ in range(2):
+            with self.assertNumQueries(17):
+                shipment = shipments.create(self.user, models.Shipment(
+                    Shipper_Name='Shipper', Shipment_Company='Company', Receiver_Name='Receiver', Source='Chennai',
+                    Destination='Singapore', Cargo_Name='Cargo', Cargo_Type=models.Shipment.CargoTypes.Fragile),
+                    reused=blob)
+        self.assertEqual(models.Shipment.manager.count(), 3)
+        self.assertEqual(shipment.state.status, models.ShipmentState.Statuses.PENDING_APPROVAL)
+        self.assertEqual(models.ShipmentAccess.objects.get(shipment=shipment).access,
+                        models.ShipmentAccess.AccessLevels.OWNER)
+
+    def test_document_can_follow_as_a_resumable_upload(self):
+        response = self.create_shipment(uploadLater='on')
+        shipment = models.Shipment.manager.get()
+        self.assertRedirects(response, shipment.get_absolute_url(), fetch_redirect_response=False)
+        self.assertFalse(models.Documents.objects.exists())
+        self.assertEqual(self.create_shipment().status_code, 200)
+
+    def test_failed_creation_leaves_nothing_behind(self):
+        with mock.patch.object(ledger, 'append', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.create_shipment(document=SimpleUploadedFile('manifest.pdf', os.urandom(1024)))
+        self.assertFalse(models.Shipment.manager.exists())
+        self.assertFalse(models.Shipper.manager.exists())
+        self.assertFalse(models.Documents.objects.exists())
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='shipper@example.com', password='secret',
+                                                         country='IN', phone_no='1')
+        Fragile, Perishable = models.Shipment.CargoTypes.Fragile, models.Shipment.CargoTypes.Perishable
+        self.shipments = [
+            make_shipment(shipmentId=f'SHIP{i:012d}', Cargo_Type=(Fragile, Perishable)[i % 2],
+                          Destination=('Singapore', 'Rotterdam', 'Dubai')[i % 3])
+            for i in range(12)
+        ]
+        Events = models.Ledger.Events
+        ledger.append((self.user, shipment, event) for shipment in self.shipments
+                      for event in (Events.CREATE, Events.APPROVE_REQUEST))
+        ledger.append((self.user, shipment, Events.APPROVED) for shipment in self.shipments[:5])
+
+    def counters(self):
+        return {(row.dimension, row.key, row.day): row.count for row in models.Rollup.objects.all()}
+
+    def test_counters_follow_appended_events(self):
+        today = timezone.localdate()
+        counters = self.counters()
+        self.assertEqual(counters[rollups.SHIPMENTS, '', today], 12)
+        self.assertEqual(counters[rollups.CARGO_TYPE, models.Shipment.CargoTypes.Fragile, today], 6)
+        self.assertEqual(counters[rollups.LANE, 'Chennai → Dubai', today], 4)
+        self.assertEqual(counters[rollups.REQUESTS, '', today], 12)
+        self.assertEqual(counters[rollups.APPROVALS, '', today], 5)
+
+    def test_rebuild_matches_incremental_counts(self):
+        expected = self.counters()
+        models.Rollup.objects.all().delete()
+        self.assertEqual(rollups.rebuild(), len(expected))
+        self.assertEqual(self.counters(), expected)
+
+    def test_report(self):
+        with self.assertNumQueries(1):
+            report = rollups.report(days=7)
+        self.assertEqual((report['shipments'], report['requests'], report['approvals']), (12, 12, 5))
+        self.assertEqual(report['cargoTypes'], [(models.Shipment.CargoTypes.Fragile, 6),
+                                                (models.Shipment.CargoTypes.Perishable, 6)])
+        self.assertEqual(len(report['lanes']), 3)
+        self.assertEqual(len(report['daily']), 7)
+        self.assertEqual(report['daily'][-1], (timezone.localdate(), 12, 12, 5))
+
+        response = self.client.get(reverse('hub:ShipperReports'), {'days': 'many'})
+        self.assertEqual(response.context['days'], 30)
+        self.assertContains(response, 'Chennai → Rotterdam')
+
+
+@skipUnless(connection.vendor == 'sqlite', "The search index is SQLite FTS5")
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='shipper@example.com', password='secret',
+                                                         country='IN', phone_no='1')
+        self.tea = make_shipment(shipmentId='SHIPTEA', Shipper_Name='Rajan Exports', Cargo_Name='Darjeeling Tea',
+                                 Destination='Rotterdam')
+        self.spices = make_shipment(shipmentId='SHIPSPICE', Shipper_Name='Malabar Traders', Cargo_Name='Spices',
+                                    Receiver_Name='Rotterdam Foods', Destination='Hamburg')
+        models.ShipmentAccess.objects.create(userid=self.user, shipment=self.tea)
+
+    def found(self, text, **kwargs):
+        return [shipment.shipmentId for shipment in search.search(text, **kwargs)]
+
+    def test_prefix_matching_and_ranking(self):
+        self.assertEqual(self.found('darj'), ['SHIPTEA'])
+        self.assertEqual(self.found('malabar spi'), ['SHIPSPICE'])
+        self.assertEqual(self.found('malabar tea'), [])
+        # A receiver name outweighs a port
+        self.assertEqual(self.found('rotterdam'), ['SHIPSPICE', 'SHIPTEA'])
+        self.assertEqual(self.found('"); DROP TABLE --'), [])
+        self.assertEqual(self.found(''), [])
+        with self.assertNumQueries(1):
+            self.found('rotter')
+
+    def test_index_follows_shipment_writes(self):
+        self.spices.Cargo_Name = 'Pepper'
+        self.spices.save()
+        self.assertEqual(self.found('spices'), [])
+        self.assertEqual(self.found('pepper'), ['SHIPSPICE'])
+        models.Shipment.manager.filter(pk=self.tea.pk).update(Cargo_Name='Assam Tea')
+        self.assertEqual(self.found('darjeeling'), [])
+        self.assertEqual(self.found('assam'), ['SHIPTEA'])
+        models.Shipment.manager.bulk_create([models.Shipment(
+            shipmentId='SHIPRICE', Shipper_Name='Basmati Co', Shipment_Company='Company', Receiver_Name='Receiver',
+            Source='Kandla', Destination='Dubai', Cargo_Name='Rice', Cargo_Type=models.Shipment.CargoTypes.Fragile)])
+        self.assertEqual(self.found('basmati'), ['SHIPRICE'])
+        self.spices.delete()
+        self.assertEqual(self.found('malabar'), [])
+
+    def test_results_are_narrowed_to_visible_shipments(self):
+        visible = access.resolver.visible(self.user, models.Shipment.manager.all())
+        self.assertEqual(self.found('rotterdam', queryset=visible), ['SHIPTEA'])
+        self.assertEqual(self.found('rotterdam', limit=1, offset=1), ['SHIPTEA'])
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('hub:ShipmentSearch'), {'q': 'rotterdam'})
+        self.assertEqual([shipment.shipmentId for shipment in response.context['object_list']], ['SHIPTEA'])
+        response = self.client.get(reverse('hub:ShipmentSearchAPI'), {'q': 'rott', 'limit': 5})
+        self.assertEqual([result['shipmentId'] for result in response.json()['results']], ['SHIPTEA'])
+        self.assertEqual(response.json()['results'][0]['url'], self.tea.get_absolute_url())
+        self.assertEqual(self.client.get(reverse('hub:ShipmentSearchAPI'), {'limit': 'x'}).status_code, 400)
+
+
+class ApprovalQueueTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email='shipper@example.com', password='secret', country='IN',
+                                             phone_no='1')
+        self.authority = User.objects.create_user(email='authority@example.com', password='secret', country='IN',
+                                                  phone_no='2', role=UserGroups.authority)
+        cargo_types = [models.Shipment.CargoTypes.Fragile, models.Shipment.CargoTypes.Perishable]
+        self.shipments = [make_shipment(shipmentId=f'SHIP{i:012d}', Cargo_Type=cargo_types[i % 2])
+                          for i in range(300)]
+        ledger.append((self.user, shipment, event) for shipment in self.shipments
+                      for event in (models.Ledger.Events.CREATE, models.Ledger.Events.APPROVE_REQUEST))
+
+    def queue(self):
+        return list(models.PendingApproval.objects.order_by('pk').values_list('shipment_id', flat=True))
+
+    def test_requests_are_queued_with_their_filter_fields(self):
+        self.assertEqual(self.queue(), [shipment.pk for shipment in self.shipments])
+        pending = models.PendingApproval.objects.get(shipment=self.shipments[1])
+        self.assertEqual((pending.source, pending.destination, pending.cargoType),
+                         ('Chennai', 'Singapore', models.Shipment.CargoTypes.Perishable))
+        self.assertEqual(pending.requestedAt, self.shipments[1].state.requestedAt)
+
+        shipment = self.shipments[1]
+        shipment.Destination = 'Rotterdam'
+        shipment.save()
+        self.assertEqual(models.PendingApproval.objects.get(shipment=shipment).destination, 'Rotterdam')
+
+    def test_bulk_approval_is_one_transaction_and_one_append(self):
+        with CaptureQueriesContext(connection) as captured:
+            approved = shipments.approve(self.authority, [shipment.pk for shipment in self.shipments])
+        self.assertEqual(len(approved), 300)
+        # One ledger head read; the writes are only split by the database's parameter limit
+        self.assertEqual(sum(query['sql'].startswith('SELECT "Hub_ledger"') for query in captured), 1)
+        self.assertLessEqual(len(captured), 20)
+        self.assertEqual(self.queue(), [])
+        self.assertEqual(models.ShipmentState.objects.filter(status=models.ShipmentState.Statuses.APPROVED).count(),
+                         300)
+        approvals = list(models.Ledger.manager.filter(event=models.Ledger.Events.APPROVED).values_list('seq',
+                                                                                                      flat=True))
+        self.assertEqual(approvals, list(range(600, 900)))
+        # Already approved shipments are skipped, and stay out of the queue
+        self.assertEqual(shipments.approve(self.authority, [self.shipments[0].pk]), [])
+        ledger.append_event(self.user, self.shipments[0], models.Ledger.Events.APPROVE_REQUEST)
+        self.assertEqual(self.queue(), [])
+
+    def test_rebuild_restores_the_queue(self):
+        shipments.approve(self.authority, [shipment.pk for shipment in self.shipments[:100]])
+        expected = self.queue()
+        models.PendingApproval.objects.all().delete()
+        projections.rebuild()
+        self.assertEqual(self.queue(), expected)
+
+    def test_views(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('hub:AuthorityApprovals')).status_code, 403)
+        self.assertEqual(self.client.post(reverse('hub:AuthorityApproved')).status_code, 403)
+
+        self.client.force_login(self.authority)
+        response = self.client.get(reverse('hub:AuthorityApprovals'), {'cargoType': 'Perishable'})
+        self.assertEqual([pending.shipment for pending in response.context['object_list']], self.shipments[1:50:2])
+        self.assertIn('cargoType=Perishable', response.context['filter_query'])
+
+        response = self.client.post(reverse('hub:AuthorityApproved'),
+                                    {'shipmentId': [shipment.shipmentId for shipment in self.shipments[:10]]})
+        self.assertRedirects(response, reverse('hub:AuthorityApprovals'), fetch_redirect_response=False)
+        self.assertEqual(self.queue(), [shipment.pk for shipment in self.shipments[10:]])
+
+
+class MigrationTests(TestCase):
+
+    def test_models_match_their_migrations(self):
+        # Indexes and constraints only reach a deployed database through a migration
+        output = io.StringIO()
+        try:
+            call_command('makemigrations', check=True, dry_run=True, stdout=output)
+        except SystemExit:
+            self.fail('Models changed without a migration:\n' + output.getvalue())
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked with SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(TestCase):
+    """
+    Runs every Hub view against a few thousand shipments and checks that the
+    number of queries does not depend on the data and that no query scans a
+    whole table, except the unfiltered shipment lists.
+    """
+    SHIPMENTS = 3000
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create([
+            User(email=f'shipper{i}@example.com', country='IN', phone_no=str(i)) for i in range(30)
+        ])
+        cls.user = cls.users[0]
+        cls.authority = User.objects.create_user(email='authority@example.com', password='secret', country='IN',
+                                                 phone_no='authority', role=UserGroups.authority)
+        shipments = models.Shipment.manager.bulk_create([
+            models.Shipment(Shipper_Name='Shipper', Shipment_Company='Company', Receiver_Name='Receiver',
+                            Source='Chennai', Destination='Singapore', Cargo_Name='Cargo',
+                            Cargo_Type=models.Shipment.CargoTypes.Fragile)
+            for _ in range(cls.SHIPMENTS)
+        ])
+        owners = [cls.users[i % len(cls.users)] for i in range(cls.SHIPMENTS)]
+        models.Shipper.manager.bulk_create([models.Shipper(shipperId=owner, shipment=shipment)
+                                            for owner, shipment in zip(owners, shipments)])
+        models.ShipmentAccess.objects.bulk_create([models.ShipmentAccess(userid=owner, shipment=shipment)
+                                                   for owner, shipment in zip(owners, shipments)])
+        models.Documents.objects.bulk_create([
+            models.Documents(Cargo_Doc=f'documents/{i}.pdf', fileName=f'{i}.pdf', shipmentId=shipment)
+            for i, shipment in enumerate(shipments)
+        ])
+        ledger.append((owner, shipment, event) for owner, shipment in zip(owners, shipments)
+                      for event in (models.Ledger.Events.CREATE, models.Ledger.Events.APPROVE_REQUEST))
+        cls.shipment = shipments[len(shipments) // 2]
+
+    def setUp(self):
+        # Counts below are for a cold access cache
+        access.resolver.cache.clear()
+        access.resolver.clear()
+        self.client.force_login(self.user)
+
+    def assertIndexed(self, queries, scans=()):
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for *_, detail in cursor.fetchall():
+                    if detail.startswith('SCAN ') and detail.split()[1] not in scans:
+                        self.fail(f"{detail} in {query['sql']}")
+
+    def assertView(self, url, queries, scans=()):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertIn(response.status_code, (200, 302))
+        self.assertEqual(len(captured), queries, '\n'.join(query['sql'] for query in captured))
+        self.assertIndexed(captured, scans)
+
+    def test_dashboards(self):
+        # session and user, then the projected states: the shipper's also lists their jobs and latest changes,
+        # the logistics one first reads what the user can see
+        self.assertView(reverse('hub:ShipperDashboard'), 5)
+        self.assertView(reverse('hub:LogisticsDashboard'), 4)
+        # Counting every shipment reads the whole status index, but never the shipments or their ledger
+        self.client.force_login(self.authority)
+        self.assertView(reverse('hub:AuthorityDashboard'), 3, scans=('Hub_shipmentstate',))
+
+    def test_job_queue(self):
+        for priority in (jobs.LOW, jobs.NORMAL, jobs.HIGH):
+            models.Job.objects.create(kind='uploads.finalize', priority=priority)
+        # Lost workers, the next runnable job and its claim, all off the queue index
+        with CaptureQueriesContext(connection) as captured:
+            jobs.requeue_abandoned()
+            jobs.claim('worker')
+        self.assertIndexed(captured)
+
+    def test_shipment_lists(self):
+        # The first page reads the newest rows straight off the primary key; the history is narrowed to what
+        # the user can see (session, user, their access and the page)
+        self.assertView(reverse('hub:ShipmentHistory'), 4, scans=('Hub_shipment',))
+
+    def test_reports(self):
+        # One read of the counters, however many shipments there are
+        self.assertView(reverse('hub:ShipperReports'), 1)
+
+    def test_approval_queue(self):
+        # session, user and the page, oldest requests first; filters are read off their own index
+        self.client.force_login(self.authority)
+        self.assertView(reverse('hub:AuthorityApprovals'), 3, scans=('Hub_pendingapproval',))
+        self.assertView(f"{reverse('hub:AuthorityApprovals')}?cargoType=Fragile", 3)
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        self.client.force_login(self.authority)
+        url = reverse('hub:AuthorityApprovals')
+        response = self.client.get(url)
+        for _ in range(20):
+            response = self.client.get(url, {'cursor': response.context['page_obj'].next_cursor})
+        self.assertView(f"{url}?cursor={response.context['page_obj'].next_cursor}", 3)
+
+    def test_shipment_detail(self):
+        # session, user, shipment, the user's access and the projected state
+        self.assertView(reverse('hub:ShipperDetail', args=[self.shipment.pk]), 5)
+
+    def test_approval_request(self):
+        # shipment and its documents
+        self.assertView(reverse('hub:AuthorityRequest', args=[self.shipment.pk]), 2)
+
+    def test_document_access_check(self):
+        document = models.Documents.objects.get(shipmentId=self.shipment)
+        owner = models.Shipper.manager.get(shipment=self.shipment).shipperId
+        with CaptureQueriesContext(connection) as captured:
+            downloads.get_readable_document(owner, document.pk)
+        self.assertEqual(len(captured), 2)
+        self.assertIndexed(captured)
+        # The owner's access is cached now
+        with self.assertNumQueries(1):
+            downloads.get_readable_document(owner, document.pk)
+
+    def test_ledger_and_projection_lookups(self):
+        head = ledger.checkpoint()
+        with CaptureQueriesContext(connection) as captured:
+            projections.state_of(self.shipment)
+            history = ledger.shipment_history(self.shipment, head)
+            blobs.find_reusable(self.user, '0' * 64)
+        self.assertEqual(len(history), 2)
+        self.assertIndexed(captured)
+
+
+class AccessResolverTests(TestCase):
+
+    def setUp(self):
+        access.resolver.cache.clear()
+        access.resolver.clear()
+        User = get_user_model()
+        self.owner = User.objects.create_user(email='owner@example.com', password='secret', country='IN',
+                                              phone_no='1')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='secret', country='IN',
+                                               phone_no='2')
+        self.authority = User.objects.create_user(email='authority@example.com', password='secret', country='IN',
+                                                  phone_no='3', role=UserGroups.authority)
+        self.shipments = [make_shipment(shipmentId=f'SHIP{i:012d}') for i in range(30)]
+        models.ShipmentAccess.objects.bulk_create([models.ShipmentAccess(userid=self.owner, shipment=shipment)
+                                                   for shipment in self.shipments])
+        access.access_changed.send(sender=models.ShipmentAccess, user_ids=[self.owner.pk])
+        self.shipment = self.shipments[0]
+
+    def test_actions_follow_access_level_and_role(self):
+        models.ShipmentAccess.objects.create(userid=self.viewer, shipment=self.shipment,
+                                             access=models.ShipmentAccess.AccessLevels.VIEWER)
+        self.assertTrue(access.resolver.can(self.owner, access.SHARE, self.shipment))
+        self.assertTrue(access.resolver.can(self.viewer, access.DOWNLOAD, self.shipment))
+        self.assertFalse(access.resolver.can(self.viewer, access.SHARE, self.shipment))
+        self.assertFalse(access.resolver.can(self.viewer, access.VIEW, self.shipments[1]))
+        self.assertTrue(access.resolver.can(self.authority, access.APPROVE, self.shipments[1]))
+        self.assertFalse(access.resolver.can(AnonymousUser(), access.VIEW, self.shipment))
+
+    def test_a_page_of_rows_costs_at_most_one_query(self):
+        with self.assertNumQueries(1):
+            access.resolver.resolve(self.owner, self.shipments)
+        self.assertTrue(all(access.SHARE in shipment.permissions for shipment in self.shipments))
+        with self.assertNumQueries(0):
+            access.resolver.resolve(self.owner, self.shipments)
+            access.resolver.visible_ids(self.owner)
+
+    def test_shared_cache_serves_other_processes(self):
+        access.resolver.visible_ids(self.owner)
+        access.resolver.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(access.resolver.visible_ids(self.owner)), 30)
+
+    def test_revocations_reach_other_processes(self):
+        # Another process has its own resolver and cache connection; only the cache behind them is shared
+        other = access.AccessResolver(cache=caches.create_connection(settings.ACCESS_CACHE_ALIAS))
+        row = models.ShipmentAccess.objects.create(userid=self.viewer, shipment=self.shipment)
+        self.assertTrue(other.can(self.viewer, access.VIEW, self.shipment))
+        row.delete()
+        with self.assertNumQueries(1):
+            self.assertFalse(other.can(self.viewer, access.VIEW, self.shipment))
+
+    @override_settings(ACCESS_CACHE_ALIAS='default')
+    def test_process_local_caches_are_not_trusted_across_requests(self):
+        self.assertEqual([warning.id for warning in checks.check_access_cache(None)], ['Hub.W001'])
+        other = access.AccessResolver(cache=LocMemCache('other-process', {}))
+        row = models.ShipmentAccess.objects.create(userid=self.viewer, shipment=self.shipment)
+        self.assertTrue(other.can(self.viewer, access.VIEW, self.shipment))
+        row.delete()
+        self.assertFalse(other.can(self.viewer, access.VIEW, self.shipment))
+        with self.assertNumQueries(1):
+            access.resolver.resolve(self.owner, self.shipments)
+
+    def test_changes_to_access_rows_invalidate(self):
+        self.assertFalse(access.resolver.can(self.viewer, access.VIEW, self.shipment))
+        row = models.ShipmentAccess.objects.create(userid=self.viewer, shipment=self.shipment,
+                                                   access=models.ShipmentAccess.AccessLevels.VIEWER)
+        self.assertFalse(access.resolver.can(self.viewer, access.SHARE, self.shipment))
+        row.access = models.ShipmentAccess.AccessLevels.OWNER
+        row.save()
+        self.assertTrue(access.resolver.can(self.viewer, access.SHARE, self.shipment))
+        row.delete()
+        self.assertFalse(access.resolver.can(self.viewer, access.VIEW, self.shipment))
+
+    def test_bulk_grants_invalidate(self):
+        self.assertFalse(access.resolver.can(self.viewer, access.VIEW, self.shipments[1]))
+        keys.grant_access(self.shipments[1], [self.viewer], models.ShipmentAccess.AccessLevels.VIEWER)
+        self.assertTrue(access.resolver.can(self.viewer, access.VIEW, self.shipments[1]))
+
+    def test_visible_narrows_querysets(self):
+        models.ShipmentAccess.objects.create(userid=self.viewer, shipment=self.shipment)
+        queryset = models.Shipment.manager.all()
+        self.assertEqual(list(access.resolver.visible(self.viewer, queryset)), [self.shipment])
+        self.assertEqual(access.resolver.visible(self.authority, queryset).count(), 30)
+        with mock.patch.object(access, 'MAX_IN_FILTER', 10):
+            self.assertEqual(access.resolver.visible(self.owner, queryset).count(), 30)
+
+    def test_views_hide_other_users_shipments(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse('hub:ShipperDetail', args=[self.shipment.pk]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('hub:ShipmentHistory'))
+        self.assertEqual(list(response.context['object_list']), [])
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('hub:ShipperDetail', args=[self.shipment.pk]))
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.shipments = [make_shipment(shipmentId=f'SHIP{i:012d}') for i in range(53)]
+
+    def walk(self, paginator, page, direction):
+        seen = []
+        while page is not None:
+            seen.append([shipment.pk for shipment in page])
+            cursor = page.next_cursor if direction == 'next' else page.previous_cursor
+            page = paginator.page(cursor) if cursor else None
+        return seen
+
+    def test_pages_cover_every_row_once_in_both_directions(self):
+        paginator = paginators.KeysetPaginator(models.Shipment.manager.all(), 10)
+        forward = self.walk(paginator, paginator.page(), 'next')
+        expected = sorted((shipment.pk for shipment in self.shipments), reverse=True)
+        self.assertEqual([pk for page in forward for pk in page], expected)
+        self.assertEqual([len(page) for page in forward], [10, 10, 10, 10, 10, 3])
+
+        last = paginator.page(paginator.page().next_cursor)
+        for _ in range(4):
+            last = paginator.page(last.next_cursor)
+        self.assertFalse(last.has_next())
+        self.assertEqual(self.walk(paginator, last, 'previous'), list(reversed(forward)))
+
+    def test_compound_ordering_is_stable_across_equal_keys(self):
+        paginator = paginators.KeysetPaginator(models.Shipment.manager.all(), 7, ordering=('Cargo_Type', '-pk'))
+        models.Shipment.manager.filter(pk__in=[shipment.pk for shipment in self.shipments[::2]]).update(
+            Cargo_Type=models.Shipment.CargoTypes.Hazardous)
+        pages = self.walk(paginator, paginator.page(), 'next')
+        expected = list(models.Shipment.manager.order_by('Cargo_Type', '-pk').values_list('pk', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_tampered_cursor_is_rejected(self):
+        user = get_user_model().objects.create_user(email='authority@example.com', password='secret',
+                                                    country='IN', phone_no='1', role=UserGroups.authority)
+        self.client.force_login(user)
+        cursor = self.client.get(reverse('hub:ShipmentHistory')).context['page_obj'].next_cursor
+        self.assertEqual(self.client.get(reverse('hub:ShipmentHistory'), {'cursor': cursor + 'x'}).status_code, 404)
+
+    def test_count_estimate_avoids_count_star(self):
+        paginator = paginators.KeysetPaginator(models.Shipment.manager.all(), 10, count_estimate=True)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(paginator.count, 53)
+        self.assertNotIn('COUNT(', captured[0]['sql'])
+        self.assertIsNone(paginators.KeysetPaginator(models.Shipment.manager.filter(pk=1), 10).count)
+
+
+class DatabaseConfigurationTests(TestCase):
+    # Writing here would lock the tables the read connection checks on teardown
+    databases = {'default', 'read'}
+
+    def open(self, alias):
+        path = os.path.join(tempfile.mkdtemp(), 'db.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': path}, alias)
+        self.addCleanup(wrapper.close)
+        return wrapper.cursor()
+
+    def pragma(self, cursor, name):
+        cursor.execute(f"PRAGMA {name}")
+        return cursor.fetchone()[0]
+
+    def test_connections_are_tuned(self):
+        cursor = self.open('default')
+        self.assertEqual(self.pragma(cursor, 'journal_mode'), 'wal')
+        # NORMAL
+        self.assertEqual(self.pragma(cursor, 'synchronous'), 1)
+        self.assertEqual(self.pragma(cursor, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(cursor, 'cache_size'), -32000)
+        self.assertEqual(self.pragma(cursor, 'query_only'), 0)
+        cursor.execute("CREATE TABLE t (x)")
+
+    def test_read_connections_cannot_write(self):
+        cursor = self.open('read')
+        self.assertEqual(self.pragma(cursor, 'query_only'), 1)
+        with self.assertRaises(OperationalError):
+            cursor.execute("CREATE TABLE t (x)")
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'delete', 'synchronous': 'full'})
+    def test_pragmas_follow_settings(self):
+        cursor = self.open('default')
+        self.assertEqual(self.pragma(cursor, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(cursor, 'synchronous'), 2)
+
+    def test_router_reads_from_the_read_database_only_when_asked(self):
+        router = database.ReadWriteRouter()
+        shipment = models.Shipment()
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertIsNone(router.db_for_read(models.Shipment))
+            with database.reading():
+                self.assertEqual(router.db_for_read(models.Shipment), 'read')
+                # Related objects come from where the instance did
+                self.assertIsNone(router.db_for_read(models.Documents, instance=shipment))
+                self.assertEqual(router.db_for_write(models.Shipment), 'default')
+        with database.reading():
+            # Reads see what the open transaction wrote
+            self.assertEqual(router.db_for_read(models.Shipment), 'default')
+        with override_settings(READ_DATABASE=None), database.reading(), \
+                mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertIsNone(router.db_for_read(models.Shipment))
+        self.assertFalse(router.allow_migrate('read', 'Hub'))
+        self.assertIsNone(router.allow_migrate('default', 'Hub'))
+
+    def test_read_only_views_query_the_read_database(self):
+        with mock.patch.object(connections['default'], 'in_atomic_block', False), \
+                CaptureQueriesContext(connections['read']) as read, \
+                CaptureQueriesContext(connection) as default:
+            response = self.client.get(reverse('hub:ShipperReports'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(read.captured_queries)
+        self.assertFalse(default.captured_queries)
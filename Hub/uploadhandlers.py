@@ -0,0 +1,144 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+
+from Cryptography import Container
+from Cryptography.Encryption import SyncEncrypt
+from Hub import storage as storages
+from Hub.blobs import ManifestBuilder
+
+
+def document_storage():
+    from Hub.models import Documents
+    return Documents._meta.get_field('Cargo_Doc').storage
+
+
+def incoming_name(storage):
+    """
+    A free name for a new encrypted file not yet attached to a document. They
+    are kept together (not sharded) so that expire_incoming can find them.
+    """
+    return storage.get_available_name(f"incoming/{uuid.uuid4().hex}.encrypted")
+
+
+class EncryptedUploadedFile(UploadedFile):
+    """
+    An upload that has already been encrypted into its final storage location.
+
+    ``stored_name`` is the storage name of the ciphertext, ``key`` the container
+    key, ``digest`` the SHA-256 of the plaintext and ``manifest`` the hashes of
+    its chunks (see Hub.blobs).
+    """
+
+    def __init__(self, name, stored_name, key, digest, manifest, content_type, size, charset, content_type_extra):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.stored_name = stored_name
+        self.key = key
+        self.digest = digest
+        self.manifest = manifest
+        # Set once the stored file is moved elsewhere or deleted
+        self.consumed = False
+
+    def discard(self):
+        if not self.consumed:
+            document_storage().delete(self.stored_name)
+            self.consumed = True
+
+    def open(self, mode=None):
+        raise ValueError("Encrypted uploads cannot be reopened as plaintext")
+
+
+class EncryptingUploadHandler(FileUploadHandler):
+    """
+    Encrypts and hashes each chunk as it arrives from the socket and writes the
+    ciphertext straight to the document storage, so plaintext never hits disk.
+    """
+    chunk_size = Container.DEFAULT_SEGMENT_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        storage = document_storage()
+        self.key = SyncEncrypt().generateKey()
+        self.hash = hashlib.sha256()
+        self.chunks = ManifestBuilder()
+        self.stored_name = incoming_name(storage)
+        self.file = storages.open_writer(storage, self.stored_name)
+        self.writer = Container.SegmentWriter(self.file, self.key, Container.DEFAULT_SEGMENT_SIZE,
+                                              getattr(settings, 'DOCUMENT_ENCRYPTION_WORKERS', 1))
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        self.chunks.update(raw_data)
+        self.writer.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.writer.close()
+        self.file.close()
+        return EncryptedUploadedFile(self.file_name, self.stored_name, self.key, self.hash.hexdigest(),
+                                     self.chunks.manifest, self.content_type, file_size, self.charset, self.content_type_extra)
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.abort()
+
+
+def discard_unconsumed(request):
+    """Deletes the encrypted uploads of ``request`` that were not stored, if its body was parsed at all."""
+    files = getattr(request, '_files', None)
+    if files is None:
+        return
+    for _, uploads in files.lists():
+        for upload in uploads:
+            if isinstance(upload, EncryptedUploadedFile):
+                upload.discard()
+
+
+class EncryptingUploadMixin:
+    """
+    Has a view parse uploads with EncryptingUploadHandler instead of the
+    FILE_UPLOAD_HANDLERS. The CSRF check reads the body, so the middleware
+    skips the view and post() makes the check once the handler is in place;
+    uploads the view did not store are deleted when the request ends.
+    """
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        request.upload_handlers = [EncryptingUploadHandler(request)]
+        return super().dispatch(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            rejected = CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+            if rejected is not None:
+                return rejected
+            return super().post(request, *args, **kwargs)
+        finally:
+            discard_unconsumed(request)
+
+
+def expire_incoming(age):
+    """Deletes the encrypted files left in incoming/ for more than ``age`` (a timedelta); returns how many."""
+    storage = document_storage()
+    try:
+        names = storage.listdir('incoming')[1]
+    except FileNotFoundError:
+        return 0
+    cutoff = timezone.now() - age
+    count = 0
+    for name in names:
+        name = f"incoming/{name}"
+        try:
+            if storage.get_modified_time(name) < cutoff:
+                storage.delete(name)
+                count += 1
+        except FileNotFoundError:
+            # Stored or discarded meanwhile
+            pass
+    return count
@@ -0,0 +1,287 @@
+import hashlib
+import io
+import struct
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from Cryptography import Backends, Codecs, Container
+from Cryptography.Encryption import SyncEncrypt
+from Hub import blobs, jobs, keys, storage as storages
+from Hub.blobs import ManifestBuilder
+from Hub.uploadhandlers import EncryptedUploadedFile, document_storage, incoming_name
+
+SEGMENT_SIZE = Container.DEFAULT_SEGMENT_SIZE
+# Plaintext bytes per chunk unless UPLOAD_CHUNK_SIZE says otherwise
+CHUNK_SIZE = 32 * SEGMENT_SIZE
+
+
+class ChunkRejected(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadIncomplete(Exception):
+
+    def __init__(self, missing):
+        super().__init__(f"{len(missing)} chunk(s) missing")
+        self.missing = missing
+
+
+def chunk_size():
+    size = getattr(settings, 'UPLOAD_CHUNK_SIZE', CHUNK_SIZE)
+    if size <= 0 or size % SEGMENT_SIZE:
+        raise ImproperlyConfigured(f"UPLOAD_CHUNK_SIZE must be a multiple of {SEGMENT_SIZE}")
+    return size
+
+
+def chunk_count(session):
+    return -(-session.size // session.chunkSize)
+
+
+def chunk_length(session, index):
+    return min(session.chunkSize, session.size - index * session.chunkSize)
+
+
+def header_of(session):
+    return Container.Header.read(io.BytesIO(bytes(session.header)))
+
+
+def create(owner, shipment, file_name, size):
+    """
+    Opens a session for a ``size`` byte document of ``shipment``. The
+    container header (key, cipher, compression and segment count) is fixed
+    up front, so that every chunk can be encrypted on its own.
+    """
+    from Hub.models import UploadSession
+
+    codec = Codecs.get_codec(None).id
+    header = Container.Header(segment_size=SEGMENT_SIZE, backend=Backends.get_backend(None).id, codec=codec,
+                              flags=Container.FLAG_INDEXED if codec != Container.CODEC_NONE else 0,
+                              segment_count=max(-(-size // SEGMENT_SIZE), 1), plaintext_size=size)
+    return UploadSession.objects.create(owner=owner, shipment=shipment, fileName=file_name, size=size,
+                                        chunkSize=chunk_size(), header=header.pack(),
+                                        dataKey=keys.wrap_data_key(SyncEncrypt().generateKey()))
+
+
+def _read(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        read = stream.read(size - len(data))
+        if not read:
+            break
+        data += read
+    return bytes(data)
+
+
+def write_chunk(session, index, stream):
+    """
+    Encrypts chunk ``index`` segment by segment as it is read from
+    ``stream`` into its own stored file. Sending a chunk again replaces it,
+    so a client that lost the acknowledgement can simply retry.
+
+    Every attempt is encrypted under a base nonce of its own: segment nonces
+    only depend on the segment index, so a resend with different bytes
+    under the session's nonce would reuse a nonce with the same key.
+    """
+    from Hub.models import UploadChunk, UploadSession
+
+    if session.document_id is not None:
+        raise ChunkRejected("The upload is already finalized", status=409)
+    if not 0 <= index < chunk_count(session):
+        raise ChunkRejected(f"Chunk {index} is out of range", status=404)
+
+    header = header_of(session).with_nonce()
+    key = keys.unwrap_data_key(session.dataKey)
+    length = chunk_length(session, index)
+    storage = document_storage()
+    name = storage.get_available_name(storage.generate_filename(f"uploads/{session.pk.hex}/{index:06d}.part"))
+    manifest = ManifestBuilder()
+    records = []
+    writer = storages.open_writer(storage, name)
+    try:
+        segment = index * (session.chunkSize // SEGMENT_SIZE)
+        received = 0
+        while received < length:
+            data = _read(stream, min(SEGMENT_SIZE, length - received))
+            if not data:
+                break
+            manifest.update(data)
+            record = Container.encrypt_segment(header, key, segment, segment == header.segment_count - 1, data)
+            writer.write(record)
+            records.append(len(record))
+            received += len(data)
+            segment += 1
+        if received != length or stream.read(1):
+            raise ChunkRejected(f"Chunk {index} must be {length} bytes")
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    try:
+        with transaction.atomic():
+            # Serialises against finalize and other copies of the same chunk
+            if UploadSession.objects.select_for_update().filter(pk=session.pk,
+                                                                document__isnull=False).exists():
+                raise ChunkRejected("The upload is already finalized", status=409)
+            chunk = UploadChunk.objects.filter(session=session, index=index).first()
+            if chunk is None:
+                chunk = UploadChunk.objects.create(session=session, index=index, storedName=name, records=records,
+                                                   manifest=manifest.manifest, nonce=header.base_nonce)
+            else:
+                replaced = chunk.storedName
+                chunk.storedName, chunk.records, chunk.manifest = name, records, manifest.manifest
+                chunk.nonce = header.base_nonce
+                chunk.save()
+                transaction.on_commit(lambda: storage.delete(replaced))
+    except IntegrityError:
+        storage.delete(name)
+        raise ChunkRejected(f"Chunk {index} is being uploaded concurrently", status=409) from None
+    except BaseException:
+        storage.delete(name)
+        raise
+    return chunk
+
+
+def status(session):
+    """What the server holds: the received chunks and the offset up to which the upload is contiguous."""
+    received = sorted(session.chunks.values_list('index', flat=True))
+    contiguous = 0
+    for expected, index in enumerate(received):
+        if index != expected:
+            break
+        contiguous += 1
+    return {
+        'id': str(session.pk),
+        'fileName': session.fileName,
+        'size': session.size,
+        'chunkSize': session.chunkSize,
+        'chunks': chunk_count(session),
+        'received': received,
+        'offset': min(contiguous * session.chunkSize, session.size),
+        'document': session.document_id,
+    }
+
+
+def missing(session, chunks=None):
+    """Indexes of the chunks not received yet."""
+    if chunks is None:
+        received = set(session.chunks.values_list('index', flat=True))
+    else:
+        received = {chunk.index for chunk in chunks}
+    return sorted(set(range(chunk_count(session))) - received)
+
+
+def finalize(session, progress=None):
+    """
+    Joins the chunks into one container, attaches it to the session's
+    shipment as a Documents row and returns it; finalizing again returns
+    the same document. ``progress(fraction)`` is called after every chunk.
+
+    Every record is decrypted once on the way, which both authenticates the
+    stored chunks and gives the plaintext SHA-256 the blob is addressed by,
+    and sealed again under the container's own fresh base nonce (each chunk
+    was encrypted under a nonce of its own, see write_chunk).
+    Takes time in proportion to the size, so requests queue it as a job
+    (see finalize_job).
+    """
+    from Hub.models import UploadSession
+
+    if session.document_id is not None:
+        return session.document
+    chunks = list(session.chunks.order_by('index'))
+    absent = missing(session, chunks)
+    if absent:
+        raise UploadIncomplete(absent)
+
+    header = header_of(session).with_nonce()
+    key = keys.unwrap_data_key(session.dataKey)
+    storage = document_storage()
+    stored_name = incoming_name(storage)
+    digest = hashlib.sha256()
+    offsets = []
+    writer = storages.open_writer(storage, stored_name)
+    try:
+        writer.write(header.pack())
+        position = Container.HEADER_SIZE
+        segment = 0
+        for chunk in chunks:
+            chunk_header = header.with_nonce(bytes(chunk.nonce))
+            with storage.open(chunk.storedName, 'rb') as part:
+                for size in chunk.records:
+                    final = segment == header.segment_count - 1
+                    plaintext, record = Container.reseal_segment(chunk_header, header, key, segment, final,
+                                                                 part.read(size))
+                    digest.update(plaintext)
+                    writer.write(record)
+                    offsets.append(position)
+                    position += size
+                    segment += 1
+            if progress is not None:
+                progress((chunk.index + 1) / len(chunks))
+        if header.indexed:
+            writer.write(struct.pack(f">{len(offsets)}Q", *offsets))
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    upload = EncryptedUploadedFile(session.fileName, stored_name, key, digest.hexdigest(),
+                                   ''.join(chunk.manifest for chunk in chunks), None, session.size, None, None)
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().select_related('document').get(pk=session.pk)
+        if locked.document_id is not None:
+            # Finalized concurrently
+            transaction.on_commit(upload.discard)
+            return locked.document
+        document = blobs.attach(locked.shipment, blobs.store(upload), locked.fileName)
+        keys.share_document(document)
+        locked.document = document
+        locked.save(update_fields=['document'])
+        _drop_chunks(storage, locked)
+    session.document = document
+    return document
+
+
+@jobs.task('uploads.finalize')
+def finalize_job(job, session):
+    from Hub.models import UploadSession
+
+    session = UploadSession.objects.select_related('document').filter(pk=session).first()
+    if session is None:
+        # Aborted meanwhile
+        return None
+    document = finalize(session, lambda done: jobs.report(job, done, f"Assembling {session.fileName}"))
+    return {'document': document.pk, 'url': document.get_download_url()}
+
+
+def _drop_chunks(storage, session):
+    from Hub.models import UploadChunk
+
+    names = list(UploadChunk.objects.filter(session=session).values_list('storedName', flat=True))
+    UploadChunk.objects.filter(session=session).delete()
+    transaction.on_commit(lambda: [storage.delete(name) for name in names])
+
+
+def abort(session):
+    """Deletes a session and every chunk it received."""
+    with transaction.atomic():
+        _drop_chunks(document_storage(), session)
+        session.delete()
+
+
+def expire(age):
+    """Aborts the sessions opened more than ``age`` (a timedelta) ago and never finalized; returns how many."""
+    from Hub.models import UploadSession
+
+    sessions = UploadSession.objects.filter(createdAt__lt=timezone.now() - age, document__isnull=True)
+    count = 0
+    for session in sessions:
+        abort(session)
+        count += 1
+    return count
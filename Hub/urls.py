@@ -1,6 +1,6 @@
 from django.urls import path
 
-from Hub import views
+from Hub import asyncviews, views
 
 app_name='hub'
 urlpatterns = [
@@ -12,6 +12,7 @@ urlpatterns = [
 
     path('shipper/home',views.ShipperDashboard.as_view(),name='ShipperDashboard'),
     path('shipper/makeShipment',views.NewShipment.as_view(),name='NewShipment'),
+    path('shipper/makeShipment/async',asyncviews.AsyncNewShipment.as_view(),name='NewShipmentAsync'),
     path('shipper/shipmentHistory',views.ShipmentHistory.as_view(),name='ShipmentHistory'),
     path('shipper/reports',views.ShipmentReports.as_view(),name='ShipperReports'),
     path('shipper/shipment/<int:pk>',views.ShipmentDetailView.as_view(),name="ShipperDetail"),
@@ -20,4 +21,19 @@ urlpatterns = [
     path('authority/listApprovals',views.AuthorityApproval.as_view(),name='AuthorityApprovals'),
     path('authority/request/<int:pk>',views.AuthorityRequestApproval.as_view(),name='AuthorityRequest'),
     path('authority/approve',views.AuthorityApproveRequest.as_view(),name='AuthorityApproved'),
+
+    path('shipments/search',views.ShipmentSearch.as_view(),name='ShipmentSearch'),
+    path('shipments/search/api',views.ShipmentSearchAPI.as_view(),name='ShipmentSearchAPI'),
+
+    path('uploads',views.UploadSessionCreate.as_view(),name='UploadSessions'),
+    path('uploads/<uuid:pk>',views.UploadSessionDetail.as_view(),name='UploadSession'),
+    path('uploads/<uuid:pk>/chunks/<int:index>',views.UploadSessionChunk.as_view(),name='UploadChunk'),
+    path('uploads/<uuid:pk>/finalize',views.UploadSessionFinalize.as_view(),name='UploadFinalize'),
+
+    path('jobs',views.JobList.as_view(),name='Jobs'),
+    path('jobs/<int:pk>',views.JobStatus.as_view(),name='Job'),
+
+    path('documents/<int:pk>',views.DocumentDownload.as_view(),name='DocumentDownload'),
+    path('documents/<int:pk>/encrypted',views.DocumentCiphertext.as_view(),name='DocumentCiphertext'),
+    path('documents/<int:pk>/async',asyncviews.AsyncDocumentDownload.as_view(),name='DocumentDownloadAsync'),
 ]
\ No newline at end of file
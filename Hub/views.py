@@ -1,25 +1,25 @@
-import string
-import random
-
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpRequest
+from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views import View
 from django.views.generic import CreateView, ListView, DetailView
 
-from Hub import models, forms
+from Hub import models, forms, downloads, blobs, jobs, projections, rollups, search, shipments, access, uploads
+from Hub.database import ReadOnlyViewMixin
+from Hub.paginators import KeysetPaginationMixin
+from Hub.uploadhandlers import EncryptingUploadMixin
+from UserManagement.models import UserGroups
+
 
+# Create your views here.
+class AuthorityRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
 
-def generate_unique_alphanumeric(length):
-    alphanumeric = string.ascii_letters + string.digits
-    while True:
-        generated_text = ''.join(random.choice(alphanumeric) for _ in range(length))
-        if generated_text not in models.Shipment.manager.all().filter(shipmentId=generated_text):
-            return generated_text
+    def test_func(self):
+        return self.request.user.role == UserGroups.authority
 
 
-# Create your views here.
 class Home(View):
     def get(self, request):
         return redirect(to=reverse_lazy('UserManagement:Login'))
@@ -43,88 +43,133 @@ class About(View):
 
 
 class ShipperDashboard(LoginRequiredMixin, View):
+    # Shipments listed under "Recent activity"
+    recent = 10
 
     def get(self, request: HttpRequest):
-        return render(request=request, template_name='hub/ShipperDashboard.html')
+        shipments = models.Shipment.manager.filter(shipper__shipperId=request.user)
+        return render(request=request, template_name='hub/ShipperDashboard.html', context={
+            'jobs': models.Job.objects.filter(owner=request.user).order_by('-pk')[:JobList.limit],
+            'status_counts': projections.status_counts(shipments),
+            'recent_states': projections.recent_states(shipments, self.recent),
+        })
 
 
-class ShipperListShipments(LoginRequiredMixin, ListView):
-    model = models.Shipper
+class ShipperListShipments(ReadOnlyViewMixin, LoginRequiredMixin, access.ShipmentPermissionsMixin,
+                           KeysetPaginationMixin, ListView):
+    model = models.Shipment
     context_object_name = 'shipmentList'
-    paginate_by = 25
     template_name = "hub/ShipperListShipment.html"
 
     def get_queryset(self):
-        return self.model.manager.all().filter(self.request.user.pk)
+        return self.model.manager.filter(shipper__shipperId=self.request.user)
 
 
 class LogisticsDashboard(LoginRequiredMixin, View):
 
     def get(self, request: HttpRequest):
-        return render(request=request, template_name='hub/LogisticsDashboard.html')
+        shipments = access.resolver.visible(request.user, models.Shipment.manager.all())
+        return render(request=request, template_name='hub/LogisticsDashboard.html',
+                      context={'status_counts': projections.status_counts(shipments)})
 
 
-class NewShipment(CreateView):
+class NewShipment(EncryptingUploadMixin, CreateView):
     model = models.Shipment
     form_class = forms.ShipmentForm
     template_name = "hub/NewShipment.html"
     success_url = reverse_lazy('hub:ShipmentHistory')
 
     def form_valid(self, form):
-        print(form.cleaned_data)
-        shipment = form.save()
-        shipment.shipmentId = generate_unique_alphanumeric(15)
-        shipment.save()
-        models.Shipper(shipperId=self.request.user, shipment=shipment).save()
-        models.Documents(Cargo_Doc=form.files['document'], shipmentId=shipment).save()
-        models.ShipmentAccess(userid=self.request.user, shipment=shipment,
-                              access=models.ShipmentAccess.AccessLevels.OWNER).save()
-        models.Ledger(userId=self.request.user,shipmentId=shipment,event=models.Ledger.Events.APPROVE_REQUEST).save()
+        upload = form.cleaned_data.get('document')
+        reused = None
+        if not upload and form.cleaned_data['documentDigest']:
+            reused = blobs.find_reusable(self.request.user, form.cleaned_data['documentDigest'])
+            if reused is None:
+                form.add_error('documentDigest', "No stored document matches this digest")
+                return self.form_invalid(form)
+
+        shipment = shipments.create(self.request.user, form.save(commit=False), upload=upload, reused=reused)
+        if not upload and reused is None:
+            # The document follows as a resumable upload for this shipment
+            return redirect(shipment)
         return redirect(to=self.success_url)
 
-    def form_invalid(self, form):
-        return super().form_invalid(form)
-
 
-class ShipmentHistory(ListView):
+class ShipmentHistory(ReadOnlyViewMixin, LoginRequiredMixin, access.ShipmentPermissionsMixin, KeysetPaginationMixin,
+                      ListView):
     model = models.Shipment
     template_name = "hub/ShipperListShipment.html"
+    page_count_estimate = True
 
+    def get_queryset(self):
+        return access.resolver.visible(self.request.user, self.model.manager.all())
 
-class ShipmentReports(ListView):
-    model = models.Shipment
-    template_name = "hub/ShipperReports.html"
 
+class ShipmentReports(ReadOnlyViewMixin, View):
+    # Longest period a report covers, in days
+    max_days = 366
 
-class ShipmentDetailView(DetailView):
+    def get(self, request: HttpRequest):
+        try:
+            days = min(max(int(request.GET.get('days', 30)), 1), self.max_days)
+        except ValueError:
+            days = 30
+        return render(request=request, template_name="hub/ShipperReports.html",
+                      context={'report': rollups.report(days), 'days': days})
+
+
+class ShipmentDetailView(ReadOnlyViewMixin, LoginRequiredMixin, DetailView):
     model = models.Shipment
     template_name = "hub/ShipperDetail.html"
     slug_field = "pk"
     slug_url_kwarg = "pk"
     context_object_name = "shipment"
 
+    def get_object(self, queryset=None):
+        shipment = super().get_object(queryset)
+        if not access.resolver.can(self.request.user, access.VIEW, shipment):
+            raise Http404()
+        return shipment
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        shipment = self.get_object()
+        shipment = self.object
         form = forms.ShipmentForm(instance=shipment)
         context['form'] = form
+        context['state'] = projections.state_of(shipment)
         return context
 
 
-class AuthorityDashboard(View):
+class AuthorityDashboard(AuthorityRequiredMixin, View):
 
     def get(self, request: HttpRequest):
-        return render(request=request, template_name='hub/AuthorityDashboard.html')
+        return render(request=request, template_name='hub/AuthorityDashboard.html',
+                      context={'status_counts': projections.status_counts()})
 
 
-class AuthorityApproval(ListView):
-    model = models.Shipment
+class AuthorityApproval(ReadOnlyViewMixin, AuthorityRequiredMixin, KeysetPaginationMixin, ListView):
+    model = models.PendingApproval
     template_name = "hub/AuthorityApproveRequests.html"
     context_object_name = 'request'
+    # Oldest requests first
+    page_ordering = ('pk',)
 
-    # def get_queryset(self):
-    #     qs = models.Ledger.manager.all().filter(userId=self.request.user)
-    #     return qs.filter(event=models.Ledger.Events.APPROVE_REQUEST)
+    def get_queryset(self):
+        queryset = self.model.objects.select_related('shipment')
+        self.filter_form = forms.PendingApprovalFilter(self.request.GET)
+        if self.filter_form.is_valid():
+            queryset = queryset.filter(**{field: value for field, value in self.filter_form.cleaned_data.items()
+                                          if value})
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.filter_form
+        # Page links keep the filters
+        query = self.request.GET.copy()
+        query.pop(self.cursor_kwarg, None)
+        context['filter_query'] = query.urlencode()
+        return context
 
 
 class AuthorityRequestApproval(DetailView):
@@ -136,16 +181,154 @@ class AuthorityRequestApproval(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        shipment = self.get_object()
+        shipment = self.object
         form = forms.ShipmentApprove(instance=shipment)
         context['form'] = form
         context['shipmentId'] = shipment.shipmentId
+        context['documents'] = shipment.documents_set.all()
         return context
 
 
-class AuthorityApproveRequest(View):
+class AuthorityApproveRequest(AuthorityRequiredMixin, View):
     def post(self,request: HttpRequest):
-        shipmentId = request.POST['shipmentId']
-        # models.Ledger(userId=self.request.user,shipmentId=shipmentId,event=models.Ledger.Events.APPROVED).save()
-        return redirect(to=reverse_lazy('hub:AuthorityDashboard'))
+        # One shipmentId from the request page, or every one ticked on the approvals list
+        shipmentIds = request.POST.getlist('shipmentId')
+        approved = shipments.approve(request.user,
+                                     models.Shipment.manager.filter(shipmentId__in=shipmentIds).values('pk'))
+        messages.success(request, f"{len(approved)} shipment(s) approved")
+        return redirect(to=reverse_lazy('hub:AuthorityApprovals'))
+
+
+class ShipmentSearch(ReadOnlyViewMixin, LoginRequiredMixin, View):
+    """Best matches for ``?q=`` among the shipments the user can see."""
+    template_name = "hub/ShipperListShipment.html"
+    limit = 25
+
+    def results(self, request, limit, offset=0):
+        queryset = access.resolver.visible(request.user, models.Shipment.manager.all())
+        return search.search(request.GET.get('q', ''), queryset, limit=limit, offset=offset)
+
+    def get(self, request: HttpRequest):
+        shipmentList = access.resolver.resolve(request.user, self.results(request, self.limit))
+        return render(request=request, template_name=self.template_name,
+                      context={'object_list': shipmentList, 'query': request.GET.get('q', '')})
+
+
+class ShipmentSearchAPI(ShipmentSearch):
+    max_limit = 100
+
+    def get(self, request: HttpRequest):
+        try:
+            limit = min(max(int(request.GET.get('limit', self.limit)), 1), self.max_limit)
+            offset = max(int(request.GET.get('offset', 0)), 0)
+        except ValueError:
+            return JsonResponse({'error': "limit and offset must be integers"}, status=400)
+        fields = search.COLUMNS + ('Cargo_Type',)
+        results = [{'pk': shipment.pk, 'url': shipment.get_absolute_url(),
+                    **{field: getattr(shipment, field) for field in fields}}
+                   for shipment in self.results(request, limit, offset)]
+        return JsonResponse({'query': request.GET.get('q', ''), 'limit': limit, 'offset': offset,
+                             'results': results})
+
+
+class UploadSessionMixin(LoginRequiredMixin):
+    """Resumable document uploads, see Hub.uploads."""
+
+    def get_session(self, request, pk):
+        try:
+            return models.UploadSession.objects.get(pk=pk, owner=request.user)
+        except models.UploadSession.DoesNotExist:
+            raise Http404()
+
+    @staticmethod
+    def session_response(session, status=200):
+        return JsonResponse({**uploads.status(session), 'url': reverse('hub:UploadSession', args=[session.pk])},
+                            status=status)
+
+
+class UploadSessionCreate(UploadSessionMixin, View):
+
+    def post(self, request: HttpRequest):
+        form = forms.UploadSessionForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        shipment = models.Shipment.manager.filter(pk=form.cleaned_data['shipment']).first()
+        if shipment is None or not access.resolver.can(request.user, access.EDIT, shipment):
+            raise Http404()
+        session = uploads.create(request.user, shipment, form.cleaned_data['fileName'], form.cleaned_data['size'])
+        return self.session_response(session, status=201)
+
+
+class UploadSessionDetail(UploadSessionMixin, View):
+
+    def get(self, request: HttpRequest, pk):
+        return self.session_response(self.get_session(request, pk))
+
+    def delete(self, request: HttpRequest, pk):
+        uploads.abort(self.get_session(request, pk))
+        return HttpResponse(status=204)
+
+
+class UploadSessionChunk(UploadSessionMixin, View):
+
+    def put(self, request: HttpRequest, pk, index):
+        session = self.get_session(request, pk)
+        try:
+            # Streamed from the request, one segment in memory at a time
+            uploads.write_chunk(session, index, request)
+        except uploads.ChunkRejected as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+        return self.session_response(session)
+
+
+class UploadSessionFinalize(UploadSessionMixin, View):
+    """Queues the assembly (see uploads.finalize) and answers with the job to poll."""
+
+    def post(self, request: HttpRequest, pk):
+        session = self.get_session(request, pk)
+        if session.document_id is not None:
+            return JsonResponse({'document': session.document_id,
+                                 'url': reverse('hub:DocumentDownload', args=[session.document_id])})
+        missing = uploads.missing(session)
+        if missing:
+            return JsonResponse({'error': str(uploads.UploadIncomplete(missing)), 'missing': missing}, status=409)
+
+        job = models.Job.objects.filter(kind='uploads.finalize', payload__session=str(session.pk),
+                                        status__in=[models.Job.Statuses.QUEUED, models.Job.Statuses.RUNNING]).first()
+        if job is None:
+            job = jobs.enqueue('uploads.finalize', {'session': str(session.pk)}, owner=request.user,
+                               priority=jobs.HIGH)
+        return JsonResponse({'job': job.pk, 'url': reverse('hub:Job', args=[job.pk])}, status=202)
+
+
+class JobList(ReadOnlyViewMixin, LoginRequiredMixin, View):
+    """The user's latest jobs, polled by the dashboard."""
+    limit = 20
+
+    def get(self, request: HttpRequest):
+        return JsonResponse({'jobs': [jobs.status(job) for job in
+                                      models.Job.objects.filter(owner=request.user).order_by('-pk')[:self.limit]]})
+
+
+class JobStatus(ReadOnlyViewMixin, LoginRequiredMixin, View):
+
+    def get(self, request: HttpRequest, pk):
+        job = models.Job.objects.filter(pk=pk, owner=request.user).first()
+        if job is None:
+            raise Http404()
+        return JsonResponse(jobs.status(job))
+
+
+class DocumentDownload(LoginRequiredMixin, View):
+
+    def get(self, request: HttpRequest, pk):
+        document = downloads.get_readable_document(request.user, pk)
+        reader = downloads.DocumentReader(document)
+        return downloads.range_response(reader, request.headers.get('Range'), reader.iter_range)
+
+
+class DocumentCiphertext(LoginRequiredMixin, View):
+    """The encrypted document for clients holding a wrapped key, see downloads.ciphertext_response."""
 
+    def get(self, request: HttpRequest, pk):
+        return downloads.ciphertext_response(downloads.get_readable_document(request.user, pk), request.user)
@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RemoteSecureFileStorage.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from Hub.asyncviews import BodyInMemoryASGIHandler  # noqa: E402 - needs the apps loaded
+
+# Like get_asgi_application(), but plaintext uploads are refused rather than spooled to disk
+application = BodyInMemoryASGIHandler()
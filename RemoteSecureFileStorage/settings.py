@@ -84,7 +84,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Connections are kept between requests, checked before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # The same file opened read only, for the views that only read (see Hub.database.ReadWriteRouter)
+    'read': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['Hub.database.ReadWriteRouter']
+
+# Alias read-only views query, remove it from DATABASES to read from 'default' everywhere
+READ_DATABASE = 'read'
+
+# Pragmas set on every SQLite connection, see Hub.database.PRAGMAS for what each one buys. Set journal_mode
+# to 'delete' and synchronous to 'full' for the rollback journal SQLite uses by default
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -32000,
+    'temp_store': 'memory',
+    'mmap_size': 256 * 1024 * 1024,
 }
 
 # Password validation
@@ -141,6 +168,21 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'RemoteSecureFileStorage/media')
 
 MEDIA_URL = '/Media/'
 
+# Uploaded files are stored behind hash-named shard directories. Local files can be spread over more disks
+# with MEDIA_EXTRA_ROOTS (fixed once files exist); for storage shared between hosts set the default BACKEND to
+# 'Hub.storage.S3Storage' (needs boto3) and set S3_STORAGE, e.g.
+# S3_STORAGE = {'bucket': 'documents', 'endpoint_url': 'https://s3.example.com', 'region_name': 'ap-south-1',
+#               'access_key': ..., 'secret_key': ..., 'part_size': 8 * 1024 * 1024, 'max_concurrency': 8}
+STORAGES = {
+    'default': {
+        'BACKEND': 'Hub.storage.ShardedFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+MEDIA_EXTRA_ROOTS = []
+
 STATICFILES_DIRS = [
     # BASE_DIR / 'RemoteSecureFileStorage'
 ]
@@ -155,4 +197,68 @@ FILE_UPLOAD_HANDLERS = [
     'django.core.files.uploadhandler.TemporaryFileUploadHandler',
 ]
 
+# Threads used to encrypt the segments of a single upload (shipment documents are encrypted as they are
+# received, see Hub.uploadhandlers.EncryptingUploadMixin)
+DOCUMENT_ENCRYPTION_WORKERS = 1
+
+# Plaintext bytes per chunk of a resumable upload (a multiple of the 256 KiB container segment); sessions
+# never finalized are removed by the expireuploads command
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Threads shared by the async (ASGI) views for decryption and blocking file reads, defaults to the CPU count
+ASYNC_CRYPTO_WORKERS = None
+
+# Background jobs (Hub.jobs, run by the runjobs command): attempts per job, seconds before the first retry
+# (doubling after each failure) and seconds a running job may go without a heartbeat before it is queued again
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 5
+JOB_LEASE = 300
+
+# Encrypted documents downloaded as they are stored (for clients that decrypt them) are sent by the front-end
+# server with DOCUMENT_OFFLOAD = 'x-accel-redirect' (nginx, with an internal location for DOCUMENT_OFFLOAD_PREFIX:
+# ``location /protected/ { internal; alias /; }``) or 'x-sendfile' (Apache, lighttpd); None has the WSGI server
+# sendfile() them
+DOCUMENT_OFFLOAD = None
+DOCUMENT_OFFLOAD_PREFIX = '/protected'
+
+# Record buffers kept for reuse by the decrypting downloads, 256 KiB each
+DOWNLOAD_BUFFER_POOL_SIZE = 64
+
+# Document keys are stored wrapped under a key derived from this. Required when DEBUG is off (SECRET_KEY is
+# used while it is on); changing it leaves the documents already stored unreadable
+DOCUMENT_MASTER_KEY = os.environ.get('DOCUMENT_MASTER_KEY')
+
+# Cipher new documents are encrypted with: 'eax', 'aesgcm' or 'auto' for the fastest one available.
+# Existing files record their cipher in the header and stay readable whatever this is set to.
+CRYPTO_BACKEND = 'auto'
+
+# Compression applied to each segment before encryption: 'none', 'zlib', 'lzma' or 'zstd' (needs zstandard).
+# Segments that do not compress (scans, zipped files) are stored as they are.
+DOCUMENT_COMPRESSION = 'zlib'
+
+# Ledger events from concurrent requests are committed together: a batch holds up to
+# LEDGER_GROUP_COMMIT_SIZE events and waits at most LEDGER_GROUP_COMMIT_DELAY seconds for more
+LEDGER_GROUP_COMMIT = True
+LEDGER_GROUP_COMMIT_SIZE = 1000
+LEDGER_GROUP_COMMIT_DELAY = 0.002
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by every process on this host; use memcached or redis when the site runs on several
+    'access': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'RemoteSecureFileStorage/cache/access'),
+    },
+}
+
+# Each user's shipment access is cached for ACCESS_CACHE_TIMEOUT seconds in the cache ACCESS_CACHE_ALIAS
+# and for the ACCESS_CACHE_LOCAL_SIZE most recent users in every process. ACCESS_CACHE_ALIAS must be shared
+# between processes, or a revocation would go unseen by the others: with a process-local cache (locmem,
+# dummy) access is read from the database on every call instead
+ACCESS_CACHE_ALIAS = 'access'
+ACCESS_CACHE_TIMEOUT = 300
+ACCESS_CACHE_LOCAL_SIZE = 1024
+
 LOGIN_URL = reverse_lazy('UserManagement:Login')
@@ -1,12 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from UserManagement.forms import CustomUserChangeForm
 from UserManagement.models import CustomUser
 
 
 # Register your models here.
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
+    form = CustomUserChangeForm
     readonly_fields = [
         'date_joined',
     ]
@@ -15,7 +17,7 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('country', 'role', 'is_active',)
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
-        ('Personal Info', {'fields': ('name', 'country', 'phone_no')}),
+        ('Personal Info', {'fields': ('name', 'country', 'phone_no', 'pubKey')}),
         ('Permissions', {'fields': ('role', 'is_active', 'is_staff', 'is_superuser')}),
         ('Important Dates', {'fields': ('last_login', 'date_joined')}),
     )
@@ -1,9 +1,13 @@
+from Crypto.PublicKey import RSA
 from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm, UserChangeForm
 
 from UserManagement import models
 
+# Smallest RSA public key accepted for wrapping document keys
+MIN_PUBLIC_KEY_BITS = 2048
+
 
 class NewUser(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput())
@@ -38,4 +42,18 @@ class CustomUserChangeForm(UserChangeForm):
 
     class Meta:
         model = get_user_model()
-        fields = ('name', 'email', 'country', 'phone_no', 'port')
+        fields = ('name', 'email', 'country', 'phone_no', 'port', 'pubKey')
+
+    def clean_pubKey(self):
+        pem = (self.cleaned_data.get('pubKey') or '').strip()
+        if not pem:
+            return None
+        try:
+            key = RSA.importKey(pem)
+        except ValueError:
+            raise forms.ValidationError("Enter an RSA public key in PEM format")
+        if key.has_private():
+            raise forms.ValidationError("Enter the public key only, the private key must stay with you")
+        if key.size_in_bits() < MIN_PUBLIC_KEY_BITS:
+            raise forms.ValidationError(f"The key must be at least {MIN_PUBLIC_KEY_BITS} bits long")
+        return pem
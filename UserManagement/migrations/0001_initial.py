@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomUser',
+            fields=[
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='Email')),
+                ('name', models.CharField(blank=True, max_length=254, null=True, verbose_name='Name')),
+                ('country', models.CharField(max_length=25, verbose_name='Country')),
+                ('phone_no', models.CharField(max_length=12, verbose_name='Phone:')),
+                ('role', models.PositiveSmallIntegerField(choices=[(1, 'Authority'), (2, 'Logistics'), (3, 'Shipper')], default=3, verbose_name='Role')),
+                ('port', models.CharField(max_length=40, null=True, verbose_name='Port')),
+                ('pubKey', models.TextField(blank=True, null=True, verbose_name='Public Key')),
+                ('is_staff', models.BooleanField(default=False)),
+                ('is_superuser', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('date_joined', models.DateTimeField(auto_now_add=True)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
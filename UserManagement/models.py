@@ -67,6 +67,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     phone_no = models.CharField(verbose_name="Phone:", max_length=12, null=False, )
     role = models.PositiveSmallIntegerField(verbose_name="Role", choices=UserGroups.ROLES, default=UserGroups.shipper)
     port = models.CharField(verbose_name="Port",max_length=40,null=True)
+    pubKey = models.TextField(verbose_name="Public Key",null=True,blank=True)
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
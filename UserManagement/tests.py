@@ -1,3 +1,41 @@
+from Crypto.PublicKey import RSA
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from UserManagement import forms
+
+
+class PublicKeyTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = RSA.generate(forms.MIN_PUBLIC_KEY_BITS)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='shipper@example.com', password='secret',
+                                                         country='IN', phone_no='1')
+
+    def form(self, pub_key):
+        return forms.CustomUserChangeForm({'name': 'Shipper', 'email': 'shipper@example.com', 'country': 'IN',
+                                           'phone_no': '1', 'port': 'Chennai', 'role': '3', 'pubKey': pub_key},
+                                          instance=self.user)
+
+    def test_rsa_public_key_is_accepted(self):
+        pem = self.private_key.publickey().export_key().decode()
+        form = self.form(pem + '\n')
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['pubKey'], pem)
+        self.assertTrue(self.form('').is_valid())
+
+    def test_unusable_keys_are_refused(self):
+        for pem in ('not a key', self.private_key.export_key().decode(),
+                    RSA.generate(1024).publickey().export_key().decode()):
+            form = self.form(pem)
+            self.assertFalse(form.is_valid())
+            self.assertIn('pubKey', form.errors)
+
+    def test_admin_validates_the_key(self):
+        self.assertTrue(issubclass(admin.site._registry[get_user_model()].form, forms.CustomUserChangeForm))